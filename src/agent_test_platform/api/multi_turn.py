@@ -4,6 +4,7 @@ from typing import Dict, List, Any
 import asyncio
 from agent_test_platform.config.logger import logger
 from agent_test_platform.config.node_strategy import NodeStrategy
+from agent_test_platform.core.expressions import ExpressionError
 import time
 
 router = APIRouter(prefix="/api", tags=["multi-turn"])
@@ -73,6 +74,8 @@ async def update_node_config(
             "message": "Node configuration updated successfully",
         }
     
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to update node config: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,17 @@
 
-from fastapi import APIRouter, HTTPException, WebSocket, Path, Query
+import hmac
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Path, Query
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from sqlalchemy.orm import selectinload
 from agent_test_platform.api.schemas import *
 from agent_test_platform.models.node_based import Scenario, TestRun, UserExecution, TestSummary, RunStatus
 from agent_test_platform.config.logger import logger
-import asyncio
+from agent_test_platform.config.settings import settings
+from agent_test_platform.core.load_model import LoadModel, ArrivalConfig
+from agent_test_platform.core.scheduling import RampUp, ThinkTime
+from agent_test_platform.core.metrics import MetricsRegistry
+from agent_test_platform.core.run_registry import RunAlreadyActiveError
 
 from agent_test_platform.services.node_config_service import NodeConfigService
 from agent_test_platform.services.scenario_service import ScenarioService
@@ -53,6 +58,72 @@ async def list_test_runs() -> List[Dict]:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/runs/active")
+async def list_active_runs() -> List[Dict]:
+    """本进程中正在运行的测试及其实时指标（状态、用户启动、请求量与延迟）"""
+    try:
+        return orchestrator.list_active_runs() if orchestrator else []
+    except Exception as e:
+        logger.error(f"Failed to list active runs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/quota")
+async def get_quota() -> Dict:
+    """平台级在途请求预算的使用情况（各运行的权重 / 优先级 / 在途数 / 排队等待）"""
+    try:
+        return orchestrator.quota.stats() if orchestrator else {}
+    except Exception as e:
+        logger.error(f"Failed to get quota stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/workers")
+async def list_remote_workers() -> Dict:
+    """已注册的远程 worker（空闲 / 正在执行的运行 / 已完成分片数）"""
+    try:
+        return orchestrator.worker_pool.stats() if orchestrator else {}
+    except Exception as e:
+        logger.error(f"Failed to list remote workers: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/ws/stats")
+async def get_ws_stats() -> Dict:
+    """WebSocket 推送统计（各连接发送队列积压 / 已发送 / 丢弃 / 合并，事件总线吞吐）"""
+    try:
+        stats = ws_manager.stats() if ws_manager else {}
+        if orchestrator and orchestrator.event_bus is not None:
+            stats["eventBus"] = orchestrator.event_bus.stats()
+        return stats
+    except Exception as e:
+        logger.error(f"Failed to get WebSocket stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.websocket("/workers/ws")
+async def remote_worker_channel(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """远程 worker 注册 / 分片下发 / 指标回传通道（见 core.cluster）"""
+    if settings.WORKER_TOKEN and not hmac.compare_digest(token or "", settings.WORKER_TOKEN):
+        await websocket.close(code=1008, reason="Invalid worker token")
+        return
+    if not orchestrator:
+        await websocket.close(code=1000, reason="Orchestrator not initialized")
+        return
+
+    if not settings.WORKER_TOKEN:
+        # 分片下发完整场景（含节点请求头 / 请求体），未配置令牌时任何客户端都能注册领取
+        logger.warning("Remote worker connecting without WORKER_TOKEN; set it to restrict who receives scenario specs")
+
+    await websocket.accept()
+    try:
+        await orchestrator.worker_pool.serve(websocket)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Remote worker channel error: {e}")
+
+
 @router.get("/runs/{runId}")
 async def get_test_run(runId: str = Path(...)) -> Dict:
     """获取单个测试运行"""
@@ -73,6 +144,10 @@ async def get_test_run(runId: str = Path(...)) -> Dict:
             "startTime": test_run.start_time ,
             "endTime": test_run.end_time  if test_run.end_time else None,
             "createdAt": test_run.created_at ,
+            # 运行中时返回用户启动速率 / 积压等实时指标
+            "spawner": orchestrator.get_spawner_metrics(runId) if orchestrator else None,
+            # 运行控制状态（暂停时长 / 在途用户数）
+            "control": _run_control(runId),
         }
     except HTTPException:
         raise
@@ -89,6 +164,45 @@ async def create_test_run(payload: Dict) -> Dict:
         name = payload.get("name")
         user_count = payload.get("userCount")
         
+        # 负载模型：closed（默认）或 open（按 arrival 配置的到达率启动用户）
+        # 爬坡 rampUp: {duration, shape, factor}；默认思考时间 thinkTime: 见 ThinkTime
+        # maxParallelNodes: 单个用户内并发执行互不依赖分支的上限（缺省串行）
+        # weight / priority: 在平台级请求预算（GLOBAL_MAX_IN_FLIGHT）中的权重与优先级
+        # concurrency: closed 模型的并发用户数；workers: 分片到的本机 worker 进程数（缺省 LOAD_WORKERS）
+        # remoteWorkers: 分片到的已注册远程 worker 数（优先于 workers）
+        run_config = {
+            "load_model": payload.get("loadModel", LoadModel.CLOSED),
+            "arrival": payload.get("arrival"),
+            "ramp_up": payload.get("rampUp"),
+            "think_time": payload.get("thinkTime"),
+            "max_parallel_nodes": payload.get("maxParallelNodes"),
+            "weight": payload.get("weight"),
+            "priority": payload.get("priority"),
+            "concurrency": payload.get("concurrency"),
+            "workers": payload.get("workers"),
+            "remote_workers": payload.get("remoteWorkers"),
+        }
+        try:
+            if run_config["load_model"] == LoadModel.OPEN:
+                ArrivalConfig.from_dict(run_config["arrival"])
+            ramp_up = run_config["ramp_up"] or {}
+            RampUp.from_config(ramp_up.get("duration"), ramp_up.get("shape"), ramp_up.get("factor"))
+            ThinkTime.from_config(run_config["think_time"])
+            if run_config["max_parallel_nodes"] is not None and int(run_config["max_parallel_nodes"]) < 1:
+                raise ValueError("maxParallelNodes must be >= 1")
+            if run_config["weight"] is not None and float(run_config["weight"]) <= 0:
+                raise ValueError("weight must be > 0")
+            if run_config["priority"] is not None:
+                int(run_config["priority"])
+            if run_config["concurrency"] is not None and int(run_config["concurrency"]) < 1:
+                raise ValueError("concurrency must be >= 1")
+            if run_config["workers"] is not None and int(run_config["workers"]) < 0:
+                raise ValueError("workers must be >= 0")
+            if run_config["remote_workers"] is not None and int(run_config["remote_workers"]) < 0:
+                raise ValueError("remoteWorkers must be >= 0")
+        except (TypeError, ValueError, AttributeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid load config: {e}")
+        
         # 获取场景
         scenario = await db.get(Scenario, scenario_id)
         if not scenario:
@@ -105,6 +219,7 @@ async def create_test_run(payload: Dict) -> Dict:
             current_users=0,
             start_time=datetime.utcnow(),
             created_at=datetime.utcnow(),
+            config=run_config,
         )
         
         test_run = await db.create(test_run)
@@ -134,13 +249,23 @@ async def start_test_run(runId: str = Path(...)) -> Dict:
         if not test_run:
             raise HTTPException(status_code=404, detail="Test run not found")
         
+        if orchestrator.get_run_controller(runId) is not None:
+            raise HTTPException(status_code=409, detail="Test run already active")
+        
+        remote_workers = int((test_run.config or {}).get("remote_workers") or 0)
+        if remote_workers and not orchestrator.worker_pool.idle():
+            raise HTTPException(status_code=409, detail="No idle remote workers registered")
+        
         # 更新状态
         test_run.status = RunStatus.RUNNING
         test_run.start_time = datetime.utcnow()
         await db.update(test_run)
         
-        # 启动编排器
-        asyncio.create_task(orchestrator._run_users(runId, test_run.scenario_id))
+        # 启动编排器（每个运行有独立的运行上下文）
+        try:
+            orchestrator.launch(runId, test_run.scenario_id)
+        except RunAlreadyActiveError as e:
+            raise HTTPException(status_code=409, detail=str(e))
         
         return {"status": "started"}
     except HTTPException:
@@ -152,15 +277,21 @@ async def start_test_run(runId: str = Path(...)) -> Dict:
 
 @router.post("/runs/{runId}/stop")
 async def stop_test_run(runId: str = Path(...)) -> Dict:
-    """停止测试"""
+    """停止测试：取消所有在途用户（在途请求最多等待 RUN_CANCEL_DRAIN_SECONDS 秒）"""
     try:
         test_run = await db.get(TestRun, runId)
         if not test_run:
             raise HTTPException(status_code=404, detail="Test run not found")
         
-        test_run.status = RunStatus.FAILED
-        test_run.end_time = datetime.utcnow()
-        await db.update(test_run)
+        if orchestrator and await orchestrator.cancel_run(runId, "Stopped by user"):
+            await _send_run_status(runId, "cancelled")
+            return {"status": "stopped", "control": _run_control(runId)}
+        
+        # 不在本进程中运行（如服务重启后遗留的 running 记录）：只更新状态
+        if test_run.status in (RunStatus.PENDING, RunStatus.RUNNING, RunStatus.PAUSED):
+            test_run.status = RunStatus.CANCELLED
+            test_run.end_time = datetime.utcnow()
+            await db.update(test_run)
         
         return {"status": "stopped"}
     except HTTPException:
@@ -170,6 +301,56 @@ async def stop_test_run(runId: str = Path(...)) -> Dict:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/runs/{runId}/pause")
+async def pause_test_run(runId: str = Path(...)) -> Dict:
+    """暂停测试：不再启动新用户，已启动的用户在下一个节点前挂起（在途请求照常完成）"""
+    try:
+        test_run = await db.get(TestRun, runId)
+        if not test_run:
+            raise HTTPException(status_code=404, detail="Test run not found")
+        
+        if not (orchestrator and await orchestrator.pause_run(runId)):
+            raise HTTPException(status_code=409, detail=f"Test run cannot be paused (status: {test_run.status.value})")
+        
+        await _send_run_status(runId, "paused")
+        return {"status": "paused", "control": _run_control(runId)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to pause test run: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/runs/{runId}/resume")
+async def resume_test_run(runId: str = Path(...)) -> Dict:
+    """恢复已暂停的测试"""
+    try:
+        test_run = await db.get(TestRun, runId)
+        if not test_run:
+            raise HTTPException(status_code=404, detail="Test run not found")
+        
+        if not (orchestrator and await orchestrator.resume_run(runId)):
+            raise HTTPException(status_code=409, detail=f"Test run cannot be resumed (status: {test_run.status.value})")
+        
+        await _send_run_status(runId, "running")
+        return {"status": "running", "control": _run_control(runId)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to resume test run: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _run_control(run_id: str) -> Optional[Dict[str, Any]]:
+    controller = orchestrator.get_run_controller(run_id) if orchestrator else None
+    return controller.to_dict() if controller else None
+
+
+async def _send_run_status(run_id: str, status: str):
+    if ws_manager:
+        await ws_manager.send_run_status(run_id, status, _run_control(run_id))
+
+
 # ============================================================
 # 2. 场景 API
 # ============================================================
@@ -608,6 +789,7 @@ async def list_user_executions(runId: str = Path(...)) -> List[Dict]:
                         "startTime": node_exec.start_time  if node_exec.start_time else None,
                         "endTime": node_exec.end_time  if node_exec.end_time else None,
                         "error": node_exec.error_message,
+                        "timing": node_exec.timing,
                         "request": {
                             "method": "POST",  # TODO: 从配置获取
                             "url": "/api/chat",  # TODO: 从配置获取
@@ -674,6 +856,7 @@ async def get_user_execution(
                     "startTime": node_exec.start_time  if node_exec.start_time else None,
                     "endTime": node_exec.end_time  if node_exec.end_time else None,
                     "error": node_exec.error_message,
+                    "timing": node_exec.timing,
                 }
                 for node_exec in user_exec.node_executions
             },
@@ -693,12 +876,15 @@ async def get_user_execution(
 
 @router.get("/runs/{runId}/summary")
 async def get_test_summary(runId: str = Path(...)) -> Dict:
-    """获取测试结果摘要"""
+    """获取测试结果摘要（运行中时先按在线统计刷新）"""
     try:
         test_run = await db.get(TestRun, runId)
         if not test_run:
             raise HTTPException(status_code=404, detail="Test run not found")
         
+        if orchestrator and orchestrator.metrics.get(runId):
+            await orchestrator.metrics.materialize(runId)
+        
         # 查询汇总数据
         summaries = await db.query_by_field(TestSummary, "test_run_id", runId)
         summary = summaries[0] if summaries else None
@@ -720,6 +906,7 @@ async def get_test_summary(runId: str = Path(...)) -> Dict:
             "p99ResponseTime": summary.p99_response_time,
             "failedNodes": summary.failed_nodes or [],
             "nodeStats": summary.node_stats or [],
+            "endpointStats": summary.endpoint_stats or [],
         }
     except HTTPException:
         raise
@@ -728,22 +915,77 @@ async def get_test_summary(runId: str = Path(...)) -> Dict:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/runs/{runId}/timeseries")
+async def get_test_timeseries(
+    runId: str = Path(...),
+    start: Optional[int] = Query(None, ge=0),
+    end: Optional[int] = Query(None, ge=0),
+    step: Optional[int] = Query(None, ge=1),
+    nodeId: Optional[str] = Query(None),
+    maxPoints: Optional[int] = Query(None, ge=1, le=5000),
+) -> Dict:
+    """获取按时间窗口聚合的吞吐、错误率与延迟分位数（start / end 为 Unix 秒）"""
+    try:
+        if start is not None and end is not None and end < start:
+            raise HTTPException(status_code=400, detail="end must be >= start")
+        
+        registry = orchestrator.metrics if orchestrator else MetricsRegistry(db)
+        result = await registry.query_timeseries(
+            runId,
+            start=start,
+            end=end,
+            step=step,
+            node_id=nodeId,
+            max_points=maxPoints,
+        )
+        if not result["points"] and not registry.get(runId) and not await db.get(TestRun, runId):
+            raise HTTPException(status_code=404, detail="Test run not found")
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get test timeseries: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================================
 # 5. WebSocket 实时进度推送
 # ============================================================
 
+async def _run_snapshot(run_id: str) -> Dict:
+    """WebSocket 连接时下发的运行当前状态：运行记录 + 运行中的实时指标（按节点计数 / 分位数）"""
+    test_run = await db.get(TestRun, run_id) if db else None
+    context = orchestrator.runs.get(run_id) if orchestrator else None
+    return {
+        "run": {
+            "status": test_run.status.value,
+            "progress": test_run.progress,
+            "totalUsers": test_run.total_users,
+            "currentUsers": test_run.current_users,
+            "startTime": test_run.start_time.isoformat() if test_run.start_time else None,
+            "endTime": test_run.end_time.isoformat() if test_run.end_time else None,
+        } if test_run else None,
+        "live": context.snapshot() if context else None,
+    }
+
+
 @router.websocket("/runs/{runId}/ws")
 async def websocket_progress(
     websocket: WebSocket,
     runId: str = Path(...),
+    since: Optional[int] = Query(None),
 ):
-    """WebSocket 实时进度推送"""
+    """WebSocket 实时进度推送
+
+    连接后先收到 run_snapshot（当前状态 + 最近事件，seq 为快照对应的事件序号）；
+    断线重连时带上最后收到的 seq（?since=），缓冲仍覆盖时只补发之后的事件。
+    """
     
     if not ws_manager:
         await websocket.close(code=1000, reason="Manager not initialized")
         return
     
-    await ws_manager.connect(websocket, runId)
+    await ws_manager.connect(websocket, runId, since=since, snapshot=lambda: _run_snapshot(runId))
     
     try:
         while True:
@@ -754,5 +996,5 @@ async def websocket_progress(
         logger.error(f"WebSocket error: {e}")
     
     finally:
-        ws_manager.disconnect(runId)
+        ws_manager.disconnect(runId, websocket)
 
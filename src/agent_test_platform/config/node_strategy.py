@@ -2,6 +2,7 @@
 from dataclasses import dataclass
 from typing import Optional, Dict, Any, Callable, List
 import json
+from agent_test_platform.core.expressions import Expression
 
 
 @dataclass
@@ -16,7 +17,7 @@ class ExitCondition:
     task_regex_pattern: str = None          # 正则匹配任务
     
     # 自定义判断函数（灵活性）
-    custom_check_func: Optional[str] = None # Python 代码字符串
+    custom_check_func: Optional[str] = None # 条件表达式（变量 response / turns / elapsed_time）
 
 
 @dataclass
@@ -54,7 +55,7 @@ class TaskDetectionStrategy:
     ai_prompt: str = "检查以下文本是否表示任务已生成"
     
     # 自定义检测函数
-    custom_check_code: Optional[str] = None # Python 代码字符串
+    custom_check_code: Optional[str] = None # 条件表达式（变量 response）
 
 
 class NodeStrategy:
@@ -98,6 +99,16 @@ class NodeStrategy:
             ai_prompt=task_config.get("ai_prompt", "检查是否生成了任务"),
             custom_check_code=task_config.get("custom_check_code"),
         )
+        
+        # 自定义检查在加载时编译为受限表达式，语法错误立即抛 ExpressionError
+        self.custom_check = self._compile(self.exit_condition.custom_check_func, ("response", "turns", "elapsed_time"))
+        self.task_check = self._compile(self.task_detection.custom_check_code, ("response",))
+    
+    @staticmethod
+    def _compile(source: Optional[str], names) -> Optional[Expression]:
+        if not source or not source.strip():
+            return None
+        return Expression.compile(source, names)
     
     def should_continue_dialog(self, turns: int, elapsed_time: float, last_response: Dict) -> bool:
         """判断是否继续对话"""
@@ -115,14 +126,13 @@ class NodeStrategy:
             return False
         
         # 自定义检查函数
-        if self.exit_condition.custom_check_func:
+        if self.custom_check:
             try:
-                result = eval(self.exit_condition.custom_check_func, {
+                return self.custom_check.test({
                     "response": last_response,
                     "turns": turns,
                     "elapsed_time": elapsed_time,
                 })
-                return bool(result)
             except Exception as e:
                 print(f"Error evaluating custom check: {e}")
                 return True
@@ -160,14 +170,11 @@ class NodeStrategy:
     
     def _check_by_custom(self, response: Dict[str, Any]) -> bool:
         """通过自定义代码检查"""
-        if not self.task_detection.custom_check_code:
+        if not self.task_check:
             return False
         
         try:
-            result = eval(self.task_detection.custom_check_code, {
-                "response": response,
-            })
-            return bool(result)
+            return self.task_check.test({"response": response})
         except Exception as e:
             print(f"Error in custom check: {e}")
             return False
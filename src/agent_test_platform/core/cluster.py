@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from typing import Dict, Any, Optional, List
+from urllib.parse import urlencode
+import websockets
+from agent_test_platform.config.logger import logger, setup_logging
+from agent_test_platform.config.settings import settings
+from agent_test_platform.core.workers import run_shard
+
+
+# ============================================================
+# 协调方：已注册的远程 worker
+# ============================================================
+
+class RemoteWorker:
+    """协调方持有的一个远程 worker（一条 WebSocket 连接，同一时间执行一个分片）
+
+    作为 WorkerGroup 中分片的执行方：post 把命令放入发送队列，
+    连接收到的回传按 runId 转入当前分片所属运行的 inbox。
+    协调方不再等待（close）时分片可能仍在排空，worker 保持忙碌，
+    直到收到该运行的 done / error 才回到空闲池。
+    """
+
+    def __init__(self, worker_id: str, name: Optional[str] = None, host: Optional[str] = None, pid: Optional[int] = None):
+        self.worker_id = worker_id
+        self.name = name or worker_id
+        self.host = host
+        self.pid = pid
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.connected = True
+        self.registered_at = time.time()
+        self.completed = 0
+
+        # 当前分配的分片
+        self.run_id: Optional[str] = None
+        self.handle = None
+        self.inbox: Optional[asyncio.Queue] = None
+        self.finished = False  # 当前分片已回传 done / error
+
+    @property
+    def alive(self) -> bool:
+        return self.connected
+
+    @property
+    def busy(self) -> bool:
+        return self.run_id is not None
+
+    def describe(self) -> Dict[str, Any]:
+        return {"kind": "remote", "workerId": self.worker_id, "name": self.name, "host": self.host}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.describe(),
+            "pid": self.pid,
+            "connected": self.connected,
+            "runId": self.run_id,
+            "completed": self.completed,
+            "registeredAt": self.registered_at,
+        }
+
+    def post(self, kind: str, payload: Any = None):
+        if self.connected and self.run_id is not None:
+            self.outbox.put_nowait({"type": kind, "runId": self.run_id, "data": payload})
+
+    def dispatch(self, message: Dict[str, Any]):
+        """连接收到的回传：只接受当前分片所属运行的消息"""
+        if self.run_id is None or message.get("runId") != self.run_id:
+            return
+        kind = message.get("type")
+        if kind in ("done", "error"):
+            self.finished = True
+        if self.inbox is None:
+            # 协调方已不再等待，分片结束后释放
+            if self.finished:
+                self._release()
+            return
+        self.inbox.put_nowait((self.handle, (kind, message.get("data"))))
+
+    def disconnect(self):
+        self.connected = False
+        if self.inbox is not None:
+            self.inbox.put_nowait((self.handle, ("exit", None)))
+
+    async def close(self):
+        """协调方结束该分片；分片已结束时释放回空闲池，否则等它回传 done / error 后再释放"""
+        self.handle = None
+        self.inbox = None
+        if self.finished:
+            self._release()
+        elif self.connected:
+            logger.warning("Remote worker still draining, kept busy until its shard exits", run_id=self.run_id, **self.describe())
+
+    def _release(self):
+        self.run_id = None
+        self.finished = False
+        self.completed += 1
+
+
+class RemoteWorkerPool:
+    """已注册的远程 worker 登记表（协调方）
+
+    远程 worker 通过 /api/workers/ws 连接并发送 hello 完成注册；
+    运行配置了 remote_workers 时，WorkerGroup 从这里领取空闲 worker 执行分片。
+    """
+
+    def __init__(self):
+        self.workers: Dict[str, RemoteWorker] = {}
+
+    def idle(self) -> List[RemoteWorker]:
+        return [worker for worker in self.workers.values() if worker.connected and not worker.busy]
+
+    def assign(self, run_id: str, handle, inbox: asyncio.Queue) -> RemoteWorker:
+        idle = self.idle()
+        if not idle:
+            raise RuntimeError("No idle remote worker available")
+        worker = idle[0]
+        worker.run_id = run_id
+        worker.handle = handle
+        worker.inbox = inbox
+        worker.finished = False
+        return worker
+
+    async def serve(self, websocket):
+        """处理一条远程 worker 连接直到断开（websocket 为已 accept 的 Starlette WebSocket）"""
+        hello = await websocket.receive_json()
+        if hello.get("type") != "hello":
+            await websocket.close(code=1002, reason="Expected hello")
+            return
+
+        worker = RemoteWorker(uuid.uuid4().hex[:12], hello.get("name"), hello.get("host"), hello.get("pid"))
+        self.workers[worker.worker_id] = worker
+        logger.info("Remote worker registered", **worker.describe())
+        await websocket.send_json({"type": "welcome", "workerId": worker.worker_id})
+
+        async def send_loop():
+            while True:
+                message = await worker.outbox.get()
+                await websocket.send_json(message)
+
+        sender = asyncio.create_task(send_loop())
+        try:
+            while True:
+                worker.dispatch(await websocket.receive_json())
+        finally:
+            sender.cancel()
+            worker.disconnect()
+            self.workers.pop(worker.worker_id, None)
+            logger.info("Remote worker disconnected", **worker.describe())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "registered": len(self.workers),
+            "idle": len(self.idle()),
+            "workers": [worker.to_dict() for worker in self.workers.values()],
+        }
+
+
+# ============================================================
+# 远程 worker 侧
+# ============================================================
+
+class WebSocketChannel:
+    """远程 worker 侧的通道：回传封装成 JSON 帧，协调方命令由连接的接收循环转入 commands"""
+
+    def __init__(self, websocket, run_id: str):
+        self.websocket = websocket
+        self.run_id = run_id
+        self.commands: asyncio.Queue = asyncio.Queue()
+
+    async def send(self, kind: str, payload: Dict[str, Any]):
+        await self.websocket.send(json.dumps({"type": kind, "runId": self.run_id, "data": payload}, default=str))
+
+
+async def _run_remote_shard(channel: WebSocketChannel, spec: Dict[str, Any]):
+    try:
+        await run_shard(channel, spec)
+    except websockets.exceptions.ConnectionClosed:
+        logger.warning("Coordinator connection closed while running shard", run_id=channel.run_id)
+    except Exception as e:
+        logger.error(f"Remote shard failed: {e}", run_id=channel.run_id)
+        try:
+            await channel.send("error", {"error": str(e)})
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def _serve_connection(websocket, name: str):
+    await websocket.send(json.dumps({"type": "hello", "name": name, "host": socket.gethostname(), "pid": os.getpid()}))
+    channel: Optional[WebSocketChannel] = None
+    shard: Optional[asyncio.Task] = None
+    try:
+        async for raw in websocket:
+            message = json.loads(raw)
+            kind = message.get("type")
+            run_id = message.get("runId")
+            if kind == "welcome":
+                logger.info("Registered with coordinator", worker_id=message.get("workerId"), name=name)
+            elif kind == "run":
+                if shard is not None and not shard.done():
+                    await websocket.send(json.dumps({"type": "error", "runId": run_id, "data": {"error": "Worker busy"}}))
+                    continue
+                channel = WebSocketChannel(websocket, run_id)
+                shard = asyncio.create_task(_run_remote_shard(channel, message.get("data") or {}))
+            elif kind in ("pause", "resume", "cancel") and channel is not None and channel.run_id == run_id:
+                channel.commands.put_nowait((kind, message.get("data")))
+    finally:
+        # 与协调方断开：取消正在执行的分片（已启动的请求照常排空）
+        if shard is not None and not shard.done():
+            channel.commands.put_nowait(("cancel", "Coordinator disconnected"))
+            await asyncio.gather(shard, return_exceptions=True)
+
+
+async def serve_coordinator(
+    url: Optional[str] = None,
+    token: Optional[str] = None,
+    name: Optional[str] = None,
+    reconnect_delay: float = 3.0,
+):
+    """远程 worker 主循环：连接协调方并注册，逐个执行分配的分片；断线后自动重连"""
+    url = url or settings.WORKER_COORDINATOR_URL
+    token = settings.WORKER_TOKEN if token is None else token
+    if token:
+        url = f"{url}{'&' if '?' in url else '?'}{urlencode({'token': token})}"
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+
+    while True:
+        try:
+            async with websockets.connect(url, max_size=None) as websocket:
+                await _serve_connection(websocket, name)
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            logger.warning(f"Coordinator connection failed: {e}", name=name)
+        await asyncio.sleep(reconnect_delay)
+
+
+def _worker_process(url: Optional[str], token: Optional[str], name: Optional[str]):
+    setup_logging()
+    try:
+        asyncio.run(serve_coordinator(url, token, name))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: Optional[List[str]] = None):
+    """python -m agent_test_platform.core.cluster --coordinator ws://host:8000/api/workers/ws --processes 4"""
+    parser = argparse.ArgumentParser(description="Remote load-generator worker for node-based test runs")
+    parser.add_argument("--coordinator", default=settings.WORKER_COORDINATOR_URL, help="coordinator WebSocket URL")
+    parser.add_argument("--token", default=settings.WORKER_TOKEN, help="registration token (WORKER_TOKEN)")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start on this host")
+    parser.add_argument("--name", default=None, help="worker name prefix")
+    args = parser.parse_args(argv)
+
+    if args.processes <= 1:
+        _worker_process(args.coordinator, args.token, args.name)
+        return
+
+    # 每个进程一条连接、一个分片，充分利用多核
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_worker_process,
+            args=(args.coordinator, args.token, f"{args.name or socket.gethostname()}-{i}"),
+            daemon=True,
+        )
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from agent_test_platform.models.conversation_model import (
 )
 from agent_test_platform.config.node_strategy import NodeStrategy
 from agent_test_platform.storage.database import Database
+from agent_test_platform.core.metrics import RunMetrics
 
 
 class ConversationExecutor:
@@ -27,6 +28,7 @@ class ConversationExecutor:
         http_client: AgentHTTPClient,
         ai_client=None,  # OpenAI 客户端
         on_event_callback=None,
+        metrics: Optional[RunMetrics] = None,
     ):
         self.node_strategy = node_strategy
         self.user_profile = user_profile
@@ -38,12 +40,14 @@ class ConversationExecutor:
         self.http_client = http_client
         self.ai_client = ai_client
         self.on_event_callback = on_event_callback
+        self.metrics = metrics
         
         # 对话状态
         self.conversation: Optional[Conversation] = None
         self.turn_count = 0
         self.start_time = None
         self.dialog_history = []  # 对话历史
+        self.turns = []  # 本次对话的 DialogTurn 记录
     
     async def execute(self) -> bool:
         """执行多轮对话"""
@@ -111,12 +115,16 @@ class ConversationExecutor:
             # 1. 构建上下文消息
             context_message = self._build_context_message(user_message)
             
-            # 2. 调用 Agent API
-            success, response, error, duration = await self.http_client.call_agent(
+            # 2. 调用 Agent API（节点配置 stream=true 时走流式接口）
+            stream = bool(self.node_strategy.config.get("stream", False))
+            call = self.http_client.stream_agent if stream else self.http_client.call_agent
+            success, response, error, duration, timing = await call(
                 endpoint="/chat",
                 payload={"message": context_message},
                 headers=self._build_headers(),
             )
+            if self.metrics is not None:
+                self.metrics.record(self.node_id, self.node_name, success, duration, "/chat", error)
             
             # 3. 检查响应
             if not success:
@@ -133,6 +141,7 @@ class ConversationExecutor:
                 agent_response=agent_response,
                 agent_response_raw=str(response),
                 duration_ms=duration,
+                timing=timing.to_dict(),
             )
             
             # 5. 检查是否生成任务
@@ -150,8 +159,9 @@ class ConversationExecutor:
                     turn=self.turn_count,
                 )
             
-            # 6. 保存到数据库
-            turn = await self.db.create(turn)
+            # 6. 保存到数据库（write-behind 批量写入）
+            turn = await self.db.create_deferred(turn, self.test_run_id)
+            self.turns.append(turn)
             
             # 7. 更新对话历史
             self.dialog_history.append({
@@ -169,6 +179,7 @@ class ConversationExecutor:
                     turn_number=self.turn_count,
                     task_detected=task_detected,
                     duration_ms=int(duration),
+                    ttft_ms=timing.ttft_ms,
                 )
             
             return agent_response
@@ -189,7 +200,7 @@ class ConversationExecutor:
             config=self.node_strategy.config,
         )
         
-        return await self.db.create(conversation)
+        return await self.db.create_deferred(conversation, self.test_run_id)
     
     async def _finalize_conversation(self, success: bool, error: str = None):
         """完成对话"""
@@ -203,14 +214,14 @@ class ConversationExecutor:
             self.conversation.completed_at = datetime.utcnow()
             
             # 检查是否生成了任务
-            for turn in self.conversation.turns:
+            for turn in self.turns:
                 if turn.task_detected:
                     self.conversation.task_generated = True
                     self.conversation.task_id = turn.task_id
                     self.conversation.task_data = turn.task_data
                     break
             
-            await self.db.update(self.conversation)
+            await self.db.update_deferred(self.conversation, self.test_run_id)
             
             logger.info(
                 f"Conversation completed",
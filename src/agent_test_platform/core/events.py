@@ -0,0 +1,223 @@
+import asyncio
+import random
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Callable, Awaitable
+from agent_test_platform.config.logger import logger
+from agent_test_platform.config.settings import settings
+
+
+class NodeEventCounters:
+    """某节点在一个合并周期内的事件计数"""
+
+    __slots__ = ("node_name", "started", "completed", "failed", "duration_sum", "duration_count", "duration_max")
+
+    def __init__(self, node_name: Optional[str] = None):
+        self.node_name = node_name
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.duration_sum = 0
+        self.duration_count = 0
+        self.duration_max = 0
+
+    def to_state(self) -> List[Any]:
+        return [
+            self.node_name, self.started, self.completed, self.failed,
+            self.duration_sum, self.duration_count, self.duration_max,
+        ]
+
+    def merge_state(self, state: List[Any]):
+        node_name, started, completed, failed, duration_sum, duration_count, duration_max = state
+        self.node_name = self.node_name or node_name
+        self.started += started
+        self.completed += completed
+        self.failed += failed
+        self.duration_sum += duration_sum
+        self.duration_count += duration_count
+        self.duration_max = max(self.duration_max, duration_max)
+
+
+class EventAggregator:
+    """把一个运行的执行器事件合并成周期性的帧：按类型 / 节点计数 + 少量事件样本
+
+    - 计数覆盖所有事件，样本最多 sample_size 条：失败事件优先保留（最多占一半），
+      其余事件用蓄水池抽样，保证任意事件量下帧大小有上限
+    - take() 返回可 JSON 序列化的增量并清空；merge() 合并其他进程（worker）的增量
+    """
+
+    def __init__(self, sample_size: Optional[int] = None):
+        self.sample_size = settings.WS_EVENT_SAMPLE_SIZE if sample_size is None else sample_size
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.counts: Dict[str, int] = {}
+        self.nodes: Dict[str, NodeEventCounters] = {}
+        self.failures: List[Dict[str, Any]] = []
+        self.samples: List[Dict[str, Any]] = []
+        # 参与蓄水池抽样的事件数
+        self._seen = 0
+
+    def __call__(self, event_type: str, run_id: str, data: Dict[str, Any]):
+        """与执行器的 on_event_callback 签名一致"""
+        self.add(event_type, data)
+
+    def add(self, event_type: str, data: Dict[str, Any]):
+        self.total += 1
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+
+        node_id = data.get("nodeId")
+        if node_id is not None:
+            counters = self.nodes.get(node_id)
+            if counters is None:
+                counters = self.nodes[node_id] = NodeEventCounters(data.get("nodeName"))
+            if event_type == "node_started":
+                counters.started += 1
+            elif event_type == "node_completed":
+                counters.completed += 1
+            elif event_type == "node_failed":
+                counters.failed += 1
+            duration = data.get("duration")
+            if duration:
+                counters.duration_sum += duration
+                counters.duration_count += 1
+                if duration > counters.duration_max:
+                    counters.duration_max = duration
+
+        self._sample({"type": event_type, **data}, failed=event_type.endswith("_failed"))
+
+    def _sample(self, event: Dict[str, Any], failed: bool = False):
+        if failed and len(self.failures) < self.sample_size // 2:
+            self.failures.append(event)
+            return
+        self._seen += 1
+        capacity = self.sample_size - self.sample_size // 2
+        if len(self.samples) < capacity:
+            self.samples.append(event)
+            return
+        slot = random.randrange(self._seen)
+        if slot < capacity:
+            self.samples[slot] = event
+
+    def take(self) -> Dict[str, Any]:
+        """取出本周期的增量并清空"""
+        delta = {
+            "total": self.total,
+            "counts": self.counts,
+            "nodes": {node_id: counters.to_state() for node_id, counters in self.nodes.items()},
+            "samples": self.failures + self.samples,
+        }
+        self._reset()
+        return delta
+
+    def merge(self, delta: Dict[str, Any]):
+        """合并 take() 的结果（来自 worker 进程 / 远程 worker）"""
+        self.total += delta.get("total", 0)
+        for event_type, count in (delta.get("counts") or {}).items():
+            self.counts[event_type] = self.counts.get(event_type, 0) + count
+        for node_id, state in (delta.get("nodes") or {}).items():
+            counters = self.nodes.get(node_id)
+            if counters is None:
+                counters = self.nodes[node_id] = NodeEventCounters()
+            counters.merge_state(state)
+        for event in delta.get("samples") or ():
+            self._sample(event, failed=str(event.get("type", "")).endswith("_failed"))
+
+    def to_frame(self, run_id: str, interval_ms: int) -> Dict[str, Any]:
+        """本周期的 WebSocket 帧（run_events），并清空"""
+        delta = self.take()
+        nodes = [
+            {
+                "nodeId": node_id,
+                "nodeName": node_name,
+                "started": started,
+                "completed": completed,
+                "failed": failed,
+                "avgDuration": round(duration_sum / duration_count) if duration_count else None,
+                "maxDuration": duration_max if duration_count else None,
+            }
+            for node_id, (node_name, started, completed, failed, duration_sum, duration_count, duration_max)
+            in delta["nodes"].items()
+        ]
+        return {
+            "type": "run_events",
+            "runId": run_id,
+            "timestamp": datetime.now().isoformat(),
+            "data": {
+                "intervalMs": interval_ms,
+                "events": delta["total"],
+                "counts": delta["counts"],
+                "nodes": nodes,
+                "samples": delta["samples"],
+                "omitted": delta["total"] - len(delta["samples"]),
+            },
+        }
+
+
+EventSink = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class EventBus:
+    """执行器与 WebSocket 之间的进程内事件总线
+
+    执行器调用 publish（同步、O(1)，不等待任何发送），事件按运行合并进 EventAggregator；
+    后台任务每 WS_EVENT_FLUSH_MS 毫秒把有新事件的运行各合并成一帧交给 sink（如 WSConnectionManager.broadcast），
+    因此无论用户数多少，每个运行的推送频率都有上限。
+    """
+
+    def __init__(self, sink: EventSink, flush_ms: Optional[int] = None, sample_size: Optional[int] = None):
+        self.sink = sink
+        self.flush_ms = flush_ms or settings.WS_EVENT_FLUSH_MS
+        self.sample_size = sample_size
+        self.runs: Dict[str, EventAggregator] = {}
+        self.frames_sent = 0
+        self.events_published = 0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _aggregator(self, run_id: str) -> EventAggregator:
+        aggregator = self.runs.get(run_id)
+        if aggregator is None:
+            aggregator = self.runs[run_id] = EventAggregator(self.sample_size)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+        return aggregator
+
+    def publish(self, event_type: str, run_id: str, data: Dict[str, Any]):
+        """执行器事件入口（签名与 on_event_callback 一致）"""
+        self.events_published += 1
+        self._aggregator(run_id).add(event_type, data)
+
+    def merge(self, run_id: str, delta: Dict[str, Any]):
+        """合并 worker 回传的已聚合事件（EventAggregator.take 的结果）"""
+        self.events_published += delta.get("total", 0)
+        self._aggregator(run_id).merge(delta)
+
+    async def _flush_loop(self):
+        while self.runs:
+            await asyncio.sleep(self.flush_ms / 1000)
+            for run_id in list(self.runs):
+                await self.flush(run_id)
+
+    async def flush(self, run_id: str):
+        aggregator = self.runs.get(run_id)
+        if aggregator is None or not aggregator.total:
+            return
+        frame = aggregator.to_frame(run_id, self.flush_ms)
+        try:
+            await self.sink(run_id, frame)
+            self.frames_sent += 1
+        except Exception as e:
+            logger.error(f"Failed to deliver event frame: {e}", run_id=run_id)
+
+    async def finish(self, run_id: str):
+        """运行结束：推送剩余事件并释放"""
+        await self.flush(run_id)
+        self.runs.pop(run_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flushMs": self.flush_ms,
+            "runs": len(self.runs),
+            "eventsPublished": self.events_published,
+            "framesSent": self.frames_sent,
+        }
@@ -0,0 +1,107 @@
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+from agent_test_platform.models.node_config_model import NodeConfig
+from agent_test_platform.core.scheduling import ThinkTime, compile_think_times
+from agent_test_platform.core.templates import PayloadTemplate, compile_payload_templates
+from agent_test_platform.core.extraction import Extractor, compile_extractors
+from agent_test_platform.core.expressions import Expression, compile_conditions
+from agent_test_platform.core.polling import PollingConfig, compile_polling
+
+
+class ExecutionPlanError(ValueError):
+    """场景 DAG 无法编译（如存在循环依赖）"""
+
+
+def node_key(node: NodeConfig) -> str:
+    return node.node_id or node.id
+
+
+def node_config(node: NodeConfig) -> Dict[str, Any]:
+    """节点的 config 段；旧数据只有 full_config 时从中读取"""
+    config = node.config or {}
+    if (not config) and isinstance(getattr(node, "full_config", None), dict):
+        config = node.full_config.get("config", {}) or {}
+    return config
+
+
+class ExecutionPlan:
+    """编译后的场景执行计划，同一次运行的所有虚拟用户共享（只读）
+
+    - order / nodes: 拓扑序（Kahn 算法，同层按节点配置的原始顺序）
+    - index: node_id -> 在拓扑序中的位置
+    - dependency_masks: 每个节点的依赖位图（第 i 位对应 order[i]），依赖检查只需一次按位与
+    - dependents: 每个节点的直接后继位置
+    - configs / think_times / payload_templates / extractors / conditions / polling: 按节点预编译的配置
+    依赖中引用了场景内不存在的节点时忽略该依赖（与改造前一致）。
+    """
+
+    __slots__ = (
+        "nodes", "order", "index", "dependency_masks", "dependents", "configs",
+        "think_times", "payload_templates", "extractors", "conditions", "polling",
+    )
+
+    def __init__(self, nodes: List[NodeConfig]):
+        nodes = list(nodes)
+        positions = {node_key(node): i for i, node in enumerate(nodes)}
+        if len(positions) != len(nodes):
+            raise ExecutionPlanError("Duplicate node id in scenario")
+
+        # 按原始位置建邻接表与入度
+        in_degree = [0] * len(nodes)
+        adjacency: List[List[int]] = [[] for _ in nodes]
+        for i, node in enumerate(nodes):
+            for dep_id in dict.fromkeys(node.dependencies or []):
+                dep = positions.get(dep_id)
+                if dep is not None:
+                    adjacency[dep].append(i)
+                    in_degree[i] += 1
+
+        queue = deque(i for i, degree in enumerate(in_degree) if degree == 0)
+        sorted_positions: List[int] = []
+        while queue:
+            i = queue.popleft()
+            sorted_positions.append(i)
+            for neighbor in adjacency[i]:
+                in_degree[neighbor] -= 1
+                if in_degree[neighbor] == 0:
+                    queue.append(neighbor)
+
+        if len(sorted_positions) != len(nodes):
+            cyclic = [node_key(nodes[i]) for i, degree in enumerate(in_degree) if degree > 0]
+            raise ExecutionPlanError(f"Cyclic dependency detected in scenario: {', '.join(cyclic)}")
+
+        self.nodes: Tuple[NodeConfig, ...] = tuple(nodes[i] for i in sorted_positions)
+        self.order: Tuple[str, ...] = tuple(node_key(node) for node in self.nodes)
+        self.index: Dict[str, int] = {node_id: i for i, node_id in enumerate(self.order)}
+
+        masks = [0] * len(self.nodes)
+        dependents: List[List[int]] = [[] for _ in self.nodes]
+        for i, node in enumerate(self.nodes):
+            for dep_id in node.dependencies or []:
+                dep = self.index.get(dep_id)
+                if dep is not None:
+                    masks[i] |= 1 << dep
+                    if i not in dependents[dep]:
+                        dependents[dep].append(i)
+        self.dependency_masks: Tuple[int, ...] = tuple(masks)
+        self.dependents: Tuple[Tuple[int, ...], ...] = tuple(tuple(d) for d in dependents)
+
+        self.configs: Dict[str, Dict[str, Any]] = {node_key(node): node_config(node) for node in self.nodes}
+        self.think_times: Dict[str, ThinkTime] = compile_think_times(self.nodes)
+        self.payload_templates: Dict[str, PayloadTemplate] = compile_payload_templates(self.nodes)
+        self.extractors: Dict[str, Extractor] = compile_extractors(self.nodes)
+        self.conditions: Dict[str, Expression] = compile_conditions(self.nodes)
+        self.polling: Dict[str, PollingConfig] = compile_polling(self.nodes)
+
+    @classmethod
+    def compile(cls, nodes) -> "ExecutionPlan":
+        if isinstance(nodes, cls):
+            return nodes
+        return cls(nodes)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def get_node(self, node_id: str) -> Optional[NodeConfig]:
+        i = self.index.get(node_id)
+        return self.nodes[i] if i is not None else None
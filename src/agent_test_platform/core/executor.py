@@ -1,7 +1,7 @@
 
 import asyncio
 import time
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 from datetime import datetime
 from agent_test_platform.config.logger import logger
 from agent_test_platform.http_client.client import AgentHTTPClient
@@ -9,6 +9,11 @@ from agent_test_platform.scenarios.model import ScenarioConfig, StepConfig
 from agent_test_platform.models.virtual_user import VirtualUser, VirtualUserStatus
 from agent_test_platform.models.test_step import TestStep, TestStepStatus
 from agent_test_platform.storage.database import Database
+from agent_test_platform.core.scheduling import UserScheduler
+from agent_test_platform.core.templates import PayloadTemplate
+from agent_test_platform.core.extraction import Extractor
+from agent_test_platform.core.expressions import Expression
+from agent_test_platform.core.run_control import RunController
 
 
 class VirtualUserExecutor:
@@ -23,6 +28,8 @@ class VirtualUserExecutor:
         db: Database,
         http_client: AgentHTTPClient,
         on_progress_callback=None,
+        scheduler: Optional[UserScheduler] = None,
+        controller: Optional[RunController] = None,
     ):
         self.user_id = user_id
         self.user_index = user_index
@@ -31,6 +38,9 @@ class VirtualUserExecutor:
         self.db = db
         self.http_client = http_client
         self.on_progress_callback = on_progress_callback
+        self.scheduler = scheduler
+        # 运行控制（暂停 / 取消），步骤之间检查
+        self.controller = controller
         
         # 用户上下文
         self.user_context: Dict[str, Any] = {
@@ -42,6 +52,10 @@ class VirtualUserExecutor:
         self.start_time = None
         self.end_time = None
         self.current_step_index = 0
+        
+        # 用户级统计（本地累计，避免结束时回读数据库）
+        self.num_requests = 0
+        self.num_errors = 0
     
     async def run(self) -> bool:
         """运行虚拟用户的完整测试"""
@@ -61,6 +75,9 @@ class VirtualUserExecutor:
             while step_index < len(self.scenario.steps):
                 step_config = self.scenario.steps[step_index]
                 
+                if self.controller:
+                    await self.controller.checkpoint()
+                
                 # 更新用户状态
                 await self._update_user_status(user, step_index)
                 
@@ -86,6 +103,10 @@ class VirtualUserExecutor:
                     break
                 
                 step_index += 1
+                
+                # 步骤之间的思考时间
+                if step_index < len(self.scenario.steps):
+                    await self._think(step_config)
             
             # 3. 更新用户为完成状态
             await self._finalize_user(user, success=True)
@@ -108,6 +129,24 @@ class VirtualUserExecutor:
         finally:
             self.end_time = time.time()
     
+    async def _think(self, step_config: StepConfig):
+        """按步骤（或场景默认）的思考时间分布等待"""
+        think_time = step_config.think_time or self.scenario.think_time
+        if think_time is None:
+            return
+        
+        seconds = think_time.sample()
+        if self.scheduler:
+            waiter = self.scheduler.sleep_from(self.scheduler.now(), seconds)
+        elif seconds > 0:
+            waiter = asyncio.sleep(seconds)
+        else:
+            return
+        if self.controller:
+            await self.controller.sleep(waiter)
+        else:
+            await waiter
+    
     async def _create_user_record(self) -> Optional[VirtualUser]:
         """创建虚拟用户数据库记录"""
         try:
@@ -118,7 +157,7 @@ class VirtualUserExecutor:
                 total_steps=len(self.scenario.steps),
                 context=self.user_context,
             )
-            return await self.db.create(user)
+            return await self.db.create_deferred(user)
         except Exception as e:
             logger.error(f"Failed to create user record: {e}")
             return None
@@ -128,7 +167,7 @@ class VirtualUserExecutor:
         try:
             user.status = VirtualUserStatus.RUNNING
             user.current_step = step_index
-            await self.db.update(user)
+            await self.db.update_deferred(user)
         except Exception as e:
             logger.error(f"Failed to update user status: {e}")
     
@@ -155,13 +194,14 @@ class VirtualUserExecutor:
             request_body=step_config.payload,
             status=TestStepStatus.RUNNING,
         )
-        test_step = await self.db.create(test_step)
+        test_step = await self.db.create_deferred(test_step, self.test_run_id)
+        self.num_requests += 1
         
         step_start = time.time()
         
         try:
             # 1. 准备请求体（支持从上下文替换）
-            payload = self._build_payload(step_config.payload)
+            payload = self._build_payload(step_config.payload_template or step_config.payload)
             
             logger.info(
                 f"Executing step {step_index}",
@@ -171,7 +211,7 @@ class VirtualUserExecutor:
             )
             
             # 2. 调用 Agent API
-            success, response_json, error_msg, duration_ms = await self.http_client.call_agent(
+            success, response_json, error_msg, duration_ms, timing = await self.http_client.call_agent(
                 endpoint=step_config.endpoint,
                 payload=payload,
                 headers=self._build_headers(),
@@ -181,6 +221,7 @@ class VirtualUserExecutor:
             
             # 3. 更新 TestStep 记录
             test_step.duration_ms = duration_ms
+            test_step.timing = timing.to_dict()
             test_step.response_body = response_json if response_json else {}
             test_step.error_message = error_msg
             
@@ -189,13 +230,13 @@ class VirtualUserExecutor:
                 test_step.response_status_code = 200
                 
                 # 4. 从响应中提取字段
-                extracted = self._extract_fields(response_json, step_config.extraction)
+                extracted = self._extract_fields(response_json, step_config.extractor or step_config.extraction)
                 self.user_context.update(extracted)
                 
                 # 5. 评估是否继续
                 should_continue = self._evaluate_condition(
                     response_json,
-                    step_config.should_continue,
+                    step_config.continue_expression or step_config.should_continue,
                 )
                 
                 test_step.evaluation_result = {
@@ -213,6 +254,7 @@ class VirtualUserExecutor:
                 test_step.status = TestStepStatus.FAILED
                 test_step.response_status_code = 500
                 should_continue = False
+                self.num_errors += 1
                 
                 logger.warning(
                     f"Step {step_index} failed",
@@ -220,7 +262,7 @@ class VirtualUserExecutor:
                     error=error_msg,
                 )
             
-            await self.db.update(test_step)
+            await self.db.update_deferred(test_step, self.test_run_id)
             
             # 6. 调用进度回调
             if self.on_progress_callback:
@@ -243,7 +285,8 @@ class VirtualUserExecutor:
             test_step.status = TestStepStatus.FAILED
             test_step.error_message = str(e)
             test_step.duration_ms = (time.time() - step_start) * 1000
-            await self.db.update(test_step)
+            self.num_errors += 1
+            await self.db.update_deferred(test_step, self.test_run_id)
             
             return False, False
     
@@ -255,38 +298,21 @@ class VirtualUserExecutor:
             user.status = VirtualUserStatus.COMPLETED if success else VirtualUserStatus.FAILED
             user.total_duration_ms = duration_ms
             
-            # 计算统计数据
-            steps = await self.db.query_steps(user.id)
-            user.num_requests = len(steps)
-            user.num_errors = sum(1 for s in steps if s.status == TestStepStatus.FAILED)
+            # 统计数据
+            user.num_requests = self.num_requests
+            user.num_errors = self.num_errors
             
-            await self.db.update(user)
+            await self.db.update_deferred(user)
         except Exception as e:
             logger.error(f"Failed to finalize user: {e}")
     
-    def _build_payload(self, template: Dict[str, Any]) -> Dict[str, Any]:
-        """根据模板和上下文构建请求体"""
-        import copy
-        import re
-        
-        payload = copy.deepcopy(template)
-        
-        # 简单的模板替换：{context.field_name} -> context['field_name']
-        def replace_context(obj):
-            if isinstance(obj, str):
-                # 匹配 {context.xxx} 或 {xxx}
-                pattern = r'\{(?:context\.)?(\w+)\}'
-                def replacer(match):
-                    key = match.group(1)
-                    return str(self.user_context.get(key, ''))
-                return re.sub(pattern, replacer, obj)
-            elif isinstance(obj, dict):
-                return {k: replace_context(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [replace_context(item) for item in obj]
-            return obj
-        
-        return replace_context(payload)
+    def _build_payload(self, template) -> Dict[str, Any]:
+        """根据模板和上下文构建请求体
+
+        模板替换：{context.field_name} / {field_name} -> context['field_name']，
+        template 为 dict 或加载场景时预编译的 PayloadTemplate
+        """
+        return PayloadTemplate.compile(template).render(self.user_context)
     
     def _build_headers(self) -> Dict[str, str]:
         """构建请求头（包括 token 等）"""
@@ -298,40 +324,27 @@ class VirtualUserExecutor:
     def _extract_fields(
         self,
         response: Dict[str, Any],
-        extraction: Optional[Dict[str, str]],
+        extraction,
     ) -> Dict[str, Any]:
-        """从响应中提取字段"""
+        """从响应中提取字段（JSON 路径，如 data.items[0].task_id；见 Extractor）"""
         if not extraction:
             return {}
         
-        extracted = {}
-        for key, path in extraction.items():
-            # 简单的 JSON 路径提取：response.data.task_id
-            try:
-                value = response
-                for part in path.split('.'):
-                    if isinstance(value, dict):
-                        value = value.get(part)
-                    else:
-                        value = None
-                        break
-                
-                if value is not None:
-                    extracted[key] = value
-            except Exception:
-                pass
-        
-        return extracted
+        try:
+            return Extractor.compile(extraction).extract(response)
+        except ValueError as e:
+            logger.warning(f"Invalid extraction: {e}")
+            return {}
     
     def _evaluate_condition(
         self,
         response: Dict[str, Any],
-        condition: Optional[str],
+        condition: Union[Expression, str, None],
     ) -> bool:
         """
         评估是否继续
         
-        简单的表达式评估，如：
+        受限表达式（见 core.expressions.Expression），如：
         - "response.status == 'continue'" -> 继续
         - "response.task_id" -> 有 task_id 则继续
         """
@@ -339,17 +352,7 @@ class VirtualUserExecutor:
             return True  # 默认继续
         
         try:
-            # 创建安全的评估上下文
-            context = {
-                'response': response,
-                'True': True,
-                'False': False,
-                'None': None,
-            }
-            
-            # 简单的安全评估（仅支持比较和布尔运算）
-            result = eval(condition, {"__builtins__": {}}, context)
-            return bool(result)
+            return Expression.compile(condition, ("response",)).test({"response": response})
         
         except Exception as e:
             logger.warning(f"Failed to evaluate condition '{condition}': {e}")
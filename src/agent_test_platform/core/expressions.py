@@ -0,0 +1,370 @@
+import ast
+import functools
+import operator
+from typing import Dict, Any, Callable, Iterable, Optional, Tuple, Union
+
+
+class ExpressionError(ValueError):
+    """条件表达式语法错误或使用了不支持的语法"""
+
+
+# 表达式中可调用的内置函数
+_FUNCTIONS: Dict[str, Callable] = {
+    "len": len,
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+    "any": any,
+    "all": all,
+}
+
+# 允许调用的方法：方法名 -> 允许的接收者类型
+_METHODS: Dict[str, Tuple[type, ...]] = {
+    "get": (dict,),
+    "keys": (dict,),
+    "values": (dict,),
+    "items": (dict,),
+    "lower": (str,),
+    "upper": (str,),
+    "strip": (str,),
+    "startswith": (str,),
+    "endswith": (str,),
+    "count": (str, list, tuple),
+}
+
+# 兼容 JSON / YAML 风格的字面量写法，如 "response.task_id != null"
+_LITERAL_NAMES = {"null": None, "true": True, "false": False}
+
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+}
+
+_UNARY = {
+    ast.Not: operator.not_,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+def _multiply(left, right):
+    # 只允许数值相乘，避免 'x' * 10**9 这类表达式耗尽内存
+    if not isinstance(left, (int, float)) or not isinstance(right, (int, float)):
+        raise TypeError("'*' only supports numbers")
+    return left * right
+
+
+def _modulo(left, right):
+    # 只允许数值取模：字符串的 '%' 是格式化，'%0200000000d' % 1 这类表达式会耗尽内存
+    if not isinstance(left, (int, float)) or not isinstance(right, (int, float)):
+        raise TypeError("'%' only supports numbers")
+    return left % right
+
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _multiply,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: _modulo,
+}
+
+
+def _get_attr(value, name: str):
+    """a.b 等价于 a.get('b')：只作用于 dict，取不到时为 None"""
+    if isinstance(value, dict):
+        return value.get(name)
+    return None
+
+
+def _get_item(value, key):
+    """a[key]：dict 取键、序列取下标，取不到时为 None"""
+    if isinstance(value, dict):
+        return value.get(key)
+    if isinstance(key, slice):
+        return value[key] if isinstance(value, (list, tuple, str)) else None
+    if isinstance(value, (list, tuple, str)) and isinstance(key, int) and -len(value) <= key < len(value):
+        return value[key]
+    return None
+
+
+def _call_method(value, name: str, args):
+    allowed = _METHODS[name]
+    if not isinstance(value, allowed):
+        raise TypeError(f"'{name}()' is not supported on {type(value).__name__}")
+    return getattr(value, name)(*args)
+
+
+def _as_function(compiled: Tuple[bool, Any]) -> Callable[[Dict[str, Any]], Any]:
+    is_const, value = compiled
+    if is_const:
+        return lambda env: value
+    return value
+
+
+class _Compiler:
+    """把 ast 节点编译为闭包
+
+    每个节点编译为 (是否常量, 常量值或求值函数)，不依赖变量的子表达式在编译期直接求值。
+    """
+
+    def __init__(self, source: str, names: Tuple[str, ...]):
+        self.source = source
+        self.names = names
+
+    def error(self, message: str, node: Optional[ast.AST] = None) -> ExpressionError:
+        where = ""
+        if node is not None and hasattr(node, "col_offset"):
+            # 解析时源码外包了一层 "(\n...\n)"，行号要减 1
+            where = f" at line {node.lineno - 1}, column {node.col_offset + 1}"
+        return ExpressionError(f"{message}{where} in expression {self.source!r}")
+
+    def compile(self, node: ast.AST) -> Tuple[bool, Any]:
+        method = getattr(self, f"_compile_{type(node).__name__}", None)
+        if method is None:
+            raise self.error(f"Unsupported syntax '{type(node).__name__}'", node)
+        return method(node)
+
+    def function(self, node: ast.AST) -> Callable[[Dict[str, Any]], Any]:
+        return _as_function(self.compile(node))
+
+    def fold(self, node: ast.AST, evaluate: Callable[[Dict[str, Any]], Any], parts) -> Tuple[bool, Any]:
+        """所有子表达式都是常量时在编译期求值"""
+        if all(is_const for is_const, _ in parts):
+            try:
+                return True, evaluate({})
+            except Exception as e:
+                raise self.error(f"{type(e).__name__}: {e}", node)
+        return False, evaluate
+
+    def _compile_Expression(self, node: ast.Expression):
+        return self.compile(node.body)
+
+    def _compile_Constant(self, node: ast.Constant):
+        if not isinstance(node.value, (str, int, float, bool, type(None))):
+            raise self.error(f"Unsupported literal {node.value!r}", node)
+        return True, node.value
+
+    def _compile_Name(self, node: ast.Name):
+        name = node.id
+        if name in self.names:
+            return False, lambda env: env.get(name)
+        if name in _LITERAL_NAMES:
+            return True, _LITERAL_NAMES[name]
+        allowed = ", ".join(self.names) or "none"
+        raise self.error(f"Unknown name '{name}' (available: {allowed})", node)
+
+    def _compile_Attribute(self, node: ast.Attribute):
+        name = node.attr
+        if name.startswith("_"):
+            raise self.error(f"Access to private attribute '{name}' is not allowed", node)
+        parts = [self.compile(node.value)]
+        target = _as_function(parts[0])
+        return self.fold(node, lambda env: _get_attr(target(env), name), parts)
+
+    def _compile_Subscript(self, node: ast.Subscript):
+        key_node = node.slice
+        # Python 3.8 的 ast.Index 包装
+        if type(key_node).__name__ == "Index":
+            key_node = key_node.value
+        parts = [self.compile(node.value), self.compile(key_node)]
+        target, key = _as_function(parts[0]), _as_function(parts[1])
+        return self.fold(node, lambda env: _get_item(target(env), key(env)), parts)
+
+    def _compile_Slice(self, node: ast.Slice):
+        compiled = [self.compile(bound) if bound is not None else None for bound in (node.lower, node.upper, node.step)]
+        parts = [part for part in compiled if part is not None]
+        functions = [_as_function(part) if part is not None else None for part in compiled]
+
+        def evaluate(env):
+            return slice(*(function(env) if function else None for function in functions))
+        return self.fold(node, evaluate, parts)
+
+    def _compile_Call(self, node: ast.Call):
+        if node.keywords:
+            raise self.error("Keyword arguments are not supported", node)
+        if any(isinstance(arg, ast.Starred) for arg in node.args):
+            raise self.error("Star arguments are not supported", node)
+        parts = [self.compile(arg) for arg in node.args]
+        args = [_as_function(part) for part in parts]
+
+        if isinstance(node.func, ast.Name):
+            function = _FUNCTIONS.get(node.func.id)
+            if function is None:
+                raise self.error(f"Unknown function '{node.func.id}'", node)
+            return self.fold(node, lambda env: function(*[arg(env) for arg in args]), parts)
+
+        if isinstance(node.func, ast.Attribute):
+            name = node.func.attr
+            if name not in _METHODS:
+                raise self.error(f"Unsupported method '{name}()'", node)
+            parts.append(self.compile(node.func.value))
+            target = _as_function(parts[-1])
+            return self.fold(node, lambda env: _call_method(target(env), name, [arg(env) for arg in args]), parts)
+
+        raise self.error("Unsupported call", node)
+
+    def _compile_Compare(self, node: ast.Compare):
+        operands = [node.left] + node.comparators
+        parts = [self.compile(operand) for operand in operands]
+        functions = [_as_function(part) for part in parts]
+        ops = []
+        for op in node.ops:
+            compare = _COMPARE.get(type(op))
+            if compare is None:
+                raise self.error(f"Unsupported comparison '{type(op).__name__}'", node)
+            ops.append(compare)
+
+        if len(ops) == 1:
+            compare, left, right = ops[0], functions[0], functions[1]
+            return self.fold(node, lambda env: compare(left(env), right(env)), parts)
+
+        pairs = list(zip(ops, functions[1:]))
+        first = functions[0]
+
+        def evaluate(env):
+            # 链式比较 a < b < c，短路求值
+            left = first(env)
+            for compare, function in pairs:
+                right = function(env)
+                if not compare(left, right):
+                    return False
+                left = right
+            return True
+        return self.fold(node, evaluate, parts)
+
+    def _compile_BoolOp(self, node: ast.BoolOp):
+        parts = [self.compile(value) for value in node.values]
+        functions = [_as_function(part) for part in parts]
+
+        if isinstance(node.op, ast.And):
+            def evaluate(env):
+                result = True
+                for function in functions:
+                    result = function(env)
+                    if not result:
+                        return result
+                return result
+        else:
+            def evaluate(env):
+                result = False
+                for function in functions:
+                    result = function(env)
+                    if result:
+                        return result
+                return result
+        return self.fold(node, evaluate, parts)
+
+    def _compile_UnaryOp(self, node: ast.UnaryOp):
+        apply = _UNARY.get(type(node.op))
+        if apply is None:
+            raise self.error(f"Unsupported operator '{type(node.op).__name__}'", node)
+        parts = [self.compile(node.operand)]
+        operand = _as_function(parts[0])
+        return self.fold(node, lambda env: apply(operand(env)), parts)
+
+    def _compile_BinOp(self, node: ast.BinOp):
+        apply = _BINARY.get(type(node.op))
+        if apply is None:
+            raise self.error(f"Unsupported operator '{type(node.op).__name__}'", node)
+        parts = [self.compile(node.left), self.compile(node.right)]
+        left, right = _as_function(parts[0]), _as_function(parts[1])
+        return self.fold(node, lambda env: apply(left(env), right(env)), parts)
+
+    def _compile_IfExp(self, node: ast.IfExp):
+        parts = [self.compile(node.test), self.compile(node.body), self.compile(node.orelse)]
+        test, body, orelse = (_as_function(part) for part in parts)
+        return self.fold(node, lambda env: body(env) if test(env) else orelse(env), parts)
+
+    def _compile_sequence(self, node, factory):
+        parts = [self.compile(element) for element in node.elts]
+        functions = [_as_function(part) for part in parts]
+        return self.fold(node, lambda env: factory(function(env) for function in functions), parts)
+
+    def _compile_List(self, node: ast.List):
+        return self._compile_sequence(node, list)
+
+    def _compile_Tuple(self, node: ast.Tuple):
+        return self._compile_sequence(node, tuple)
+
+    def _compile_Set(self, node: ast.Set):
+        return self._compile_sequence(node, frozenset)
+
+
+class Expression:
+    """预编译的条件表达式（替代 eval）
+
+    表达式只解析一次，编译为闭包，求值时不再经过 Python 编译器；只支持受限的语法：
+        比较与链式比较      ==  !=  <  <=  >  >=  in  not in  is  is not
+        布尔运算            and  or  not
+        访问字段            response.status / context['task_id'] / items[0] / text[:10]
+        算术                +  -  *  /  //  %（* 仅限数值）
+        函数 / 方法         len str int float bool abs min max round any all
+                            dict.get/keys/values/items  str.lower/upper/strip/startswith/endswith  count
+        字面量              数字、字符串、True/False/None（也可写 true/false/null）、列表 / 元组 / 集合
+    a.b 与 a['b'] 都按 dict 取键，取不到时为 None 而不是抛异常。
+    只能引用编译时声明的变量名，未知变量、私有属性、其它函数调用都在编译阶段报 ExpressionError。
+    """
+
+    __slots__ = ("source", "names", "_evaluate")
+
+    def __init__(self, source: str, names: Iterable[str] = ("context",)):
+        if not isinstance(source, str) or not source.strip():
+            raise ExpressionError(f"Invalid expression: {source!r}")
+        self.source = source
+        self.names = tuple(names)
+        try:
+            # 外包括号，允许 YAML 多行块（|）写法的表达式跨行
+            tree = ast.parse(f"(\n{source.strip()}\n)", mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression {source!r}: {e.msg}")
+        self._evaluate = _Compiler(source, self.names).function(tree)
+
+    @classmethod
+    def compile(cls, source: Union["Expression", str], names: Iterable[str] = ("context",)) -> "Expression":
+        """编译表达式；相同的表达式与变量名只编译一次（进程内缓存）"""
+        if isinstance(source, cls):
+            return source
+        if not isinstance(source, str):
+            raise ExpressionError(f"Invalid expression: {source!r}")
+        return _compile_cached(source, tuple(names))
+
+    def evaluate(self, variables: Dict[str, Any]) -> Any:
+        return self._evaluate(variables)
+
+    def test(self, variables: Dict[str, Any]) -> bool:
+        return bool(self._evaluate(variables))
+
+    def __repr__(self) -> str:
+        return f"Expression({self.source!r})"
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_cached(source: str, names: Tuple[str, ...]) -> Expression:
+    return Expression(source, names)
+
+
+def compile_conditions(nodes) -> Dict[str, Expression]:
+    """按节点配置 config.condition 预先编译断言 / 条件节点的表达式（语法错误时抛 ExpressionError）"""
+    conditions: Dict[str, Expression] = {}
+    for node in nodes:
+        config = node.config or {}
+        if (not config) and isinstance(getattr(node, "full_config", None), dict):
+            config = node.full_config.get("config", {}) or {}
+        if config.get("condition"):
+            conditions[node.node_id or node.id] = Expression.compile(config["condition"], ("context",))
+    return conditions
@@ -0,0 +1,288 @@
+import operator
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class ExtractionError(ValueError):
+    """提取路径语法错误"""
+
+
+# 路径片段：.name / [0] / [-1] / [*] / ['key.with.dots'] / [?(@.status == 'done')]
+_TOKEN_PATTERN = re.compile(r"""
+    \[(?P<index>-?\d+)\]
+  | \[(?P<star>\*)\]
+  | \[(?P<quoted>'[^']*'|"[^"]*")\]
+  | \[\?\((?P<filter>.*?)\)\]
+  | \.?(?P<name>[^.\[\]]+)
+""", re.X)
+
+_FILTER_PATTERN = re.compile(r"^\s*@(?P<field>(?:\.[^.\s=!<>]+)+)\s*(?:(?P<op>==|!=|>=|<=|>|<)\s*(?P<value>.+?))?\s*$")
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+_MISSING = object()
+
+
+class _Key:
+    """dict 取键；作用在列表上且键为整数时按下标取（兼容 items.0 写法）"""
+
+    __slots__ = ("name", "token", "index")
+    multi = False
+
+    def __init__(self, name: str):
+        self.name = name
+        self.token = ("key", name)
+        try:
+            self.index: Optional[int] = int(name)
+        except ValueError:
+            self.index = None
+
+    def get(self, value):
+        if isinstance(value, dict):
+            return value.get(self.name, _MISSING)
+        if isinstance(value, list) and self.index is not None and -len(value) <= self.index < len(value):
+            return value[self.index]
+        return _MISSING
+
+
+class _Index:
+    __slots__ = ("index", "token")
+    multi = False
+
+    def __init__(self, index: int):
+        self.index = index
+        self.token = ("index", index)
+
+    def get(self, value):
+        if isinstance(value, list) and -len(value) <= self.index < len(value):
+            return value[self.index]
+        return _MISSING
+
+
+class _Wildcard:
+    __slots__ = ()
+    multi = True
+    token = ("wildcard",)
+
+    def apply(self, value, out: List[Any]):
+        if isinstance(value, list):
+            out.extend(value)
+        elif isinstance(value, dict):
+            out.extend(value.values())
+
+
+class _Filter:
+    """[?(@.field)] 存在且为真；[?(@.field op literal)] 比较"""
+
+    __slots__ = ("fields", "compare", "operand", "token")
+    multi = True
+
+    def __init__(self, expression: str):
+        match = _FILTER_PATTERN.match(expression)
+        if not match:
+            raise ExtractionError(f"Invalid filter: [?({expression})]")
+        self.fields = match.group("field").split(".")[1:]
+        op = match.group("op")
+        self.compare = _OPERATORS[op] if op else None
+        self.operand = _parse_literal(match.group("value")) if op else None
+        self.token = ("filter", expression.strip())
+
+    def _field(self, item):
+        for name in self.fields:
+            if not isinstance(item, dict) or name not in item:
+                return _MISSING
+            item = item[name]
+        return item
+
+    def matches(self, item) -> bool:
+        value = self._field(item)
+        if value is _MISSING:
+            return False
+        if self.compare is None:
+            return bool(value)
+        try:
+            return bool(self.compare(value, self.operand))
+        except TypeError:
+            return False
+
+    def apply(self, value, out: List[Any]):
+        items = value if isinstance(value, list) else value.values() if isinstance(value, dict) else ()
+        out.extend(item for item in items if self.matches(item))
+
+
+def _parse_literal(text: str):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    lowered = text.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if lowered in ("null", "none"):
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise ExtractionError(f"Invalid filter literal: {text}")
+
+
+def compile_path(path: str) -> List[Any]:
+    """把路径字符串编译为访问步骤列表（可选前缀 $ / $.）"""
+    if not isinstance(path, str) or not path.strip():
+        raise ExtractionError(f"Invalid extraction path: {path!r}")
+
+    text = path.strip()
+    if text.startswith("$"):
+        text = text[1:]
+        if not text:
+            return []
+
+    steps = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if not match or match.end() == pos:
+            raise ExtractionError(f"Invalid extraction path {path!r} at position {pos}")
+        if match.group("index") is not None:
+            steps.append(_Index(int(match.group("index"))))
+        elif match.group("star"):
+            steps.append(_Wildcard())
+        elif match.group("quoted") is not None:
+            steps.append(_Key(match.group("quoted")[1:-1]))
+        elif match.group("filter") is not None:
+            steps.append(_Filter(match.group("filter")))
+        else:
+            name = match.group("name")
+            steps.append(_Wildcard() if name == "*" else _Key(name))
+        pos = match.end()
+    return steps
+
+
+class _TrieNode:
+    __slots__ = ("children", "outputs", "edges")
+
+    def __init__(self):
+        # token -> (step, 子节点)
+        self.children: Dict[Tuple, Tuple[Any, "_TrieNode"]] = {}
+        # 在此节点结束的路径：(输出字段名, 是否多值)
+        self.outputs: List[Tuple[str, bool]] = []
+        # 编译完成后固化的 (step, 子节点) 元组，遍历时避免字典迭代
+        self.edges: Tuple[Tuple[Any, "_TrieNode"], ...] = ()
+
+    def freeze(self):
+        self.edges = tuple(self.children.values())
+        for _, child in self.edges:
+            child.freeze()
+
+
+class Extractor:
+    """预编译的字段提取器
+
+    一个节点的所有提取路径编译为一棵前缀树，提取时对响应只遍历一次，
+    共享前缀（如 data.items[0].xxx 与 data.items[0].yyy）只访问一次。
+
+    路径语法：
+        data.task_id                 dict 取键
+        data.items[0].id / items.0   列表下标（支持负数）
+        data.items[*].id             通配，结果为列表
+        data['x.y']                  含特殊字符的键
+        data.items[?(@.status == 'done')].id   过滤，结果为列表
+    单值路径取不到时不输出该字段；多值路径没有匹配时同样不输出。
+    """
+
+    def __init__(self, extraction: Optional[Dict[str, str]] = None):
+        self.extraction = dict(extraction or {})
+        self._root = _TrieNode()
+        for key, path in self.extraction.items():
+            node = self._root
+            multi = False
+            for step in compile_path(path):
+                multi = multi or step.multi
+                child = node.children.get(step.token)
+                if child is None:
+                    child = node.children[step.token] = (step, _TrieNode())
+                node = child[1]
+            node.outputs.append((key, multi))
+        self._root.freeze()
+
+    @classmethod
+    def compile(cls, extraction) -> "Extractor":
+        if isinstance(extraction, cls):
+            return extraction
+        return cls(extraction)
+
+    def __bool__(self) -> bool:
+        return bool(self.extraction)
+
+    def extract(self, response: Any) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        if self.extraction:
+            self._walk_one(self._root, response, result)
+        return result
+
+    def _walk_one(self, node: _TrieNode, value: Any, result: Dict[str, Any]):
+        """单值路径（还未经过通配 / 过滤）"""
+        if value is not None:
+            for key, _ in node.outputs:
+                result[key] = value
+
+        is_dict = isinstance(value, dict)
+        for step, child in node.edges:
+            if is_dict and step.__class__ is _Key:
+                # 最常见的情况：dict 取键，内联以省去一次方法调用
+                next_value = value.get(step.name, _MISSING)
+            elif step.multi:
+                matched: List[Any] = []
+                step.apply(value, matched)
+                if matched:
+                    self._walk_many(child, matched, result)
+                continue
+            else:
+                next_value = step.get(value)
+            if next_value is not _MISSING:
+                if child.edges:
+                    self._walk_one(child, next_value, result)
+                elif next_value is not None:
+                    for key, _ in child.outputs:
+                        result[key] = next_value
+
+    def _walk_many(self, node: _TrieNode, values: List[Any], result: Dict[str, Any]):
+        """多值路径：每一步作用于所有当前值"""
+        for key, _ in node.outputs:
+            result[key] = list(values)
+
+        for step, child in node.edges:
+            matched: List[Any] = []
+            if step.multi:
+                for value in values:
+                    step.apply(value, matched)
+            else:
+                for value in values:
+                    next_value = step.get(value)
+                    if next_value is not _MISSING:
+                        matched.append(next_value)
+            if matched:
+                self._walk_many(child, matched, result)
+
+
+def compile_extractors(nodes) -> Dict[str, Extractor]:
+    """按节点配置 config.extraction 预先编译各节点的提取器（路径非法时抛 ExtractionError）"""
+    extractors: Dict[str, Extractor] = {}
+    for node in nodes:
+        config = node.config or {}
+        if (not config) and isinstance(getattr(node, "full_config", None), dict):
+            config = node.full_config.get("config", {}) or {}
+        if config.get("extraction"):
+            extractors[node.node_id or node.id] = Extractor.compile(config["extraction"])
+    return extractors
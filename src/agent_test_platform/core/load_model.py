@@ -0,0 +1,242 @@
+import asyncio
+import math
+import random
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Iterator, Callable, Awaitable, Set
+from agent_test_platform.config.logger import logger
+from agent_test_platform.core.run_control import RunController, RunCancelled
+
+
+class LoadModel:
+    """负载模型"""
+    CLOSED = "closed"  # 固定并发：N 个用户受 Semaphore(concurrency) 约束
+    OPEN = "open"      # 到达率：按目标到达速率启动用户，与响应时间无关
+
+
+ARRIVAL_TYPES = ("constant", "poisson", "ramp", "step")
+
+
+@dataclass
+class ArrivalConfig:
+    """到达率配置（open 模型）"""
+
+    type: str = "constant"          # constant, ramp, step, poisson
+    rate: float = 1.0               # constant / poisson：用户/秒
+    start_rate: float = 0.0         # ramp：起始速率
+    end_rate: float = 1.0           # ramp：结束速率
+    duration: float = 60.0          # ramp：爬坡时长（秒），之后保持 end_rate
+    stages: List[Dict[str, float]] = field(default_factory=list)  # step：[{rate, duration}, ...]
+    max_in_flight: int = 100        # 同时在途的用户上限，超过则丢弃该次到达
+    late_tolerance_ms: float = 50.0  # 实际启动晚于计划超过该值记为迟到
+    seed: Optional[int] = None      # poisson 随机种子（便于复现）
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ArrivalConfig":
+        data = data or {}
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+        config = cls(**known)
+        config.validate()
+        return config
+
+    def validate(self):
+        """提前校验配置（到达时间在运行中才惰性生成，非法配置需在创建运行时报错）"""
+        arrival_type = (self.type or "constant").lower()
+        if arrival_type not in ARRIVAL_TYPES:
+            raise ValueError(f"Unknown arrival type: {self.type}")
+        if self.max_in_flight <= 0:
+            raise ValueError("arrival.max_in_flight must be > 0")
+        if arrival_type in ("constant", "poisson"):
+            if self.rate <= 0:
+                raise ValueError("arrival rate must be > 0")
+        elif arrival_type == "ramp":
+            if self.end_rate <= 0 or self.duration <= 0:
+                raise ValueError("ramp requires end_rate > 0 and duration > 0")
+        elif arrival_type == "step":
+            stages = self.stages or [{"rate": self.rate, "duration": 0}]
+            for stage in stages:
+                if float(stage.get("rate", 0)) < 0 or float(stage.get("duration", 0)) < 0:
+                    raise ValueError("step stages require rate >= 0 and duration >= 0")
+            if float(stages[-1].get("rate", 0)) <= 0:
+                raise ValueError("the last step stage must have rate > 0")
+
+
+@dataclass
+class ArrivalStats:
+    """open 模型运行统计"""
+
+    scheduled: int = 0
+    launched: int = 0
+    dropped: int = 0           # 到达时在途用户已满
+    late: int = 0              # 实际启动晚于计划时间
+    max_lag_ms: float = 0.0
+    successful: int = 0
+    failed: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ArrivalSchedule:
+    """生成第 k 个用户相对开始时刻的计划到达时间（秒）"""
+
+    def __init__(self, config: ArrivalConfig):
+        self.config = config
+
+    def offsets(self) -> Iterator[float]:
+        """配置需已通过 ArrivalConfig.validate()（from_dict 会调用）"""
+        arrival_type = (self.config.type or "constant").lower()
+        if arrival_type == "constant":
+            return self._constant(self.config.rate)
+        elif arrival_type == "poisson":
+            return self._poisson(self.config.rate)
+        elif arrival_type == "ramp":
+            return self._ramp()
+        elif arrival_type == "step":
+            return self._step()
+        raise ValueError(f"Unknown arrival type: {self.config.type}")
+
+    @staticmethod
+    def _constant(rate: float, start: float = 0.0) -> Iterator[float]:
+        k = 0
+        while True:
+            yield start + k / rate
+            k += 1
+
+    def _poisson(self, rate: float) -> Iterator[float]:
+        rng = random.Random(self.config.seed)
+        t = 0.0
+        while True:
+            yield t
+            t += rng.expovariate(rate)
+
+    def _ramp(self) -> Iterator[float]:
+        """线性爬坡：r(t) = r0 + (r1 - r0) * t / D，累计到达数 N(t) 反解得到第 k 个到达时刻"""
+        r0 = max(0.0, self.config.start_rate)
+        r1 = self.config.end_rate
+        duration = self.config.duration
+
+        slope = (r1 - r0) / duration
+        ramp_arrivals = (r0 + r1) * duration / 2
+        k = 0
+        while k < ramp_arrivals:
+            if abs(slope) < 1e-12:
+                yield k / r0
+            else:
+                # slope/2 * t^2 + r0 * t - k = 0
+                yield (-r0 + math.sqrt(r0 * r0 + 2 * slope * k)) / slope
+            k += 1
+
+        for offset in self._constant(r1, start=duration + (k - ramp_arrivals) / r1):
+            yield offset
+
+    def _step(self) -> Iterator[float]:
+        """阶梯：依次执行各阶段的恒定速率，最后一个阶段的速率持续保持"""
+        stages = self.config.stages or [{"rate": self.config.rate, "duration": 0}]
+        stage_start = 0.0
+        next_offset = 0.0
+        for index, stage in enumerate(stages):
+            rate = float(stage.get("rate", 0))
+            stage_end = stage_start + float(stage.get("duration", 0))
+            is_last = index == len(stages) - 1
+            if rate > 0:
+                next_offset = max(next_offset, stage_start)
+                while is_last or next_offset < stage_end:
+                    yield next_offset
+                    next_offset += 1 / rate
+            stage_start = stage_end
+
+
+class OpenModelRunner:
+    """按到达率启动虚拟用户，在途用户数受 max_in_flight 限制"""
+
+    def __init__(self, config: ArrivalConfig):
+        self.config = config
+        self.schedule = ArrivalSchedule(config)
+        self.stats = ArrivalStats()
+
+    async def run(
+        self,
+        total_users: int,
+        run_user: Callable[[int], Awaitable[bool]],
+        controller: Optional[RunController] = None,
+    ) -> ArrivalStats:
+        """
+        启动 total_users 次到达
+
+        Args:
+            total_users: 计划到达的用户总数
+            run_user: 执行单个用户的协程函数，返回是否成功
+            controller: 运行控制；暂停期间不产生到达（之后的到达整体顺延），取消后停止到达
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        in_flight: Set[asyncio.Task] = set()
+        tolerance = self.config.late_tolerance_ms
+        paused_total = controller.paused_seconds if controller is not None else 0.0
+
+        def on_done(task: asyncio.Task):
+            in_flight.discard(task)
+            if task.cancelled():
+                self.stats.failed += 1
+            elif task.exception() is not None or task.result() is not True:
+                self.stats.failed += 1
+            else:
+                self.stats.successful += 1
+
+        try:
+            for user_index, offset in zip(range(total_users), self.schedule.offsets()):
+                due = start + offset
+                if not await self._wait_until(loop, due, controller):
+                    break
+                if controller is not None and controller.paused_seconds > paused_total:
+                    # 暂停期间的到达不补发，之后的到达整体顺延暂停时长
+                    shift = controller.paused_seconds - paused_total
+                    paused_total = controller.paused_seconds
+                    start += shift
+                    due += shift
+                    if not await self._wait_until(loop, due, controller):
+                        break
+
+                self.stats.scheduled += 1
+
+                lag_ms = (loop.time() - due) * 1000
+                if lag_ms > tolerance:
+                    self.stats.late += 1
+                if lag_ms > self.stats.max_lag_ms:
+                    self.stats.max_lag_ms = lag_ms
+
+                if len(in_flight) >= self.config.max_in_flight:
+                    self.stats.dropped += 1
+                    continue
+
+                task = asyncio.create_task(
+                    controller.run(run_user(user_index)) if controller is not None else run_user(user_index)
+                )
+                in_flight.add(task)
+                task.add_done_callback(on_done)
+                self.stats.launched += 1
+
+            if in_flight:
+                await asyncio.gather(*list(in_flight), return_exceptions=True)
+        finally:
+            for task in list(in_flight):
+                if not task.done():
+                    task.cancel()
+
+        logger.info("Open model arrivals finished", **self.stats.to_dict())
+        return self.stats
+
+    @staticmethod
+    async def _wait_until(loop, due: float, controller: Optional[RunController]) -> bool:
+        """等待到 due 时刻并通过运行控制的准入（暂停时等待恢复）；运行已取消返回 False"""
+        delay = due - loop.time()
+        if controller is None:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return True
+        if delay > 0:
+            try:
+                await controller.sleep(asyncio.sleep(delay))
+            except RunCancelled:
+                return False
+        return await controller.admit()
@@ -0,0 +1,542 @@
+import asyncio
+import math
+import time
+from typing import Dict, Any, Optional, List, Tuple, Iterable
+from agent_test_platform.config.logger import logger
+from agent_test_platform.config.settings import settings
+from agent_test_platform.models.node_based import TestSummary, TestRun, RunMetricPoint
+
+
+class LatencyHistogram:
+    """有界内存、可合并的延迟直方图（HDR 风格的对数-线性分桶）
+
+    以微秒为单位分桶：小于 2^SUB_BUCKET_BITS 的值逐个计数，更大的值每个 2 的幂区间
+    再等分为 2^(SUB_BUCKET_BITS-1) 个桶，相对误差不超过 1/64。1 小时以内的延迟
+    最多约 1800 个桶，与样本数量无关；两个直方图按桶相加即可合并。
+    """
+
+    SUB_BUCKET_BITS = 7
+    _HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    @classmethod
+    def _index(cls, micros: int) -> int:
+        if micros < (1 << cls.SUB_BUCKET_BITS):
+            return micros
+        shift = micros.bit_length() - cls.SUB_BUCKET_BITS
+        return shift * cls._HALF + (micros >> shift)
+
+    @classmethod
+    def _bounds(cls, index: int):
+        """桶对应的微秒区间 [low, high]"""
+        if index < (1 << cls.SUB_BUCKET_BITS):
+            return index, index
+        shift = index // cls._HALF - 1
+        mantissa = index % cls._HALF + cls._HALF
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value_ms: float, count: int = 1):
+        value_ms = max(0.0, float(value_ms))
+        index = self._index(int(round(value_ms * 1000)))
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value_ms * count
+        if self.min is None or value_ms < self.min:
+            self.min = value_ms
+        if self.max is None or value_ms > self.max:
+            self.max = value_ms
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def percentile(self, p: float) -> Optional[float]:
+        """第 p 百分位（毫秒），取所在桶的中点并限制在 [min, max] 内"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                low, high = self._bounds(index)
+                value = (low + high) / 2 / 1000
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "LatencyHistogram":
+        histogram = cls()
+        if not data:
+            return histogram
+        histogram.buckets = {int(index): count for index, count in (data.get("buckets") or {}).items()}
+        histogram.count = data.get("count", 0)
+        histogram.total = data.get("sum", 0.0)
+        histogram.min = data.get("min")
+        histogram.max = data.get("max")
+        return histogram
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+class RequestStats:
+    """一组请求（整体 / 某节点 / 某接口）的计数与延迟分布"""
+
+    def __init__(self, key: str, name: Optional[str] = None):
+        self.key = key
+        self.name = name
+        self.histogram = LatencyHistogram()
+        self.success = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def total(self) -> int:
+        return self.success + self.failed
+
+    def record(self, success: bool, duration_ms: Optional[float] = None, error: Optional[str] = None):
+        if success:
+            self.success += 1
+        else:
+            self.failed += 1
+            if error:
+                self.last_error = error[:500]
+        if duration_ms is not None:
+            self.histogram.record(duration_ms)
+
+    def latency(self) -> Dict[str, Optional[float]]:
+        histogram = self.histogram
+        return {
+            "avgResponseTime": _round(histogram.mean),
+            "minResponseTime": _round(histogram.min),
+            "maxResponseTime": _round(histogram.max),
+            "p50ResponseTime": _round(histogram.percentile(50)),
+            "p95ResponseTime": _round(histogram.percentile(95)),
+            "p99ResponseTime": _round(histogram.percentile(99)),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "success": self.success,
+            "failed": self.failed,
+            "successRate": round(self.success / self.total * 100, 2) if self.total else 0,
+            **self.latency(),
+        }
+
+    def to_state(self) -> List[Any]:
+        """可合并的紧凑表示（可 JSON 序列化），用于 worker 回传增量"""
+        return [self.name, self.success, self.failed, self.last_error, self.histogram.to_dict()]
+
+    def merge_state(self, state: List[Any]):
+        name, success, failed, last_error, histogram = state
+        if name and not self.name:
+            self.name = name
+        self.success += success
+        self.failed += failed
+        if last_error:
+            self.last_error = last_error
+        self.histogram.merge(LatencyHistogram.from_dict(histogram))
+
+
+class SecondBucket:
+    """某节点在某一秒内的请求统计"""
+
+    __slots__ = ("count", "errors", "histogram")
+
+    def __init__(self, count: int = 0, errors: int = 0, histogram: Optional[LatencyHistogram] = None):
+        self.count = count
+        self.errors = errors
+        self.histogram = histogram or LatencyHistogram()
+
+    def merge(self, other: "SecondBucket"):
+        self.count += other.count
+        self.errors += other.errors
+        self.histogram.merge(other.histogram)
+
+
+class TimeSeries:
+    """按 (秒, 节点) 累积的内存时间序列，已结束的秒由 MetricsRegistry 定期取出落库"""
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[int, str], SecondBucket] = {}
+
+    def record(self, node_id: str, success: bool, duration_ms: Optional[float] = None, now: Optional[float] = None):
+        key = (int(now if now is not None else time.time()), node_id)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = SecondBucket()
+        bucket.count += 1
+        if not success:
+            bucket.errors += 1
+        if duration_ms is not None:
+            bucket.histogram.record(duration_ms)
+
+    def closed(self, before: Optional[int] = None) -> List[Tuple[int, str]]:
+        """早于 before 秒（不再有新数据）的桶；before 为 None 时返回全部"""
+        return [key for key in self.buckets if before is None or key[0] < before]
+
+
+def downsample(
+    points: Iterable[Tuple[int, SecondBucket]],
+    start: int,
+    end: int,
+    step: int,
+) -> List[Dict[str, Any]]:
+    """把按秒的数据合并到 step 秒的窗口中；没有数据的窗口补 0"""
+    windows: Dict[int, SecondBucket] = {}
+    for ts, bucket in points:
+        if ts < start or ts > end:
+            continue
+        window = start + (ts - start) // step * step
+        merged = windows.get(window)
+        if merged is None:
+            merged = windows[window] = SecondBucket()
+        merged.merge(bucket)
+
+    result = []
+    for window in range(start, end + 1, step):
+        bucket = windows.get(window) or SecondBucket()
+        histogram = bucket.histogram
+        result.append({
+            "ts": window,
+            "count": bucket.count,
+            "errors": bucket.errors,
+            "throughput": round(bucket.count / step, 3),
+            "errorRate": round(bucket.errors / bucket.count * 100, 2) if bucket.count else 0,
+            "avgResponseTime": _round(histogram.mean),
+            "p50ResponseTime": _round(histogram.percentile(50)),
+            "p95ResponseTime": _round(histogram.percentile(95)),
+            "p99ResponseTime": _round(histogram.percentile(99)),
+        })
+    return result
+
+
+class RunMetrics:
+    """单次测试运行的在线统计，由执行器在每次请求 / 节点完成时喂入"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.timeseries = TimeSeries()
+        self.requests = RequestStats("total")
+        self.nodes: Dict[str, RequestStats] = {}
+        self.endpoints: Dict[str, RequestStats] = {}
+        self.success_users = 0
+        self.failed_users = 0
+
+    def record(
+        self,
+        node_id: str,
+        node_name: Optional[str],
+        success: bool,
+        duration_ms: Optional[float] = None,
+        endpoint: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        """
+        记录一次节点执行
+
+        Args:
+            duration_ms: HTTP 请求耗时；非 HTTP 节点（断言等）为 None，只计入成功 / 失败
+            endpoint: 请求的接口路径，用于按接口聚合
+        """
+        node_stats = self.nodes.get(node_id)
+        if node_stats is None:
+            node_stats = self.nodes[node_id] = RequestStats(node_id, node_name)
+        node_stats.record(success, duration_ms, error)
+        self.timeseries.record(node_id, success, duration_ms)
+
+        if duration_ms is None:
+            return
+        self.requests.record(success, duration_ms, error)
+        if endpoint:
+            endpoint_stats = self.endpoints.get(endpoint)
+            if endpoint_stats is None:
+                endpoint_stats = self.endpoints[endpoint] = RequestStats(endpoint)
+            endpoint_stats.record(success, duration_ms, error)
+
+    def record_request(
+        self,
+        endpoint: str,
+        success: bool,
+        duration_ms: float,
+        error: Optional[str] = None,
+    ):
+        """记录不属于某个节点结果的辅助请求（如任务状态轮询），只计入接口统计"""
+        endpoint_stats = self.endpoints.get(endpoint)
+        if endpoint_stats is None:
+            endpoint_stats = self.endpoints[endpoint] = RequestStats(endpoint)
+        endpoint_stats.record(success, duration_ms, error)
+
+    def record_user(self, success: bool):
+        if success:
+            self.success_users += 1
+        else:
+            self.failed_users += 1
+
+    def take_delta(self) -> Dict[str, Any]:
+        """取出上次调用以来累积的统计并清空（worker 进程定期回传给协调方）"""
+        delta = {
+            "requests": self.requests.to_state() if self.requests.total else None,
+            "nodes": {key: stats.to_state() for key, stats in self.nodes.items()},
+            "endpoints": {key: stats.to_state() for key, stats in self.endpoints.items()},
+            "series": [
+                [ts, node_id, bucket.count, bucket.errors, bucket.histogram.to_dict()]
+                for (ts, node_id), bucket in self.timeseries.buckets.items()
+            ],
+            "users": [self.success_users, self.failed_users],
+        }
+        self.timeseries = TimeSeries()
+        self.requests = RequestStats("total")
+        self.nodes = {}
+        self.endpoints = {}
+        self.success_users = 0
+        self.failed_users = 0
+        return delta
+
+    def merge_delta(self, delta: Dict[str, Any]):
+        """合并 worker 回传的增量（take_delta 的结果）"""
+        if delta.get("requests"):
+            self.requests.merge_state(delta["requests"])
+        for target, key_stats in ((self.nodes, delta.get("nodes")), (self.endpoints, delta.get("endpoints"))):
+            for key, state in (key_stats or {}).items():
+                stats = target.get(key)
+                if stats is None:
+                    stats = target[key] = RequestStats(key)
+                stats.merge_state(state)
+        buckets = self.timeseries.buckets
+        for ts, node_id, count, errors, histogram in delta.get("series") or ():
+            incoming = SecondBucket(count, errors, LatencyHistogram.from_dict(histogram))
+            bucket = buckets.get((ts, node_id))
+            if bucket is None:
+                buckets[(ts, node_id)] = incoming
+            else:
+                bucket.merge(incoming)
+        success, failed = delta.get("users") or (0, 0)
+        self.success_users += success
+        self.failed_users += failed
+
+    def node_stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"nodeId": stats.key, "nodeName": stats.name, **stats.to_dict()}
+            for stats in self.nodes.values()
+        ]
+
+    def failed_nodes(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "nodeId": stats.key,
+                "nodeName": stats.name,
+                "failedCount": stats.failed,
+                "failureRate": round(stats.failed / stats.total * 100, 2),
+                "lastError": stats.last_error,
+            }
+            for stats in self.nodes.values()
+            if stats.failed
+        ]
+
+    def endpoint_stats(self) -> List[Dict[str, Any]]:
+        return [{"endpoint": stats.key, **stats.to_dict()} for stats in self.endpoints.values()]
+
+    def apply_to(self, summary: TestSummary):
+        """把当前统计写入 TestSummary 对象"""
+        total_users = self.success_users + self.failed_users
+        latency = self.requests.latency()
+
+        summary.total_users = total_users
+        summary.success_users = self.success_users
+        summary.failed_users = self.failed_users
+        summary.success_rate = round(self.success_users / total_users * 100, 2) if total_users else 0
+        summary.avg_response_time = latency["avgResponseTime"]
+        summary.min_response_time = latency["minResponseTime"]
+        summary.max_response_time = latency["maxResponseTime"]
+        summary.p50_response_time = latency["p50ResponseTime"]
+        summary.p95_response_time = latency["p95ResponseTime"]
+        summary.p99_response_time = latency["p99ResponseTime"]
+        summary.failed_nodes = self.failed_nodes()
+        summary.node_stats = self.node_stats()
+        summary.endpoint_stats = self.endpoint_stats()
+
+
+class MetricsRegistry:
+    """运行中测试的统计登记表：run_id -> RunMetrics
+
+    后台任务每 TIMESERIES_FLUSH_INTERVAL 秒把已结束的秒级数据写入 run_metric_points；
+    查询时把库中数据与内存中尚未落库的数据合并。
+    """
+
+    def __init__(self, db, flush_interval: Optional[float] = None):
+        self.db = db
+        self.flush_interval = flush_interval or settings.TIMESERIES_FLUSH_INTERVAL
+        self.runs: Dict[str, RunMetrics] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # 保证查询时「内存快照 + 查库」与「落库 + 移出内存」互斥，避免重复或遗漏
+        self._series_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self, run_id: str) -> RunMetrics:
+        run_metrics = self.runs.get(run_id)
+        if run_metrics is None:
+            run_metrics = self.runs[run_id] = RunMetrics(run_id)
+            self._locks[run_id] = asyncio.Lock()
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        return run_metrics
+
+    def get(self, run_id: str) -> Optional[RunMetrics]:
+        return self.runs.get(run_id)
+
+    async def _flush_loop(self):
+        while self.runs:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_timeseries(before=int(time.time()))
+            except Exception as e:
+                logger.error(f"Failed to flush metric time series: {e}")
+
+    async def flush_timeseries(self, run_id: Optional[str] = None, before: Optional[int] = None):
+        """把已结束的秒级数据写入数据库（run_id 为 None 时处理所有运行）"""
+        async with self._series_lock:
+            runs = [self.runs[run_id]] if run_id in self.runs else ([] if run_id else list(self.runs.values()))
+            points = []
+            drained = []
+            for run_metrics in runs:
+                series = run_metrics.timeseries
+                for key in series.closed(before):
+                    # 落库前先移出内存：写库期间 worker 增量（merge_delta）若落到同一秒，
+                    # 会进入新建的桶，下次再写入，不会随本批次一起被丢掉
+                    bucket = series.buckets.pop(key)
+                    points.append(RunMetricPoint(
+                        test_run_id=run_metrics.run_id,
+                        ts=key[0],
+                        node_id=key[1],
+                        count=bucket.count,
+                        errors=bucket.errors,
+                        histogram=bucket.histogram.to_dict() if bucket.histogram.count else None,
+                    ))
+                    drained.append((series, key, bucket))
+            if not points:
+                return
+            try:
+                await self.db.create_many(points)
+            except Exception:
+                # 写入失败：把取出的桶合并回内存，下次重试
+                for series, key, bucket in drained:
+                    current = series.buckets.get(key)
+                    if current is None:
+                        series.buckets[key] = bucket
+                    else:
+                        current.merge(bucket)
+                raise
+
+    async def query_timeseries(
+        self,
+        run_id: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        step: Optional[int] = None,
+        node_id: Optional[str] = None,
+        max_points: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        查询运行的时间序列并在服务端降采样
+
+        Args:
+            start / end: Unix 秒，闭区间；缺省时取数据的首尾
+            step: 窗口大小（秒）；缺省时按 max_points 自动选择
+            node_id: 只看某个节点；缺省时合并所有节点
+        """
+        max_points = max_points or settings.TIMESERIES_MAX_POINTS
+        async with self._series_lock:
+            points: List[Tuple[int, SecondBucket]] = []
+            run_metrics = self.runs.get(run_id)
+            if run_metrics is not None:
+                for (ts, bucket_node_id), bucket in run_metrics.timeseries.buckets.items():
+                    if node_id is None or bucket_node_id == node_id:
+                        copy = SecondBucket()
+                        copy.merge(bucket)
+                        points.append((ts, copy))
+            rows = await self.db.query_metric_points(run_id, start, end, node_id)
+
+        for row in rows:
+            points.append((row.ts, SecondBucket(row.count or 0, row.errors or 0, LatencyHistogram.from_dict(row.histogram))))
+
+        if not points:
+            return {"runId": run_id, "nodeId": node_id, "start": start, "end": end, "step": step or 1, "points": []}
+
+        start = start if start is not None else min(ts for ts, _ in points)
+        end = end if end is not None else max(ts for ts, _ in points)
+        if step is None:
+            step = max(1, math.ceil((end - start + 1) / max_points))
+        else:
+            # 显式步长也受 max_points 约束，避免超大窗口一次返回过多点
+            step = max(step, math.ceil((end - start + 1) / max_points))
+
+        return {
+            "runId": run_id,
+            "nodeId": node_id,
+            "start": start,
+            "end": end,
+            "step": step,
+            "points": downsample(points, start, end, step),
+        }
+
+    async def materialize(self, run_id: str) -> Optional[TestSummary]:
+        """把运行中的统计写入 test_summaries（每个运行一行，重复调用则更新）"""
+        run_metrics = self.runs.get(run_id)
+        if run_metrics is None:
+            return None
+
+        async with self._locks[run_id]:
+            summaries = await self.db.query_by_field(TestSummary, "test_run_id", run_id)
+            if summaries:
+                summary = summaries[0]
+                run_metrics.apply_to(summary)
+                return await self.db.update(summary)
+
+            # 汇总只挂在 node_based 的 TestRun 上
+            if not await self.db.get(TestRun, run_id):
+                return None
+            summary = TestSummary(test_run_id=run_id)
+            run_metrics.apply_to(summary)
+            return await self.db.create(summary)
+
+    async def finish(self, run_id: str) -> Optional[TestSummary]:
+        """运行结束：时间序列与汇总最终落库并释放内存"""
+        try:
+            await self.flush_timeseries(run_id)
+            return await self.materialize(run_id)
+        except Exception as e:
+            logger.error(f"Failed to materialize test summary: {e}", run_id=run_id)
+            return None
+        finally:
+            self.runs.pop(run_id, None)
+            self._locks.pop(run_id, None)
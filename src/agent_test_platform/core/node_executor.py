@@ -1,7 +1,8 @@
 
 import asyncio
+import heapq
 import time
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Union
 from datetime import datetime
 from agent_test_platform.config.logger import logger
 from agent_test_platform.http_client.client import AgentHTTPClient
@@ -10,6 +11,14 @@ from agent_test_platform.models.node_based import (
 )
 from agent_test_platform.models.node_config_model import NodeConfig
 from agent_test_platform.storage.database import Database
+from agent_test_platform.core.scheduling import ThinkTime, UserScheduler
+from agent_test_platform.core.metrics import RunMetrics
+from agent_test_platform.core.templates import PayloadTemplate
+from agent_test_platform.core.extraction import Extractor
+from agent_test_platform.core.expressions import Expression
+from agent_test_platform.core.execution_plan import ExecutionPlan, node_key
+from agent_test_platform.core.polling import PollingHub, poll_task
+from agent_test_platform.core.run_control import RunController, RunCancelled
 
 
 class NodeDAGExecutor:
@@ -25,16 +34,40 @@ class NodeDAGExecutor:
         db: Database,
         http_client: AgentHTTPClient,
         on_event_callback=None,
+        scheduler: Optional[UserScheduler] = None,
+        default_think_time: Optional[ThinkTime] = None,
+        metrics: Optional[RunMetrics] = None,
+        plan: Optional[ExecutionPlan] = None,
+        max_parallel_nodes: int = 1,
+        poller: Optional[PollingHub] = None,
+        controller: Optional[RunController] = None,
     ):
         self.user_index = user_index
         self.user_id = user_id
         self.scenario = scenario
-        self.nodes = nodes
+        # 场景执行计划（拓扑序 / 依赖位图 / 预编译配置），由编排器编译一次供所有用户共享
+        self.plan = plan or ExecutionPlan.compile(nodes)
+        self.nodes = self.plan.nodes
+        # 同一用户内同时执行的节点数上限；1 表示按拓扑序串行执行
+        self.max_parallel_nodes = max(1, int(max_parallel_nodes or 1))
         self.test_run_id = test_run_id
         self.db = db
         self.http_client = http_client
         self.on_event_callback = on_event_callback
         
+        # 思考时间：节点级配置（config.think_time）优先，否则动作节点使用运行级默认值
+        self.scheduler = scheduler
+        self.default_think_time = default_think_time
+        
+        # 运行级在线统计（延迟分布 / 成功失败计数）
+        self.metrics = metrics
+        
+        # 运行级共享轮询器（polling 节点配置了 batch 时合并各用户的状态查询）
+        self.poller = poller
+        
+        # 运行控制（暂停 / 取消）：节点之前检查，思考时间与轮询等待可被取消打断
+        self.controller = controller
+        
         # 用户上下文
         self.user_context: Dict[str, Any] = {
             'token': None,
@@ -42,22 +75,26 @@ class NodeDAGExecutor:
             'conversation_history': [],
         }
         
-        # 节点执行状态追踪
+        # 节点执行状态追踪（未出现的节点视为 PENDING）
         self.node_states: Dict[str, NodeStatus] = {}
         self.node_executions: Dict[str, NodeExecution] = {}
+        # 失败 / 跳过节点的位图（位置同 plan.order），依赖检查时与 plan.dependency_masks 按位与
+        self._blocked = 0
+        # 上下文字段 -> 最后写入它的节点位置；并行时按拓扑序决定覆盖关系，与完成先后无关
+        self._context_owners: Dict[str, int] = {}
         
         self.start_time = None
         self.end_time = None
         self.user_execution: Optional[UserExecution] = None
 
     def _node_id(self, node: NodeConfig) -> str:
-        return node.node_id or node.id
-
-    def _node_ids(self) -> List[str]:
-        return [self._node_id(n) for n in self.nodes]
+        return node_key(node)
 
     def _get_node(self, node_id: str) -> Optional[NodeConfig]:
-        return next((n for n in self.nodes if self._node_id(n) == node_id), None)
+        return self.plan.get_node(node_id)
+
+    def _node_config(self, node: NodeConfig) -> Dict[str, Any]:
+        return self.plan.configs.get(self._node_id(node)) or {}
     
     async def run(self) -> bool:
         """运行完整的用户测试"""
@@ -71,46 +108,14 @@ class NodeDAGExecutor:
             if not self.user_execution:
                 return False
             
-            # 2. 初始化节点状态
-            for node_id in self._node_ids():
-                self.node_states[node_id] = NodeStatus.PENDING
-            
-            # 3. 构建依赖图并拓扑排序
-            execution_order = self._topological_sort()
-            if not execution_order:
-                logger.error("Failed to sort nodes topologically")
-                return False
-            
-            # 4. 执行节点
-            for node_id in execution_order:
-                node = self._get_node(node_id)
-                if not node:
-                    continue
-                
-                # 检查依赖是否都已完成
-                if not self._check_dependencies(node_id):
-                    logger.warning(f"Skipping node {node_id} due to failed dependency")
-                    self.node_states[node_id] = NodeStatus.SKIPPED
-                    continue
-                
-                # 推送节点启动事件
-                await self._send_event(
-                    "node_started",
-                    {
-                        "userId": self.user_id,
-                        "nodeId": node_id,
-                        "nodeName": node.node_name,
-                    },
-                )
-                
-                # 执行节点
-                success = await self._execute_node(node)
-                
-                if not success:
-                    logger.warning(f"Node {node_id} failed")
-                    # 失败但继续执行其他节点（可根据需要修改）
+            # 2. 执行节点：串行按拓扑序，并行模式下就绪节点并发执行
+            if self.max_parallel_nodes > 1:
+                await self._run_parallel()
+            else:
+                for position in range(len(self.plan)):
+                    await self._run_node(position)
             
-            # 5. 更新用户状态
+            # 3. 更新用户状态
             await self._finalize_user(success=True)
             
             logger.info(
@@ -119,6 +124,16 @@ class NodeDAGExecutor:
             )
             return True
         
+        except RunCancelled:
+            logger.info(f"User {self.user_index} cancelled", run_id=self.test_run_id)
+            await self._finalize_user(success=False)
+            return False
+        
+        except asyncio.CancelledError:
+            # 取消时在途请求超过排空时限被强制结束，仍记录执行结果
+            await self._finalize_user(success=False)
+            raise
+        
         except Exception as e:
             logger.error(f"User {self.user_index} failed: {e}")
             await self._finalize_user(success=False)
@@ -127,59 +142,100 @@ class NodeDAGExecutor:
         finally:
             self.end_time = time.time()
     
-    # ============================================================
-    # 拓扑排序与依赖检查
-    # ============================================================
-    
-    def _topological_sort(self) -> List[str]:
-        """使用 Kahn 算法进行拓扑排序"""
+    async def _run_node(self, position: int):
+        """检查依赖并执行拓扑序中第 position 个节点，之后还有节点时进入思考时间"""
+        node = self.plan.nodes[position]
+        node_id = self.plan.order[position]
+        
+        if self.controller:
+            await self.controller.checkpoint()
+        
+        # 检查依赖是否都已完成
+        if not self._check_dependencies(node_id):
+            logger.warning(f"Skipping node {node_id} due to failed dependency")
+            self.node_states[node_id] = NodeStatus.SKIPPED
+            self._blocked |= 1 << position
+            return
+        
+        # 推送节点启动事件
+        await self._send_event(
+            "node_started",
+            {
+                "userId": self.user_id,
+                "nodeId": node_id,
+                "nodeName": node.node_name,
+            },
+        )
         
-        # 构建入度表
-        node_ids = self._node_ids()
-        in_degree = {node_id: 0 for node_id in node_ids}
-        adjacency = {node_id: [] for node_id in node_ids}
-
-        for node in self.nodes:
-            node_id = self._node_id(node)
-            for dep_id in (node.dependencies or []):
-                if dep_id in adjacency:
-                    adjacency[dep_id].append(node_id)
-                    in_degree[node_id] += 1
-        
-        # Kahn 算法
-        queue = [node_id for node_id, degree in in_degree.items() if degree == 0]
-        result = []
-        
-        while queue:
-            node_id = queue.pop(0)
-            result.append(node_id)
-            
-            for neighbor in adjacency[node_id]:
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
+        # 执行节点
+        success = await self._execute_node(node)
+        if self.node_states.get(node_id) in (NodeStatus.FAILED, NodeStatus.SKIPPED):
+            self._blocked |= 1 << position
         
-        # 检查是否有环
-        if len(result) != len(node_ids):
-            logger.error("Cyclic dependency detected in scenario")
-            return []
+        if not success:
+            logger.warning(f"Node {node_id} failed")
+            # 失败但继续执行其他节点（可根据需要修改）
         
-        return result
+        # 之后没有节点要等待时不再思考（串行：最后一个节点；并行：没有后继的节点）
+        if self.max_parallel_nodes > 1:
+            has_next = bool(self.plan.dependents[position])
+        else:
+            has_next = position < len(self.plan) - 1
+        if has_next:
+            await self._think(node)
     
-    def _check_dependencies(self, node_id: str) -> bool:
-        """检查节点的所有依赖是否都已成功完成"""
+    async def _run_parallel(self):
+        """
+        并行执行互不依赖的分支
+        
+        节点的所有前驱结束（含思考时间）后进入就绪队列；就绪节点按拓扑序出队，
+        同时运行的节点数不超过 max_parallel_nodes。
+        """
+        plan = self.plan
+        remaining = [bin(mask).count("1") for mask in plan.dependency_masks]
+        ready = [position for position, count in enumerate(remaining) if count == 0]
+        heapq.heapify(ready)
+        running: Dict[asyncio.Task, int] = {}
         
-        node = self._get_node(node_id)
-        if not node or not node.dependencies:
+        try:
+            while ready or running:
+                while ready and len(running) < self.max_parallel_nodes:
+                    position = heapq.heappop(ready)
+                    running[asyncio.create_task(self._run_node(position))] = position
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=running.get):
+                    position = running.pop(task)
+                    task.result()
+                    for dependent in plan.dependents[position]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            heapq.heappush(ready, dependent)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+    
+    def _merge_context(self, node_id: str, extracted: Dict[str, Any]):
+        """把节点提取的字段合并进用户上下文：同名字段由拓扑序靠后的节点胜出"""
+        position = self.plan.index.get(node_id, len(self.plan))
+        owners = self._context_owners
+        for key, value in extracted.items():
+            if owners.get(key, -1) <= position:
+                self.user_context[key] = value
+                owners[key] = position
+    
+    # ============================================================
+    # 依赖检查
+    # ============================================================
+    
+    def _check_dependencies(self, node_id: str) -> bool:
+        """检查节点的所有依赖是否都已成功完成（依赖失败或被跳过则此节点无法执行）"""
+        position = self.plan.index.get(node_id)
+        if position is None:
             return True
-        
-        for dep_id in node.dependencies:
-            dep_status = self.node_states.get(dep_id, NodeStatus.PENDING)
-            # 如果依赖失败或被跳过，则此节点无法执行
-            if dep_status in (NodeStatus.FAILED, NodeStatus.SKIPPED):
-                return False
-        
-        return True
+        return not (self.plan.dependency_masks[position] & self._blocked)
     
     # ============================================================
     # 节点执行
@@ -188,6 +244,10 @@ class NodeDAGExecutor:
     async def _execute_node(self, node) -> bool:
         """执行单个节点"""
         
+        # 轮询节点（node type 为 polling，或 execution_mode 为 polling 且配置了 config.polling）
+        if self._node_id(node) in self.plan.polling:
+            return await self._execute_polling_node(node)
+        
         # 根据节点类型处理
         node_type = (node.node_type or "").lower()
         if not node_type:
@@ -265,15 +325,15 @@ class NodeDAGExecutor:
         )
         
         node_start_time = time.time()
+        recorded = False
         
         try:
             # 从节点配置获取 HTTP 信息
-            config = node.config or {}
-            if (not config) and isinstance(getattr(node, "full_config", None), dict):
-                config = node.full_config.get("config", {}) or {}
+            config = self._node_config(node)
             endpoint = config.get("endpoint", "/chat")
             method = config.get("method", "POST")
-            payload_template = config.get("payload", {})
+            payload_template = self.plan.payload_templates.get(node_id) or config.get("payload", {})
+            stream = bool(config.get("stream", False))
             
             # 构建请求体
             payload = self._build_payload(payload_template)
@@ -285,14 +345,18 @@ class NodeDAGExecutor:
                 endpoint=endpoint,
             )
             
-            # 调用 HTTP API
-            success, response_json, error_msg, duration_ms = await self.http_client.call_agent(
+            # 调用 HTTP API（stream=true 时按 SSE / chunked 增量消费）
+            call = self.http_client.stream_agent if stream else self.http_client.call_agent
+            success, response_json, error_msg, duration_ms, timing = await call(
                 endpoint=endpoint,
                 payload=payload,
                 headers=self._build_headers(),
             )
             
             duration = time.time() - node_start_time
+            node_exec.timing = timing.to_dict()
+            self._record_metrics(node, bool(success and response_json), duration_ms, endpoint, error_msg)
+            recorded = True
             
             if success and response_json:
                 self.node_states[node_id] = NodeStatus.SUCCESS
@@ -301,9 +365,9 @@ class NodeDAGExecutor:
                 node_exec.response_body = response_json
                 
                 # 提取字段
-                extraction = config.get("extraction", {})
+                extraction = self.plan.extractors.get(node_id) or config.get("extraction", {})
                 extracted = self._extract_fields(response_json, extraction)
-                self.user_context.update(extracted)
+                self._merge_context(node_id, extracted)
                 
                 logger.info(
                     "Action node success",
@@ -331,6 +395,7 @@ class NodeDAGExecutor:
                             "headers": {},
                             "body": response_json,
                             "duration": int(duration * 1000),
+                            "timing": node_exec.timing,
                         },
                     },
                 )
@@ -364,6 +429,8 @@ class NodeDAGExecutor:
         
         except Exception as e:
             logger.error(f"Exception in action node: {e}")
+            if not recorded:
+                self._record_metrics(node, False, error=str(e))
             self.node_states[node_id] = NodeStatus.FAILED
             node_exec.status = NodeStatus.FAILED
             node_exec.error_message = str(e)
@@ -383,6 +450,150 @@ class NodeDAGExecutor:
             
             return False
     
+    async def _execute_polling_node(self, node) -> bool:
+        """执行轮询节点：提交异步任务，再按退避间隔查询状态直到终态或超时"""
+        
+        node_id = self._node_id(node)
+        self.node_states[node_id] = NodeStatus.RUNNING
+        
+        node_exec = NodeExecution(
+            node_id=node_id,
+            node_name=node.node_name,
+            status=NodeStatus.RUNNING,
+            start_time=datetime.utcnow(),
+        )
+        
+        node_start_time = time.time()
+        recorded = False
+        
+        try:
+            config = self._node_config(node)
+            polling = self.plan.polling[node_id]
+            endpoint = config.get("endpoint")
+            headers = self._build_headers()
+            
+            # 1. 提交任务（未配置 endpoint 时沿用上下文中已有的任务 ID）
+            if endpoint:
+                payload = self._build_payload(self.plan.payload_templates.get(node_id) or config.get("payload", {}))
+                success, submit_response, error_msg, duration_ms, timing = await self.http_client.call_agent(
+                    endpoint=endpoint,
+                    payload=payload,
+                    headers=headers,
+                    method=config.get("method", "POST"),
+                )
+                node_exec.timing = timing.to_dict()
+                if self.metrics is not None:
+                    self.metrics.record_request(endpoint, bool(success and submit_response), duration_ms, error_msg)
+                if not (success and submit_response):
+                    raise RuntimeError(f"Submit failed: {error_msg}")
+                
+                extraction = self.plan.extractors.get(node_id) or config.get("extraction", {})
+                self._merge_context(node_id, self._extract_fields(submit_response, extraction))
+                task_id = polling.task_id_of(submit_response)
+            else:
+                task_id = self.user_context.get(polling.context_key)
+            
+            if task_id is None:
+                raise RuntimeError(f"Task id not found (path: {polling.task_id_path})")
+            self._merge_context(node_id, {polling.context_key: task_id})
+            
+            logger.info("Polling task", node_id=node_id, task_id=task_id)
+            
+            # 2. 轮询状态：配置了 batch 时交给共享的批量轮询器
+            batch_poller = self.poller.get(node_id, polling) if self.poller else None
+            if batch_poller is not None:
+                waiter = batch_poller.wait(task_id, headers, started_at=node_start_time)
+                outcome = await (self.controller.sleep(waiter) if self.controller else waiter)
+            else:
+                outcome = await poll_task(
+                    self.http_client,
+                    polling,
+                    task_id,
+                    self.user_context,
+                    headers=headers,
+                    sleep=self._sleep,
+                    on_request=self.metrics.record_request if self.metrics is not None else None,
+                    started_at=node_start_time,
+                )
+            
+            duration = time.time() - node_start_time
+            # 节点耗时为提交到终态的端到端时间
+            self._record_metrics(node, outcome.success, duration * 1000, error=outcome.error)
+            recorded = True
+            
+            node_exec.response_body = outcome.response
+            node_exec.duration = duration
+            node_exec.end_time = datetime.utcnow()
+            
+            if outcome.success:
+                self.node_states[node_id] = NodeStatus.SUCCESS
+                node_exec.status = NodeStatus.SUCCESS
+                node_exec.response_status = 200
+                self._merge_context(node_id, polling.result_extractor.extract(outcome.response))
+                
+                logger.info("Polling node success", node_id=node_id, task_id=task_id, polls=outcome.polls)
+                
+                await self._send_event(
+                    "node_completed",
+                    {
+                        "userId": self.user_id,
+                        "nodeId": node_id,
+                        "nodeName": node.node_name,
+                        "duration": int(duration * 1000),
+                        "taskId": task_id,
+                        "taskStatus": outcome.status,
+                        "polls": outcome.polls,
+                    },
+                )
+            else:
+                self.node_states[node_id] = NodeStatus.FAILED
+                node_exec.status = NodeStatus.FAILED
+                node_exec.error_message = (outcome.error or "")[:1000]
+                
+                logger.warning("Polling node failed", node_id=node_id, task_id=task_id, error=outcome.error)
+                
+                await self._send_event(
+                    "node_failed",
+                    {
+                        "userId": self.user_id,
+                        "nodeId": node_id,
+                        "nodeName": node.node_name,
+                        "error": outcome.error,
+                        "taskId": task_id,
+                        "taskStatus": outcome.status,
+                    },
+                )
+            
+            self.node_executions[node_id] = node_exec
+            return outcome.success
+        
+        except RunCancelled:
+            # 轮询等待期间被取消：与 _run_node 一致直接向上展开，不记为节点失败
+            raise
+        
+        except Exception as e:
+            logger.error(f"Exception in polling node: {e}")
+            if not recorded:
+                self._record_metrics(node, False, error=str(e))
+            self.node_states[node_id] = NodeStatus.FAILED
+            node_exec.status = NodeStatus.FAILED
+            node_exec.error_message = str(e)[:1000]
+            node_exec.duration = time.time() - node_start_time
+            node_exec.end_time = datetime.utcnow()
+            self.node_executions[node_id] = node_exec
+            
+            await self._send_event(
+                "node_failed",
+                {
+                    "userId": self.user_id,
+                    "nodeId": node_id,
+                    "nodeName": node.node_name,
+                    "error": str(e),
+                },
+            )
+            
+            return False
+    
     async def _execute_assertion_node(self, node) -> bool:
         """执行断言节点"""
 
@@ -397,16 +608,19 @@ class NodeDAGExecutor:
         )
         
         node_start_time = time.time()
+        recorded = False
         
         try:
             # 从配置获取断言条件
-            config = node.config or {}
+            config = self._node_config(node)
             condition = config.get("condition", "True")
             
             # 评估条件
-            success = self._evaluate_condition(condition)
+            success = self._evaluate_condition(self.plan.conditions.get(node_id) or condition)
             
             duration = time.time() - node_start_time
+            self._record_metrics(node, success, error=None if success else f"Assertion failed: {condition}")
+            recorded = True
             
             if success:
                 self.node_states[node_id] = NodeStatus.SUCCESS
@@ -446,6 +660,8 @@ class NodeDAGExecutor:
         
         except Exception as e:
             logger.error(f"Exception in assertion node: {e}")
+            if not recorded:
+                self._record_metrics(node, False, error=str(e))
             self.node_states[node_id] = NodeStatus.FAILED
             node_exec.status = NodeStatus.FAILED
             node_exec.error_message = str(e)
@@ -461,6 +677,40 @@ class NodeDAGExecutor:
         # 与断言节点类似，但可能有不同的处理逻辑
         return await self._execute_assertion_node(node)
     
+    def _record_metrics(
+        self,
+        node,
+        success: bool,
+        duration_ms: Optional[float] = None,
+        endpoint: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        if self.metrics is not None:
+            self.metrics.record(self._node_id(node), node.node_name, success, duration_ms, endpoint, error)
+    
+    async def _think(self, node):
+        """节点之间的思考时间"""
+        think_time = self.plan.think_times.get(self._node_id(node))
+        if think_time is None and (node.node_type or "action").lower() in ("action", "polling"):
+            think_time = self.default_think_time
+        if think_time is None:
+            return
+        
+        await self._sleep(think_time.sample())
+    
+    async def _sleep(self, seconds: float):
+        """经由共享调度器休眠（合并定时器），没有调度器时直接 sleep"""
+        if self.scheduler:
+            waiter = self.scheduler.sleep_from(self.scheduler.now(), seconds)
+        elif seconds > 0:
+            waiter = asyncio.sleep(seconds)
+        else:
+            return
+        if self.controller:
+            await self.controller.sleep(waiter)
+        else:
+            await waiter
+    
     # ============================================================
     # 数据库操作
     # ============================================================
@@ -477,7 +727,7 @@ class NodeDAGExecutor:
                 context=self.user_context,
                 conversation_history=[],
             )
-            return await self.db.create(user_exec)
+            return await self.db.create_deferred(user_exec)
         except Exception as e:
             logger.error(f"Failed to create user execution: {e}")
             return None
@@ -489,14 +739,15 @@ class NodeDAGExecutor:
                 self.user_execution.status = NodeStatus.SUCCESS if success else NodeStatus.FAILED
                 self.user_execution.end_time = datetime.utcnow()
                 
-                # 保存所有节点执行记录
+                # 保存所有节点执行记录（write-behind 批量写入）
                 for node_exec in self.node_executions.values():
                     node_exec.user_execution_id = self.user_execution.id
-                    await self.db.create(node_exec)
+                    await self.db.create_deferred(node_exec, self.test_run_id)
                 
-                await self.db.update(self.user_execution)
+                await self.db.update_deferred(self.user_execution)
                 
                 # 推送用户完成事件
+                self.end_time = time.time()
                 duration = (self.end_time - self.start_time) * 1000
                 await self._send_event(
                     "user_completed",
@@ -513,27 +764,9 @@ class NodeDAGExecutor:
     # 工具方法
     # ============================================================
     
-    def _build_payload(self, template: Dict[str, Any]) -> Dict[str, Any]:
-        """构建请求体（模板替换）"""
-        import copy
-        import re
-        
-        payload = copy.deepcopy(template)
-        
-        def replace_context(obj):
-            if isinstance(obj, str):
-                pattern = r'\{(?:context\.)?(\w+)\}'
-                def replacer(match):
-                    key = match.group(1)
-                    return str(self.user_context.get(key, ''))
-                return re.sub(pattern, replacer, obj)
-            elif isinstance(obj, dict):
-                return {k: replace_context(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [replace_context(item) for item in obj]
-            return obj
-        
-        return replace_context(payload)
+    def _build_payload(self, template) -> Dict[str, Any]:
+        """构建请求体（模板替换，template 为 dict 或预编译的 PayloadTemplate）"""
+        return PayloadTemplate.compile(template).render(self.user_context)
     
     def _build_headers(self) -> Dict[str, str]:
         """构建请求头"""
@@ -542,40 +775,21 @@ class NodeDAGExecutor:
             headers['Authorization'] = f"Bearer {self.user_context['token']}"
         return headers
     
-    def _extract_fields(self, response: Dict[str, Any], extraction: Dict[str, str]) -> Dict[str, Any]:
-        """从响应提取字段"""
+    def _extract_fields(self, response: Dict[str, Any], extraction) -> Dict[str, Any]:
+        """从响应提取字段（extraction 为 {字段: 路径} 或预编译的 Extractor）"""
         if not extraction:
             return {}
         
-        extracted = {}
-        for key, path in extraction.items():
-            try:
-                value = response
-                for part in path.split('.'):
-                    if isinstance(value, dict):
-                        value = value.get(part)
-                    else:
-                        value = None
-                        break
-                
-                if value is not None:
-                    extracted[key] = value
-            except Exception:
-                pass
-        
-        return extracted
+        try:
+            return Extractor.compile(extraction).extract(response)
+        except ValueError as e:
+            logger.warning(f"Invalid extraction: {e}")
+            return {}
     
-    def _evaluate_condition(self, condition: str) -> bool:
-        """评估条件"""
+    def _evaluate_condition(self, condition: Union[Expression, str]) -> bool:
+        """评估条件（预编译表达式，变量 context 即用户上下文）"""
         try:
-            context = {
-                'context': self.user_context,
-                'True': True,
-                'False': False,
-                'None': None,
-            }
-            result = eval(condition, {"__builtins__": {}}, context)
-            return bool(result)
+            return Expression.compile(condition, ("context",)).test({"context": self.user_context})
         except Exception as e:
             logger.warning(f"Failed to evaluate condition '{condition}': {e}")
             return True
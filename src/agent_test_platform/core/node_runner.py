@@ -0,0 +1,130 @@
+from typing import Dict, Any, List
+from agent_test_platform.config.settings import settings
+from agent_test_platform.core.node_executor import NodeDAGExecutor
+from agent_test_platform.core.scheduling import UserScheduler, RampUp, ThinkTime
+from agent_test_platform.core.metrics import RunMetrics
+from agent_test_platform.core.execution_plan import ExecutionPlan
+from agent_test_platform.core.polling import PollingHub
+from agent_test_platform.core.run_control import RunController
+from agent_test_platform.models.node_based import Scenario as NodeScenario
+from agent_test_platform.models.node_config_model import NodeConfig, NodeExecutionMode
+
+
+# NodeConfig 中参与执行的字段（跨进程 / 跨主机传递场景时使用）
+_NODE_FIELDS = (
+    "id", "scenario_id", "node_id", "node_name", "node_type", "dependencies",
+    "exit_condition", "message_generation", "task_detection", "config", "full_config", "description",
+)
+
+
+def scenario_to_spec(scenario: NodeScenario, nodes: List[NodeConfig]) -> Dict[str, Any]:
+    """把场景及其节点配置转成可 JSON 序列化的结构"""
+    return {
+        "id": scenario.id,
+        "name": scenario.name,
+        "nodes": [
+            {
+                **{field: getattr(node, field) for field in _NODE_FIELDS},
+                "execution_mode": node.execution_mode.value if node.execution_mode else None,
+            }
+            for node in nodes
+        ],
+    }
+
+
+def scenario_from_spec(spec: Dict[str, Any]):
+    """scenario_to_spec 的逆操作：返回 (Scenario, [NodeConfig])，均为未入库的临时对象"""
+    scenario = NodeScenario(id=spec["id"], name=spec.get("name"))
+    nodes = []
+    for data in spec.get("nodes") or []:
+        mode = data.get("execution_mode")
+        nodes.append(NodeConfig(
+            **{field: data.get(field) for field in _NODE_FIELDS},
+            execution_mode=NodeExecutionMode(mode) if mode else None,
+        ))
+    return scenario, nodes
+
+
+def node_run_concurrency(run_config: Dict[str, Any], total_users: int) -> int:
+    """closed 模型的并发用户数：run_config.concurrency，缺省用全局默认，并做上限保护"""
+    concurrency = int(run_config.get("concurrency") or settings.DEFAULT_CONCURRENCY)
+    return max(1, min(total_users, concurrency))
+
+
+class NodeUserRunner:
+    """执行节点 DAG 场景的虚拟用户，进程内运行与 worker 进程共用
+
+    持有一次运行内所有用户共享的只读执行计划、调度器与批量轮询器；
+    run_user / run_user_after_ramp_up 交给 UserSpawner 或 OpenModelRunner 调度。
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        scenario: NodeScenario,
+        plan: ExecutionPlan,
+        run_config: Dict[str, Any],
+        total_users: int,
+        db,
+        http_client,
+        metrics: RunMetrics,
+        controller: RunController,
+        on_event_callback=None,
+    ):
+        self.run_id = run_id
+        self.scenario = scenario
+        self.plan = plan
+        self.total_users = total_users
+        self.db = db
+        self.http_client = http_client
+        self.metrics = metrics
+        self.controller = controller
+        self.on_event_callback = on_event_callback
+
+        self.max_parallel_nodes = int(run_config.get("max_parallel_nodes") or settings.NODE_MAX_PARALLELISM)
+        self.default_think_time = ThinkTime.from_config(run_config.get("think_time"))
+        ramp_up_config = run_config.get("ramp_up") or {}
+        self.ramp_up = RampUp.from_config(
+            ramp_up_config.get("duration"),
+            ramp_up_config.get("shape"),
+            ramp_up_config.get("factor"),
+        )
+        self.scheduler = UserScheduler()
+        # 轮询节点的共享批量轮询器，运行结束时关闭
+        self.polling_hub = PollingHub(http_client, on_request=metrics.record_request)
+
+    def start(self):
+        self.scheduler.start()
+
+    async def close(self):
+        self.scheduler.close()
+        await self.polling_hub.close()
+
+    async def run_user(self, user_index: int) -> bool:
+        executor = NodeDAGExecutor(
+            user_index=user_index,
+            user_id=f"user-{user_index:03d}",
+            scenario=self.scenario,
+            nodes=self.plan.nodes,
+            test_run_id=self.run_id,
+            db=self.db,
+            http_client=self.http_client,
+            on_event_callback=self.on_event_callback,
+            scheduler=self.scheduler,
+            default_think_time=self.default_think_time,
+            metrics=self.metrics,
+            plan=self.plan,
+            max_parallel_nodes=self.max_parallel_nodes,
+            poller=self.polling_hub,
+            controller=self.controller,
+        )
+        ok = await executor.run()
+        self.metrics.record_user(ok)
+        return ok
+
+    async def run_user_after_ramp_up(self, user_index: int) -> bool:
+        """按 ramp-up 曲线错开启动（偏移按全局用户序号计算，分片后各 worker 仍沿用同一曲线）"""
+        await self.controller.sleep(
+            self.scheduler.wait_for_start(self.ramp_up.offset(user_index, self.total_users))
+        )
+        return await self.run_user(user_index)
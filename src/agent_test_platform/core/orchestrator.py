@@ -1,7 +1,7 @@
 
 import asyncio
 import uuid
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 from agent_test_platform.config.logger import logger
 from agent_test_platform.scenarios.loader import ScenarioLoader
@@ -14,9 +14,19 @@ from agent_test_platform.models.node_based import (
 from agent_test_platform.storage.database import Database
 from agent_test_platform.http_client.client import AgentHTTPClient
 from agent_test_platform.config.settings import settings
-from agent_test_platform.core.state_machine import StateMachine, TestState
+from agent_test_platform.core.state_machine import TestState
 from agent_test_platform.core.executor import VirtualUserExecutor
-from agent_test_platform.core.node_executor import NodeDAGExecutor
+from agent_test_platform.core.load_model import LoadModel, ArrivalConfig, OpenModelRunner
+from agent_test_platform.core.spawner import UserSpawner
+from agent_test_platform.core.scheduling import UserScheduler, RampUp
+from agent_test_platform.core.metrics import MetricsRegistry
+from agent_test_platform.core.execution_plan import ExecutionPlan
+from agent_test_platform.core.run_control import RunController
+from agent_test_platform.core.run_registry import RunRegistry, RunContext
+from agent_test_platform.core.quota import GlobalQuota, QuotaHTTPClient
+from agent_test_platform.core.node_runner import NodeUserRunner, node_run_concurrency, scenario_to_spec
+from agent_test_platform.core.workers import WorkerGroup, worker_count
+from agent_test_platform.core.cluster import RemoteWorkerPool
 from agent_test_platform.models.node_config_model import NodeConfig
 
 
@@ -28,11 +38,22 @@ class TestOrchestrator:
         self.http_client = AgentHTTPClient()
         self.scenario_loader = ScenarioLoader(settings.SCENARIOS_DIR)
         
-        # 运行时状态
-        self.test_run: Optional[TestRun] = None
-        self.state_machine = StateMachine(TestState.IDLE)
-        self.user_tasks: List[asyncio.Task] = []
+        # 运行中的测试：run_id -> RunContext（状态机 / 取消令牌 / 用户生成器 / 在线统计），
+        # 多个运行并发时各自独立
+        self.runs = RunRegistry()
         self.progress_callbacks = []
+        
+        # 平台级在途请求预算：并发运行按权重 / 优先级公平分享
+        self.quota = GlobalQuota(settings.GLOBAL_MAX_IN_FLIGHT)
+        
+        # run_id -> 在线延迟统计，运行结束时写入 TestSummary
+        self.metrics = MetricsRegistry(db)
+        
+        # 通过 /api/workers/ws 注册的远程 worker
+        self.worker_pool = RemoteWorkerPool()
+        
+        # 节点执行事件总线（EventBus，启动时由 main 注入）：事件合并后周期推送到运行的 WebSocket
+        self.event_bus = None
     
     def register_progress_callback(self, callback):
         """注册进度回调"""
@@ -65,7 +86,7 @@ class TestOrchestrator:
         
         # 2. 创建 TestRun 记录
         test_run_id = str(uuid.uuid4())
-        self.test_run = TestRun(
+        test_run = TestRun(
             id=test_run_id,
             scenario_name=scenario_name,
             status=TestRunStatus.PENDING,
@@ -76,10 +97,12 @@ class TestOrchestrator:
                 'num_users': scenario.num_users,
                 'concurrency': scenario.concurrency,
                 'steps': len(scenario.steps),
+                'load_model': scenario.load_model,
+                'arrival': scenario.arrival,
             },
         )
         
-        self.test_run = await self.db.create(self.test_run)
+        test_run = await self.db.create(test_run)
         
         logger.info(
             "Test started",
@@ -88,23 +111,33 @@ class TestOrchestrator:
             num_users=scenario.num_users,
         )
         
-        # 3. 状态转移
-        self.state_machine.transition(TestState.RUNNING)
-        self.test_run.status = TestRunStatus.RUNNING
-        await self.db.update(self.test_run)
+        # 3. 状态转移（运行上下文的状态机从 RUNNING 开始）
+        test_run.status = TestRunStatus.RUNNING
+        await self.db.update(test_run)
         
         # 4. 启动虚拟用户
-        asyncio.create_task(self._run_users(test_run_id, scenario))
+        context = self.runs.create(test_run_id, kind="yaml", test_run=test_run)
+        context.task = asyncio.create_task(self._run_users(test_run_id, scenario, context))
         
         return test_run_id
     
-    async def _run_users(self, test_run_id: str, scenario):
+    def launch(self, run_id: str, scenario) -> RunContext:
+        """在后台启动一次运行；同一 run_id 已在运行时抛 RunAlreadyActiveError"""
+        context = self.runs.create(run_id)
+        context.task = asyncio.create_task(self._run_users(run_id, scenario, context))
+        return context
+    
+    async def _run_users(self, test_run_id: str, scenario, context: Optional[RunContext] = None):
         """启动并管理虚拟用户"""
 
         # API v2 会传 scenario_id（str），而 YAML 模式会传 ScenarioConfig
         # 这里做兼容：优先把 str 当成 node-based scenario_id 去 DB 取
         node_scenario: Optional[NodeScenario] = None
         yaml_scenario = None
+        scheduler = UserScheduler()
+        context = context or self.runs.create(test_run_id)
+        controller = context.controller
+        test_run = context.test_run
         try:
             if isinstance(scenario, str):
                 node_scenario = await self.db.get(
@@ -117,43 +150,69 @@ class TestOrchestrator:
                 yaml_scenario = scenario
 
             if node_scenario is not None:
-                await self._run_users_node_based(test_run_id, node_scenario)
+                try:
+                    await self._run_users_node_based(test_run_id, node_scenario, context)
+                finally:
+                    # 无论成功与否都把已收集的统计写入 TestSummary，并推送剩余的合并事件
+                    await self.metrics.finish(test_run_id)
+                    if self.event_bus is not None:
+                        await self.event_bus.finish(test_run_id)
                 return
 
             if yaml_scenario is None:
                 raise ValueError("Scenario not found")
 
             # YAML 模式：使用 VirtualUserExecutor
-            user_semaphore = asyncio.Semaphore(yaml_scenario.concurrency)
-            
-            async def run_user_with_semaphore(user_index: int):
-                async with user_semaphore:
-                    user_id = str(uuid.uuid4())
-                    
-                    executor = VirtualUserExecutor(
-                        user_id=user_id,
-                        user_index=user_index,
-                        scenario=yaml_scenario,
-                        test_run_id=test_run_id,
-                        db=self.db,
-                        http_client=self.http_client,
-                        on_progress_callback=self._on_user_progress,
-                    )
-                    
-                    return await executor.run()
+            context.kind = "yaml"
+            http_client = self._run_http_client(context)
+            scheduler.start()
             
-            # 创建所有用户任务
-            tasks = [asyncio.create_task(run_user_with_semaphore(i)) for i in range(yaml_scenario.num_users)]
-            
-            # 等待所有任务完成（带超时）
-            results = await asyncio.wait_for(
-                asyncio.gather(*tasks, return_exceptions=True),
-                timeout=yaml_scenario.max_wait_time,
-            )
+            async def run_user(user_index: int):
+                user_id = str(uuid.uuid4())
+                
+                executor = VirtualUserExecutor(
+                    user_id=user_id,
+                    user_index=user_index,
+                    scenario=yaml_scenario,
+                    test_run_id=test_run_id,
+                    db=self.db,
+                    http_client=http_client,
+                    on_progress_callback=self._on_user_progress,
+                    scheduler=scheduler,
+                    controller=controller,
+                )
+                
+                return await executor.run()
             
-            # 统计结果
-            successful = sum(1 for r in results if r is True)
-            failed = sum(1 for r in results if r is False)
+            arrival_stats = None
+            if yaml_scenario.load_model == LoadModel.OPEN:
+                # open 模型：按到达率启动用户，在途数受 max_in_flight 限制
+                runner = context.arrivals = OpenModelRunner(ArrivalConfig.from_dict(yaml_scenario.arrival))
+                arrival_stats = await asyncio.wait_for(
+                    runner.run(yaml_scenario.num_users, run_user, controller),
+                    timeout=yaml_scenario.max_wait_time,
+                )
+                successful = arrival_stats.successful
+                failed = arrival_stats.failed
+            else:
+                # closed 模型：固定大小的 worker 池惰性执行用户（带超时），按 ramp-up 错开启动时间
+                ramp_up = RampUp.from_config(yaml_scenario.ramp_up_time, yaml_scenario.ramp_up_shape)
+                
+                async def run_user_after_ramp_up(user_index: int):
+                    await controller.sleep(scheduler.wait_for_start(ramp_up.offset(user_index, yaml_scenario.num_users)))
+                    return await run_user(user_index)
+                
+                spawner = UserSpawner(
+                    run_user_after_ramp_up,
+                    yaml_scenario.num_users,
+                    yaml_scenario.concurrency,
+                    controller=controller,
+                )
+                await self._run_spawner(context, spawner, timeout=yaml_scenario.max_wait_time)
+                
+                # 统计结果
+                successful = spawner.successful
+                failed = spawner.failed
             
             logger.info(
                 "All users completed",
@@ -162,38 +221,61 @@ class TestOrchestrator:
                 failed=failed,
             )
             
+            # 等待执行记录全部落库后再标记完成
+            await self.db.flush()
+            failed_rows = self.db.take_failed_rows(test_run_id)
+            
             # 更新 TestRun
-            if self.test_run is not None:
-                self.test_run.completed_users = successful
-                self.test_run.failed_users = failed
-                self.test_run.status = TestRunStatus.DONE if failed == 0 else TestRunStatus.DONE
-                self.test_run.total_duration_ms = int(
-                    (datetime.utcnow() - self.test_run.created_at).total_seconds() * 1000
+            if test_run is not None:
+                test_run.completed_users = successful
+                test_run.failed_users = failed
+                test_run.config = {**(test_run.config or {}), 'failed_rows': failed_rows}
+                if controller.cancelled:
+                    test_run.status = TestRunStatus.CANCELLED
+                else:
+                    test_run.status = TestRunStatus.DONE if failed == 0 else TestRunStatus.DONE
+                test_run.total_duration_ms = int(
+                    (datetime.utcnow() - test_run.created_at).total_seconds() * 1000
                 )
-                await self.db.update(self.test_run)
+                if arrival_stats is not None:
+                    test_run.config = {**(test_run.config or {}), 'arrival_stats': arrival_stats.to_dict()}
+                await self.db.update(test_run)
             
             # 状态转移
-            self.state_machine.transition(TestState.COMPLETED)
+            if not controller.cancelled:
+                controller.finish(TestState.COMPLETED)
             
             logger.info(f"Test completed: {test_run_id}")
         
         except asyncio.TimeoutError:
             logger.error(f"Test timeout: {test_run_id}")
-            if self.test_run is not None:
-                self.test_run.status = TestRunStatus.FAILED
-                self.test_run.error_message = "Test execution timeout"
-                await self.db.update(self.test_run)
-            self.state_machine.transition(TestState.FAILED)
+            if test_run is not None:
+                test_run.status = TestRunStatus.FAILED
+                test_run.error_message = "Test execution timeout"
+                await self.db.update(test_run)
+            controller.finish(TestState.FAILED)
         
         except Exception as e:
-            logger.error(f"Error during test execution: {e}")
-            if self.test_run is not None:
-                self.test_run.status = TestRunStatus.FAILED
-                self.test_run.error_message = str(e)
-                await self.db.update(self.test_run)
-            self.state_machine.transition(TestState.FAILED)
+            logger.error(f"Error during test execution: {e}", run_id=test_run_id)
+            if test_run is not None:
+                test_run.status = TestRunStatus.FAILED
+                test_run.error_message = str(e)
+                await self.db.update(test_run)
+            elif node_scenario is not None:
+                await self._update_run_status(test_run_id, NodeRunStatus.FAILED, finished=True)
+            controller.finish(TestState.FAILED)
+        
+        finally:
+            scheduler.close()
+            self.runs.remove(test_run_id)
+            self.quota.unregister(test_run_id)
 
-    async def _run_users_node_based(self, run_id: str, scenario: NodeScenario) -> None:
+    async def _run_users_node_based(
+        self,
+        run_id: str,
+        scenario: NodeScenario,
+        context: Optional[RunContext] = None,
+    ) -> None:
         """API v2(node_based) 模式：基于 Scenario DAG 执行并更新 node_based.TestRun"""
 
         test_run = await self.db.get(NodeTestRun, run_id)
@@ -204,48 +286,126 @@ class TestOrchestrator:
         if total_users <= 0:
             raise ValueError("total_users must be > 0")
 
-        # node_based 的场景模型里目前没有 concurrency 字段，先用全局默认并做上限保护
-        concurrency = max(1, min(total_users, settings.DEFAULT_CONCURRENCY))
-        user_semaphore = asyncio.Semaphore(concurrency)
+        run_config = test_run.config or {}
+        context = context or RunContext(run_id)
+        controller = context.controller
 
         # 读取该场景关联的所有节点配置（替代 ScenarioNode）
         scenario_nodes = await self.db.query_by_field(NodeConfig, "scenario_id", scenario.id)
 
-        async def run_user_with_semaphore(user_index: int):
-            async with user_semaphore:
-                user_id = f"user-{user_index:03d}"
-                executor = NodeDAGExecutor(
-                    user_index=user_index,
-                    user_id=user_id,
-                    scenario=scenario,
-                    nodes=scenario_nodes,
-                    test_run_id=run_id,
-                    db=self.db,
-                    http_client=self.http_client,
-                    on_event_callback=None,
-                )
-                return await executor.run()
-
-        tasks = [asyncio.create_task(run_user_with_semaphore(i)) for i in range(total_users)]
+        # DAG 拓扑 / 思考时间 / 请求体模板 / 提取器 / 条件只编译一次，所有用户共享
+        plan = ExecutionPlan.compile(scenario_nodes)
+        run_metrics = context.metrics = self.metrics.start(run_id)
+        is_open = run_config.get("load_model") == LoadModel.OPEN
+        concurrency = node_run_concurrency(run_config, total_users)
+        workers = 0 if is_open else worker_count(run_config.get("workers"))
+        remote_workers = 0 if is_open else int(run_config.get("remote_workers") or 0)
+        pool = None
+        if remote_workers > 0:
+            # 远程 worker 直接写各自 DATABASE_URL 指向的库，不受本机 SQLite 限制
+            pool = self.worker_pool
+            workers = min(remote_workers, len(pool.idle()))
+            if workers == 0:
+                raise ValueError("No idle remote workers registered")
+        elif workers > 1 and settings.DATABASE_URL.startswith("sqlite"):
+            logger.warning("Load workers are not supported with SQLite, running users in-process", run_id=run_id)
+            workers = 0
 
-        try:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        finally:
-            for task in tasks:
-                if not task.done():
-                    task.cancel()
+        arrival_stats = None
+        if pool is not None or workers > 1:
+            # 把用户分片到多个 worker（本机进程或远程 worker），各自独立的事件循环 / 连接池 / write-behind；
+            # 全局请求预算只约束本进程内的请求，不作用于 worker
+            group = context.workers = WorkerGroup(
+                run_id,
+                scenario_to_spec(scenario, plan.nodes),
+                run_config,
+                total_users,
+                concurrency,
+                workers,
+                controller,
+                run_metrics,
+                events=self.event_bus,
+                pool=pool,
+            )
+            await group.run()
+            successful = group.successful
+            failed = group.failed
+        else:
+            http_client = self._run_http_client(context, run_config.get("weight"), run_config.get("priority"))
+            runner = NodeUserRunner(
+                run_id, scenario, plan, run_config, total_users,
+                self.db, http_client, run_metrics, controller,
+                on_event_callback=self.event_bus.publish if self.event_bus is not None else None,
+            )
+            runner.start()
+            try:
+                if is_open:
+                    # open 模型：按到达率启动用户，在途数受 max_in_flight 限制
+                    arrivals = context.arrivals = OpenModelRunner(ArrivalConfig.from_dict(run_config.get("arrival")))
+                    arrival_stats = await arrivals.run(total_users, runner.run_user, controller)
+                    successful = arrival_stats.successful
+                    failed = arrival_stats.failed
+                else:
+                    spawner = UserSpawner(runner.run_user_after_ramp_up, total_users, concurrency, controller=controller)
+                    await self._run_spawner(context, spawner)
+                    successful = spawner.successful
+                    failed = spawner.failed
+            finally:
+                await runner.close()
 
-        successful = sum(1 for r in results if r is True)
-        failed = sum(1 for r in results if r is False or isinstance(r, Exception))
+        # 等待执行记录全部落库后再标记完成；写入失败被丢弃的执行记录行数随运行结果上报
+        await self.db.flush()
+        failed_rows = self.db.take_failed_rows(run_id)
+        if context.workers is not None:
+            failed_rows += context.workers.failed_rows
 
         test_run.success_users = successful
         test_run.failed_users = failed
         test_run.current_users = successful + failed
-        test_run.progress = int((test_run.current_users / total_users) * 100) if total_users else 0
+        test_run.config = {**run_config, "failed_rows": failed_rows}
+        dropped = 0
+        if arrival_stats is not None:
+            dropped = arrival_stats.dropped
+            test_run.config["arrival_stats"] = arrival_stats.to_dict()
+        test_run.progress = int(((test_run.current_users + dropped) / total_users) * 100) if total_users else 0
         test_run.end_time = datetime.utcnow()
-        test_run.status = NodeRunStatus.DONE if failed == 0 else NodeRunStatus.FAILED
+        if controller.cancelled:
+            test_run.status = NodeRunStatus.CANCELLED
+        else:
+            test_run.status = NodeRunStatus.DONE if failed == 0 else NodeRunStatus.FAILED
+            controller.finish(TestState.COMPLETED if failed == 0 else TestState.FAILED)
         await self.db.update(test_run)
     
+    def _run_http_client(
+        self,
+        context: RunContext,
+        weight: Optional[float] = None,
+        priority: Optional[int] = None,
+    ) -> QuotaHTTPClient:
+        """该运行的 HTTP 客户端：共享连接池，请求前从全局预算领取槽位"""
+        context.quota = self.quota.register(context.run_id, float(weight or 1.0), int(priority or 0))
+        return QuotaHTTPClient(self.http_client, self.quota, context.quota)
+
+    async def _run_spawner(self, context: RunContext, spawner: UserSpawner, timeout: Optional[float] = None):
+        """运行用户生成器，运行期间挂在运行上下文上供实时查询"""
+        context.spawner = spawner
+        try:
+            if timeout:
+                await asyncio.wait_for(spawner.run(), timeout=timeout)
+            else:
+                await spawner.run()
+        finally:
+            context.spawner = None
+
+    def get_spawner_metrics(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """获取运行中测试的用户启动指标（启动速率、积压、在途数等；分片到 worker 时为汇总值）"""
+        context = self.runs.get(run_id)
+        return context.spawner_metrics() if context else None
+
+    def list_active_runs(self) -> List[Dict[str, Any]]:
+        """本进程中正在运行的测试及其实时指标"""
+        return [context.stats() for context in self.runs.active()]
+    
     async def _on_user_progress(
         self,
         run_id: str,
@@ -305,13 +465,58 @@ class TestOrchestrator:
         }
     
     async def cancel_test(self, test_run_id: str) -> bool:
-        """取消测试"""
+        """取消测试：停止启动新用户并结束在途用户（在途请求最多等待 RUN_CANCEL_DRAIN_SECONDS 秒）"""
         test_run = await self.db.get(TestRun, test_run_id)
         if not test_run:
             return False
         
+        controller = self.get_run_controller(test_run_id)
+        if controller is not None:
+            await controller.cancel("Cancelled by user")
+        
         test_run.status = TestRunStatus.CANCELLED
         await self.db.update(test_run)
         
         logger.info(f"Test cancelled: {test_run_id}")
-        return True
\ No newline at end of file
+        return True
+    
+    # ============================================================
+    # 运行控制（API v2）
+    # ============================================================
+    
+    def get_run_controller(self, run_id: str) -> Optional[RunController]:
+        context = self.runs.get(run_id)
+        return context.controller if context else None
+    
+    async def pause_run(self, run_id: str) -> bool:
+        """暂停运行：不再启动新用户，已启动的用户在下一个节点前挂起"""
+        controller = self.get_run_controller(run_id)
+        if controller is None or not controller.pause():
+            return False
+        await self._update_run_status(run_id, NodeRunStatus.PAUSED)
+        return True
+    
+    async def resume_run(self, run_id: str) -> bool:
+        controller = self.get_run_controller(run_id)
+        if controller is None or not controller.resume():
+            return False
+        await self._update_run_status(run_id, NodeRunStatus.RUNNING)
+        return True
+    
+    async def cancel_run(self, run_id: str, reason: Optional[str] = None) -> bool:
+        """取消运行并等待用户任务结束；运行不在本进程中时返回 False"""
+        controller = self.get_run_controller(run_id)
+        if controller is None or not controller.state_machine.can_transition(TestState.CANCELLED):
+            return False
+        # 先落库，避免排空期间查询仍看到 running
+        await self._update_run_status(run_id, NodeRunStatus.CANCELLED, finished=True)
+        return await controller.cancel(reason)
+    
+    async def _update_run_status(self, run_id: str, status: NodeRunStatus, finished: bool = False):
+        test_run = await self.db.get(NodeTestRun, run_id)
+        if test_run is None:
+            return
+        test_run.status = status
+        if finished:
+            test_run.end_time = datetime.utcnow()
+        await self.db.update(test_run)
\ No newline at end of file
@@ -0,0 +1,480 @@
+import asyncio
+import heapq
+import random
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from agent_test_platform.config.logger import logger
+from agent_test_platform.core.templates import PayloadTemplate
+from agent_test_platform.core.extraction import Extractor
+
+
+_MISSING = object()
+
+# (接口, 是否成功, 耗时ms, 错误信息)，用于把每次状态查询计入接口统计
+RequestCallback = Callable[[str, bool, float, Optional[str]], None]
+
+
+@dataclass
+class BatchConfig:
+    """批量状态查询接口：一次请求查询多个任务"""
+
+    endpoint: str = ""
+    method: str = "POST"
+    ids_field: str = "task_ids"       # 请求体中任务 ID 列表的字段名
+    results_path: str = "data"        # 响应中结果的路径：列表（按 id_field 对应）或 {task_id: 结果} 映射
+    id_field: str = "task_id"         # 列表形式时，结果项中任务 ID 的字段
+    status_path: str = "status"       # 结果项中状态字段的路径
+    max_batch_size: int = 100         # 单次请求最多包含的任务数
+    interval: float = 1.0             # 两轮批量查询之间的最小间隔（秒）
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> Optional["BatchConfig"]:
+        if not data:
+            return None
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+        config = cls(**known)
+        if not config.endpoint:
+            raise ValueError("polling.batch.endpoint is required")
+        if config.max_batch_size <= 0:
+            raise ValueError("polling.batch.max_batch_size must be > 0")
+        if config.interval < 0:
+            raise ValueError("polling.batch.interval must be >= 0")
+        return config
+
+
+@dataclass
+class PollingConfig:
+    """
+    轮询节点配置（config.polling）
+
+    提交接口沿用节点的 endpoint / payload / extraction；未配置 endpoint 时不提交，
+    直接从用户上下文的 context_key 读取任务 ID。
+    """
+
+    status_endpoint: str = ""         # 状态查询接口，支持 {task_id} / {context.xxx} 占位符
+    method: str = "GET"
+    task_id_path: str = "data.task_id"  # 提交响应中任务 ID 的路径
+    context_key: str = "task_id"      # 任务 ID 在用户上下文中的键
+    status_path: str = "data.status"  # 状态响应中状态字段的路径
+    success_values: List[str] = field(default_factory=lambda: ["FINISHED", "SUCCESS", "SUCCEEDED", "COMPLETED", "DONE"])
+    failure_values: List[str] = field(default_factory=lambda: ["FAILED", "ERROR", "CANCELLED", "TERMINATED"])
+    initial_interval: float = 1.0     # 首次查询前的等待（秒）
+    max_interval: float = 30.0        # 退避上限（秒）
+    multiplier: float = 2.0           # 每次未完成后间隔乘以该系数
+    jitter: float = 0.2               # 相对抖动，间隔在 [1-jitter, 1+jitter] 倍之间随机
+    timeout: float = 600.0            # 从提交起的最长等待（秒）
+    extraction: Optional[Dict[str, str]] = None  # 从终态响应中提取字段
+    batch: Optional[Dict[str, Any]] = None       # 见 BatchConfig；配置后由共享的 BatchPoller 批量查询
+
+    status_template: PayloadTemplate = field(init=False, repr=False, compare=False)
+    task_id_extractor: Extractor = field(init=False, repr=False, compare=False)
+    status_extractor: Extractor = field(init=False, repr=False, compare=False)
+    result_extractor: Extractor = field(init=False, repr=False, compare=False)
+    batch_config: Optional[BatchConfig] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.status_template = PayloadTemplate.compile(self.status_endpoint)
+        self.task_id_extractor = Extractor.compile({"task_id": self.task_id_path})
+        self.status_extractor = Extractor.compile({"status": self.status_path})
+        self.result_extractor = Extractor.compile(self.extraction)
+        self.batch_config = BatchConfig.from_dict(self.batch)
+        self._success = {str(value).upper() for value in self.success_values}
+        self._failure = {str(value).upper() for value in self.failure_values}
+
+    @classmethod
+    def from_config(cls, data: Optional[Dict[str, Any]]) -> "PollingConfig":
+        if not isinstance(data, dict):
+            raise ValueError("polling config must be a mapping")
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__ and cls.__dataclass_fields__[k].init}
+        config = cls(**known)
+        if not config.status_endpoint and config.batch_config is None:
+            raise ValueError("polling.status_endpoint is required")
+        if config.initial_interval < 0 or config.max_interval <= 0:
+            raise ValueError("polling intervals must be positive")
+        if config.multiplier < 1:
+            raise ValueError("polling.multiplier must be >= 1")
+        if not 0 <= config.jitter <= 1:
+            raise ValueError("polling.jitter must be between 0 and 1")
+        if config.timeout <= 0:
+            raise ValueError("polling.timeout must be > 0")
+        return config
+
+    def backoff(self, rng: Optional[random.Random] = None) -> "Backoff":
+        return Backoff(self.initial_interval, self.max_interval, self.multiplier, self.jitter, rng)
+
+    def task_id_of(self, response: Any) -> Any:
+        return self.task_id_extractor.extract(response).get("task_id")
+
+    def classify(self, status: Any) -> Optional[bool]:
+        """终态返回 True（成功）/ False（失败），未结束返回 None"""
+        if status is None:
+            return None
+        status = str(status).upper()
+        if status in self._success:
+            return True
+        if status in self._failure:
+            return False
+        return None
+
+
+class Backoff:
+    """带抖动的指数退避；观察到状态变化（任务有进展）时 reset 回到初始间隔"""
+
+    def __init__(
+        self,
+        initial: float,
+        maximum: float,
+        multiplier: float = 2.0,
+        jitter: float = 0.2,
+        rng: Optional[random.Random] = None,
+    ):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.rng = rng or random
+        self.current = initial
+
+    def next(self) -> float:
+        delay = self.current
+        self.current = min(self.maximum, max(self.current, 0.001) * self.multiplier)
+        if self.jitter:
+            delay *= self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return min(delay, self.maximum)
+
+    def reset(self):
+        self.current = self.initial
+
+
+@dataclass
+class PollOutcome:
+    """一次任务轮询的结果"""
+
+    success: bool
+    status: Optional[str] = None
+    response: Optional[Dict[str, Any]] = None  # 最后一次状态响应（批量时为该任务的结果项）
+    error: Optional[str] = None
+    polls: int = 0
+    timed_out: bool = False
+
+
+async def poll_task(
+    http_client,
+    config: PollingConfig,
+    task_id: Any,
+    context: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None,
+    sleep: Optional[Callable[[float], Awaitable[None]]] = None,
+    on_request: Optional[RequestCallback] = None,
+    started_at: Optional[float] = None,
+) -> PollOutcome:
+    """逐个任务轮询：按退避间隔查询状态接口直到终态或超时"""
+    sleep = sleep or asyncio.sleep
+    deadline = (started_at if started_at is not None else time.time()) + config.timeout
+    endpoint = str(config.status_template.render({**context, "task_id": task_id}))
+    backoff = config.backoff()
+    outcome = PollOutcome(success=False)
+    last_status = _MISSING
+
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        await sleep(min(backoff.next(), remaining))
+
+        success, response, error_msg, duration_ms, _ = await http_client.call_agent(
+            endpoint=endpoint,
+            payload=None,
+            headers=headers,
+            method=config.method,
+        )
+        outcome.polls += 1
+        if on_request:
+            # 按模板（而非带任务 ID 的实际路径）聚合，避免每个任务一个接口条目
+            on_request(config.status_endpoint, bool(success), duration_ms, error_msg)
+        if not success:
+            # 临时错误按退避重试，直到超时
+            outcome.error = error_msg
+            continue
+
+        outcome.response = response
+        status = config.status_extractor.extract(response).get("status")
+        outcome.status = status
+        finished = config.classify(status)
+        if finished is not None:
+            outcome.success = finished
+            outcome.error = None if finished else f"Task {task_id} finished with status {status}"
+            return outcome
+        if status != last_status:
+            last_status = status
+            backoff.reset()
+
+    outcome.timed_out = True
+    outcome.error = f"Task {task_id} polling timed out after {config.timeout}s (last status: {outcome.status})"
+    return outcome
+
+
+class _Waiter:
+    """一个任务 ID 的共享轮询状态；headers 为当前各等待者的请求头（按登记顺序），其长度即等待者数"""
+
+    __slots__ = ("task_id", "future", "backoff", "deadline", "headers", "outcome", "last_status")
+
+    def __init__(self, task_id: Any, future: asyncio.Future, backoff: Backoff, deadline: float):
+        self.task_id = task_id
+        self.future = future
+        self.backoff = backoff
+        self.deadline = deadline
+        self.headers: List[Optional[Dict[str, str]]] = []
+        self.outcome = PollOutcome(success=False)
+        self.last_status = _MISSING
+
+
+class BatchPoller:
+    """
+    共享批量轮询器：把多个用户未完成的任务合并到一个后台循环中查询
+
+    每个任务仍按自己的退避计划到期；每一轮（间隔不小于 batch.interval）把到期的任务
+    按 max_batch_size 分批，一次请求查询一批。同一任务 ID 被多个用户等待时只查询一次，
+    轮询持续到最晚的等待者超时，每个等待者按自己的超时时间返回；最后一个等待者离开
+    （取消或超时）后不再查询该任务。批量请求使用该批第一个任务最早登记的等待者的请求头。
+    """
+
+    def __init__(
+        self,
+        http_client,
+        config: PollingConfig,
+        on_request: Optional[RequestCallback] = None,
+    ):
+        if config.batch_config is None:
+            raise ValueError("BatchPoller requires polling.batch")
+        self.http_client = http_client
+        self.config = config
+        self.batch = config.batch_config
+        self.on_request = on_request
+        self.results_extractor = Extractor.compile({"results": self.batch.results_path})
+        self.status_extractor = Extractor.compile({"status": self.batch.status_path})
+
+        self._waiters: Dict[str, _Waiter] = {}
+        # (到期时间, 任务 ID)；任务重新排期后旧条目在出队时跳过
+        self._due: List[Tuple[float, str]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.requests = 0
+        self.polled = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._waiters)
+
+    async def wait(
+        self,
+        task_id: Any,
+        headers: Optional[Dict[str, str]] = None,
+        started_at: Optional[float] = None,
+    ) -> PollOutcome:
+        """登记任务并等待其进入终态（或超时）"""
+        key = str(task_id)
+        deadline = (started_at if started_at is not None else time.time()) + self.config.timeout
+        waiter = self._waiters.get(key)
+        if waiter is None:
+            loop = asyncio.get_running_loop()
+            backoff = self.config.backoff()
+            waiter = _Waiter(task_id, loop.create_future(), backoff, deadline)
+            self._waiters[key] = waiter
+            heapq.heappush(self._due, (time.time() + backoff.next(), key))
+            self._wakeup.set()
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._run())
+        else:
+            waiter.deadline = max(waiter.deadline, deadline)
+        waiter.headers.append(headers)
+        try:
+            # shield：某个等待者被取消或先超时时不影响同一任务的其他等待者
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max(0.0, deadline - time.time()))
+        except asyncio.TimeoutError:
+            return replace(waiter.outcome, timed_out=True, error=self._timeout_error(waiter))
+        finally:
+            self._leave(key, waiter, headers)
+
+    def _leave(self, key: str, waiter: _Waiter, headers: Optional[Dict[str, str]]):
+        """等待者离开；最后一个离开时取消该任务的轮询"""
+        waiter.headers.remove(headers)
+        if waiter.headers:
+            return
+        if not waiter.future.done():
+            waiter.future.cancel()
+        if self._waiters.get(key) is waiter:
+            self._waiters.pop(key)
+
+    def _timeout_error(self, waiter: _Waiter) -> str:
+        return (
+            f"Task {waiter.task_id} polling timed out after {self.config.timeout}s "
+            f"(last status: {waiter.outcome.status})"
+        )
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for waiter in self._waiters.values():
+            if not waiter.future.done():
+                waiter.future.cancel()
+        self._waiters.clear()
+        self._due.clear()
+
+    async def _run(self):
+        last_round = 0.0
+        while self._waiters:
+            now = time.time()
+            self._expire(now)
+            if not self._waiters:
+                break
+
+            next_due = self._due[0][0] if self._due else now + self.batch.interval
+            wait = max(next_due - now, last_round + self.batch.interval - now)
+            if wait > 0:
+                self._wakeup.clear()
+                try:
+                    # 新任务登记时提前唤醒，重新计算最近到期时间
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            last_round = time.time()
+            due = self._pop_due(last_round)
+            chunks = [due[i:i + self.batch.max_batch_size] for i in range(0, len(due), self.batch.max_batch_size)]
+            await asyncio.gather(*(self._query(chunk) for chunk in chunks))
+
+    def _expire(self, now: float):
+        for key, waiter in list(self._waiters.items()):
+            if now >= waiter.deadline:
+                waiter.outcome.timed_out = True
+                waiter.outcome.error = self._timeout_error(waiter)
+                self._resolve(key, waiter)
+
+    def _pop_due(self, now: float) -> List[_Waiter]:
+        due: List[_Waiter] = []
+        seen = set()
+        while self._due and self._due[0][0] <= now:
+            _, key = heapq.heappop(self._due)
+            waiter = self._waiters.get(key)
+            if waiter is not None and key not in seen:
+                seen.add(key)
+                due.append(waiter)
+        return due
+
+    def _reschedule(self, key: str, waiter: _Waiter):
+        heapq.heappush(self._due, (time.time() + waiter.backoff.next(), key))
+
+    def _resolve(self, key: str, waiter: _Waiter):
+        self._waiters.pop(key, None)
+        if not waiter.future.done():
+            waiter.future.set_result(waiter.outcome)
+
+    def _results_by_id(self, response: Any) -> Dict[str, Any]:
+        results = self.results_extractor.extract(response).get("results")
+        if isinstance(results, dict):
+            return {str(task_id): item for task_id, item in results.items()}
+        if isinstance(results, list):
+            return {
+                str(item.get(self.batch.id_field)): item
+                for item in results
+                if isinstance(item, dict) and item.get(self.batch.id_field) is not None
+            }
+        return {}
+
+    async def _query(self, waiters: List[_Waiter]):
+        payload = {self.batch.ids_field: [waiter.task_id for waiter in waiters]}
+        try:
+            success, response, error_msg, duration_ms, _ = await self.http_client.call_agent(
+                endpoint=self.batch.endpoint,
+                payload=payload,
+                headers=waiters[0].headers[0] if waiters[0].headers else None,
+                method=self.batch.method,
+            )
+        except Exception as e:
+            success, response, error_msg, duration_ms = False, None, str(e), 0.0
+        self.requests += 1
+        self.polled += len(waiters)
+        if self.on_request:
+            self.on_request(self.batch.endpoint, bool(success), duration_ms, error_msg)
+
+        results = self._results_by_id(response) if success else {}
+        if not success:
+            logger.warning("Batch status query failed", endpoint=self.batch.endpoint, error=error_msg)
+
+        for waiter in waiters:
+            key = str(waiter.task_id)
+            waiter.outcome.polls += 1
+            item = results.get(key)
+            if item is None:
+                # 请求失败或结果中没有该任务：按退避稍后重试
+                waiter.outcome.error = error_msg if not success else f"Task {waiter.task_id} missing from batch result"
+                self._reschedule(key, waiter)
+                continue
+
+            status = self.status_extractor.extract(item).get("status")
+            waiter.outcome.response = item
+            waiter.outcome.status = status
+            finished = self.config.classify(status)
+            if finished is not None:
+                waiter.outcome.success = finished
+                waiter.outcome.error = None if finished else f"Task {waiter.task_id} finished with status {status}"
+                self._resolve(key, waiter)
+                continue
+            waiter.outcome.error = None
+            if status != waiter.last_status:
+                waiter.last_status = status
+                waiter.backoff.reset()
+            self._reschedule(key, waiter)
+
+
+class PollingHub:
+    """一次运行内的共享轮询器登记表：每个配置了 batch 的轮询节点一个 BatchPoller"""
+
+    def __init__(self, http_client, on_request: Optional[RequestCallback] = None):
+        self.http_client = http_client
+        self.on_request = on_request
+        self.pollers: Dict[str, BatchPoller] = {}
+
+    def get(self, node_id: str, config: PollingConfig) -> Optional[BatchPoller]:
+        if config.batch_config is None:
+            return None
+        poller = self.pollers.get(node_id)
+        if poller is None:
+            poller = self.pollers[node_id] = BatchPoller(self.http_client, config, self.on_request)
+        return poller
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            node_id: {"requests": poller.requests, "polled": poller.polled, "pending": poller.pending}
+            for node_id, poller in self.pollers.items()
+        }
+
+    async def close(self):
+        for poller in self.pollers.values():
+            await poller.close()
+        self.pollers.clear()
+
+
+def is_polling_node(node, config: Dict[str, Any]) -> bool:
+    """node type 为 polling，或 execution_mode 为 polling 且配置了 config.polling"""
+    if (node.node_type or "").lower() == "polling":
+        return True
+    mode = getattr(node, "execution_mode", None)
+    return getattr(mode, "value", mode) == "polling" and "polling" in config
+
+
+def compile_polling(nodes) -> Dict[str, PollingConfig]:
+    """按节点配置 config.polling 预先解析轮询节点的配置（非法时抛 ValueError）"""
+    polling: Dict[str, PollingConfig] = {}
+    for node in nodes:
+        config = node.config or {}
+        if (not config) and isinstance(getattr(node, "full_config", None), dict):
+            config = node.full_config.get("config", {}) or {}
+        if is_polling_node(node, config):
+            polling[node.node_id or node.id] = PollingConfig.from_config(config.get("polling"))
+    return polling
@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Tuple
+from agent_test_platform.config.logger import logger
+
+
+class RunShare:
+    """某个运行在全局请求预算中的份额
+
+    weight: 同一优先级内按权重分配空闲槽位（加权公平排队）
+    priority: 数值大的运行优先获得槽位；同优先级之间才按权重分享
+    """
+
+    __slots__ = ("run_id", "weight", "priority", "in_flight", "granted", "queued", "wait_ms", "max_wait_ms", "_finish")
+
+    def __init__(self, run_id: str, weight: float = 1.0, priority: int = 0):
+        self.run_id = run_id
+        self.weight = weight
+        self.priority = priority
+        self.in_flight = 0
+        self.granted = 0
+        self.queued = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        # 上一次授予的虚拟完成时间
+        self._finish = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "runId": self.run_id,
+            "weight": self.weight,
+            "priority": self.priority,
+            "inFlight": self.in_flight,
+            "granted": self.granted,
+            "queued": self.queued,
+            "avgWaitMs": round(self.wait_ms / self.queued, 3) if self.queued else 0.0,
+            "maxWaitMs": round(self.max_wait_ms, 3),
+        }
+
+
+class GlobalQuota:
+    """平台级在途请求预算，在同一进程的所有运行之间分配请求槽位
+
+    采用起始时间公平排队（SFQ）：每个请求的虚拟起始时间为 max(系统虚拟时间, 该运行上一次的
+    虚拟完成时间)，完成时间 = 起始时间 + 1 / weight；有空闲槽位时按 (优先级, 起始时间) 出队。
+    运行空闲期间不会积累额度，因此大运行无法饿死后加入的小运行。
+    limit <= 0 表示不限制（只做计数）。
+    """
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.in_flight = 0
+        self.shares: Dict[str, RunShare] = {}
+        # (-priority, 虚拟起始时间, 序号, future, share)
+        self._waiters: List[Tuple[int, float, int, asyncio.Future, RunShare]] = []
+        self._seq = itertools.count()
+        self._vtime = 0.0
+
+    def register(self, run_id: str, weight: float = 1.0, priority: int = 0) -> RunShare:
+        if weight <= 0:
+            raise ValueError("weight must be > 0")
+        share = self.shares.get(run_id)
+        if share is None:
+            share = self.shares[run_id] = RunShare(run_id, float(weight), int(priority))
+            share._finish = self._vtime
+        return share
+
+    def unregister(self, run_id: str):
+        share = self.shares.pop(run_id, None)
+        if share is not None and share.in_flight:
+            logger.warning("Run left quota with requests in flight", run_id=run_id, in_flight=share.in_flight)
+
+    def _tag(self, share: RunShare) -> float:
+        start = max(self._vtime, share._finish)
+        share._finish = start + 1.0 / share.weight
+        return start
+
+    def _grant(self, share: RunShare):
+        self.in_flight += 1
+        share.in_flight += 1
+        share.granted += 1
+
+    async def acquire(self, share: RunShare):
+        if self.limit <= 0:
+            self._grant(share)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-share.priority, self._tag(share), next(self._seq), future, share))
+        self._dispatch()
+        if future.done():
+            return
+
+        queued_at = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已被授予槽位但等待方被取消：归还槽位
+            if future.done() and not future.cancelled():
+                self.release(share)
+            raise
+        waited = (time.perf_counter() - queued_at) * 1000
+        share.queued += 1
+        share.wait_ms += waited
+        if waited > share.max_wait_ms:
+            share.max_wait_ms = waited
+
+    def release(self, share: RunShare):
+        self.in_flight -= 1
+        share.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters and self.in_flight < self.limit:
+            _, start, _, future, share = heapq.heappop(self._waiters)
+            if future.done():
+                # 等待方已取消
+                continue
+            self._vtime = max(self._vtime, start)
+            self._grant(share)
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, share: RunShare):
+        await self.acquire(share)
+        try:
+            yield
+        finally:
+            self.release(share)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "inFlight": self.in_flight,
+            "waiting": sum(1 for waiter in self._waiters if not waiter[3].done()),
+            "runs": [share.to_dict() for share in self.shares.values()],
+        }
+
+
+class QuotaHTTPClient:
+    """某个运行的 HTTP 客户端视图：共享连接池，每个请求先从全局预算领取槽位
+
+    排队等待槽位的时间不计入请求耗时（耗时从真正发出请求开始计算），单独记录在 RunShare 中。
+    """
+
+    def __init__(self, http_client, quota: GlobalQuota, share: RunShare):
+        self.http_client = http_client
+        self.quota = quota
+        self.share = share
+
+    async def call_agent(self, *args, **kwargs):
+        async with self.quota.slot(self.share):
+            return await self.http_client.call_agent(*args, **kwargs)
+
+    async def stream_agent(self, *args, **kwargs):
+        async with self.quota.slot(self.share):
+            return await self.http_client.stream_agent(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.http_client, name)
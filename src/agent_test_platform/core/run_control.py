@@ -0,0 +1,197 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Coroutine, List, Optional, Set
+from agent_test_platform.config.logger import logger
+from agent_test_platform.config.settings import settings
+from agent_test_platform.core.state_machine import StateMachine, TestState
+
+
+class RunCancelled(Exception):
+    """运行已被取消（虚拟用户在检查点 / 等待中收到取消）"""
+
+
+class RunController:
+    """单次运行的控制句柄：暂停 / 恢复 / 取消
+
+    - 暂停：生成器不再启动新用户，已启动的用户在下一个节点前的检查点挂起；
+      正在进行的请求照常完成
+    - 取消：挂起的用户与思考时间 / ramp-up 等待立即结束，正在进行的请求最多等待
+      drain_timeout 秒，之后强制取消剩余的用户任务
+    状态转移沿用 StateMachine（RUNNING <-> PAUSED -> CANCELLED）。
+    """
+
+    def __init__(self, run_id: str, drain_timeout: Optional[float] = None):
+        self.run_id = run_id
+        self.drain_timeout = settings.RUN_CANCEL_DRAIN_SECONDS if drain_timeout is None else drain_timeout
+        self.state_machine = StateMachine(TestState.RUNNING)
+
+        # set 表示未暂停；取消时也会 set，唤醒所有挂起的用户
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._cancelled: Optional[asyncio.Future] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.paused_at: Optional[float] = None
+        self.paused_seconds = 0.0
+        self.cancel_reason: Optional[str] = None
+        # 控制动作的订阅方（如把暂停 / 恢复 / 取消转发给 worker 进程）
+        self._listeners: List[Callable[[str, Optional[str]], None]] = []
+
+    @property
+    def state(self) -> TestState:
+        return self.state_machine.get_current_state()
+
+    @property
+    def paused(self) -> bool:
+        return self.state == TestState.PAUSED
+
+    @property
+    def cancelled(self) -> bool:
+        return self.state == TestState.CANCELLED
+
+    def _cancel_future(self) -> asyncio.Future:
+        if self._cancelled is None:
+            self._cancelled = asyncio.get_running_loop().create_future()
+            if self.cancelled:
+                self._cancelled.set_result(None)
+        return self._cancelled
+
+    # ============================================================
+    # 虚拟用户 / 生成器侧
+    # ============================================================
+
+    async def admit(self) -> bool:
+        """生成器启动下一个用户前调用：暂停时等待，已取消返回 False"""
+        if not self._resumed.is_set():
+            await self._resumed.wait()
+        return not self.cancelled
+
+    async def checkpoint(self):
+        """节点之间的检查点：暂停时挂起，已取消时抛 RunCancelled"""
+        if not self._resumed.is_set():
+            await self._resumed.wait()
+        if self.cancelled:
+            raise RunCancelled(self.cancel_reason or "Run cancelled")
+
+    async def sleep(self, awaitable: Awaitable):
+        """可被取消打断的等待（思考时间 / ramp-up / 轮询间隔）"""
+        if self.cancelled:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise RunCancelled(self.cancel_reason or "Run cancelled")
+        waiter = asyncio.ensure_future(awaitable)
+        cancelled = self._cancel_future()
+        try:
+            await asyncio.wait((waiter, cancelled), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+        if not waiter.done() or waiter.cancelled():
+            raise RunCancelled(self.cancel_reason or "Run cancelled")
+        return waiter.result()
+
+    async def run(self, coro: Coroutine) -> Any:
+        """在独立任务中执行一个用户并登记，取消时可被强制结束；被强制取消的用户视为失败"""
+        if self.cancelled:
+            coro.close()
+            return False
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        try:
+            await asyncio.wait((task,))
+        finally:
+            self._tasks.discard(task)
+            if not task.done():
+                task.cancel()
+        if task.cancelled():
+            return False
+        return task.result()
+
+    # ============================================================
+    # 控制侧
+    # ============================================================
+
+    def subscribe(self, listener: Callable[[str, Optional[str]], None]) -> Callable[[], None]:
+        """订阅控制动作 listener(action, reason)，action 为 pause / resume / cancel；返回取消订阅函数"""
+        self._listeners.append(listener)
+
+        def unsubscribe():
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return unsubscribe
+
+    def _notify(self, action: str, reason: Optional[str] = None):
+        for listener in list(self._listeners):
+            try:
+                listener(action, reason)
+            except Exception as e:
+                logger.error(f"Run control listener failed: {e}", run_id=self.run_id, action=action)
+
+    def pause(self) -> bool:
+        if not self.state_machine.transition(TestState.PAUSED):
+            return False
+        self._resumed.clear()
+        self.paused_at = time.monotonic()
+        logger.info("Run paused", run_id=self.run_id, active_users=len(self._tasks))
+        self._notify("pause")
+        return True
+
+    def resume(self) -> bool:
+        if not self.state_machine.transition(TestState.RUNNING):
+            return False
+        if self.paused_at is not None:
+            self.paused_seconds += time.monotonic() - self.paused_at
+            self.paused_at = None
+        self._resumed.set()
+        logger.info("Run resumed", run_id=self.run_id)
+        self._notify("resume")
+        return True
+
+    async def cancel(self, reason: Optional[str] = None) -> bool:
+        """取消运行并等待用户任务结束（在途请求最多等待 drain_timeout 秒）"""
+        if not self.state_machine.transition(TestState.CANCELLED):
+            return False
+        self.cancel_reason = reason
+        if self.paused_at is not None:
+            self.paused_seconds += time.monotonic() - self.paused_at
+            self.paused_at = None
+        cancelled = self._cancel_future()
+        if not cancelled.done():
+            cancelled.set_result(None)
+        self._resumed.set()
+        self._notify("cancel", reason)
+
+        tasks = list(self._tasks)
+        pending: Set[asyncio.Task] = set()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        logger.info(
+            "Run cancelled",
+            run_id=self.run_id,
+            drained=len(tasks) - len(pending),
+            force_cancelled=len(pending),
+        )
+        return True
+
+    def finish(self, state: TestState = TestState.COMPLETED):
+        """运行自然结束（暂停中结束时先恢复，以满足状态转移）"""
+        if self.paused:
+            self.resume()
+        self.state_machine.transition(state)
+
+    def to_dict(self) -> dict:
+        paused_seconds = self.paused_seconds
+        if self.paused_at is not None:
+            paused_seconds += time.monotonic() - self.paused_at
+        return {
+            "state": self.state.value,
+            "activeUsers": len(self._tasks),
+            "pausedSeconds": round(paused_seconds, 3),
+            "cancelReason": self.cancel_reason,
+        }
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List
+from agent_test_platform.core.run_control import RunController
+from agent_test_platform.core.metrics import RunMetrics
+from agent_test_platform.core.spawner import UserSpawner
+from agent_test_platform.core.load_model import OpenModelRunner
+from agent_test_platform.core.quota import RunShare
+from agent_test_platform.core.workers import WorkerGroup
+
+
+class RunAlreadyActiveError(ValueError):
+    """同一个 run_id 已在本进程中运行"""
+
+
+@dataclass
+class RunContext:
+    """单次运行的运行时状态
+
+    每个运行各自持有状态机 / 取消令牌（controller）、用户生成器、在线统计等，
+    多个运行并发时互不干扰。
+    """
+
+    run_id: str
+    kind: str = "node"                          # node / yaml / multi_turn
+    controller: Optional[RunController] = None
+    metrics: Optional[RunMetrics] = None
+    spawner: Optional[UserSpawner] = None        # closed 模型
+    workers: Optional[WorkerGroup] = None        # closed 模型分片到 worker 进程时
+    arrivals: Optional[OpenModelRunner] = None   # open 模型
+    quota: Optional[RunShare] = None             # 在全局请求预算中的份额
+    test_run: Any = None                         # YAML 模式的 TestRun 记录
+    task: Optional[asyncio.Task] = None          # 驱动该运行的后台任务
+    started_at: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        if self.controller is None:
+            self.controller = RunController(self.run_id)
+
+    @property
+    def state_machine(self):
+        return self.controller.state_machine
+
+    def spawner_metrics(self) -> Optional[Dict[str, Any]]:
+        """用户启动指标；分片到 worker 进程时为各 worker 的汇总"""
+        if self.workers is not None:
+            return self.workers.metrics()
+        return self.spawner.metrics() if self.spawner else None
+
+    def stats(self) -> Dict[str, Any]:
+        """运行中的实时指标（用户启动 / 到达、请求量与延迟、控制状态）"""
+        data: Dict[str, Any] = {
+            "runId": self.run_id,
+            "kind": self.kind,
+            "startedAt": self.started_at,
+            "elapsed": round(time.time() - self.started_at, 3),
+            "control": self.controller.to_dict(),
+            "spawner": self.spawner_metrics(),
+            "arrivals": self.arrivals.stats.to_dict() if self.arrivals else None,
+            "quota": self.quota.to_dict() if self.quota else None,
+        }
+        if self.metrics is not None:
+            data["users"] = {
+                "success": self.metrics.success_users,
+                "failed": self.metrics.failed_users,
+            }
+            data["requests"] = self.metrics.requests.to_dict()
+        return data
+
+    def snapshot(self) -> Dict[str, Any]:
+        """stats 加上按节点的计数与延迟分位数（WebSocket 连接时下发的当前状态）"""
+        data = self.stats()
+        if self.metrics is not None:
+            data["nodes"] = [
+                {"nodeId": node_id, "nodeName": stats.name, **stats.to_dict()}
+                for node_id, stats in self.metrics.nodes.items()
+            ]
+        return data
+
+
+class RunRegistry:
+    """本进程中正在运行的测试：run_id -> RunContext"""
+
+    def __init__(self):
+        self._runs: Dict[str, RunContext] = {}
+
+    def create(self, run_id: str, kind: str = "node", **kwargs) -> RunContext:
+        """登记新运行；同一 run_id 仍在运行时抛 RunAlreadyActiveError"""
+        if run_id in self._runs:
+            raise RunAlreadyActiveError(f"Test run already active: {run_id}")
+        context = self._runs[run_id] = RunContext(run_id=run_id, kind=kind, **kwargs)
+        return context
+
+    def get(self, run_id: str) -> Optional[RunContext]:
+        return self._runs.get(run_id)
+
+    def remove(self, run_id: str) -> Optional[RunContext]:
+        return self._runs.pop(run_id, None)
+
+    def active(self) -> List[RunContext]:
+        return list(self._runs.values())
+
+    def __contains__(self, run_id: str) -> bool:
+        return run_id in self._runs
+
+    def __len__(self) -> int:
+        return len(self._runs)
@@ -0,0 +1,190 @@
+import asyncio
+import heapq
+import itertools
+import math
+import random
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple, Union
+
+
+@dataclass
+class ThinkTime:
+    """步骤 / 节点之间的思考时间分布（秒）
+
+    配置示例：
+        think_time: 2                                    # 常量
+        think_time: {type: uniform, min: 1, max: 3}
+        think_time: {type: exponential, mean: 2, max: 10}
+        think_time: {type: lognormal, mean: 2, sigma: 0.5}
+    """
+
+    type: str = "constant"       # constant, uniform, exponential, lognormal
+    value: float = 0.0           # constant
+    min: float = 0.0             # uniform
+    max: Optional[float] = None  # uniform 上界；exponential / lognormal 的截断上限
+    mean: float = 0.0            # exponential / lognormal 的均值
+    sigma: float = 0.5           # lognormal 形状参数
+
+    @classmethod
+    def from_config(cls, data: Union[None, int, float, Dict[str, Any]]) -> Optional["ThinkTime"]:
+        """解析配置；未配置时返回 None，配置非法时抛 ValueError"""
+        if data is None:
+            return None
+        if isinstance(data, (int, float)):
+            data = {"type": "constant", "value": data}
+        if not isinstance(data, dict):
+            raise ValueError(f"Invalid think_time: {data!r}")
+
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+        think_time = cls(**known)
+        think_time.type = (think_time.type or "constant").lower()
+
+        if think_time.type == "constant":
+            valid = think_time.value >= 0
+        elif think_time.type == "uniform":
+            valid = think_time.max is not None and 0 <= think_time.min <= think_time.max
+        elif think_time.type in ("exponential", "lognormal"):
+            valid = think_time.mean > 0 and think_time.sigma > 0
+        else:
+            raise ValueError(f"Unknown think_time type: {think_time.type}")
+        if not valid:
+            raise ValueError(f"Invalid {think_time.type} think_time parameters: {data!r}")
+        return think_time
+
+    def sample(self, rng: Optional[random.Random] = None) -> float:
+        rng = rng or random
+        if self.type == "constant":
+            return self.value
+        if self.type == "uniform":
+            return rng.uniform(self.min, self.max)
+        if self.type == "exponential":
+            value = rng.expovariate(1 / self.mean)
+        else:
+            # 以分布均值配置：mean = exp(mu + sigma^2 / 2)
+            mu = math.log(self.mean) - self.sigma ** 2 / 2
+            value = rng.lognormvariate(mu, self.sigma)
+        return min(value, self.max) if self.max is not None else value
+
+
+@dataclass
+class RampUp:
+    """用户启动爬坡：计算第 i 个用户相对运行开始的计划启动时间（秒）"""
+
+    duration: float = 0.0
+    shape: str = "linear"    # linear, exponential
+    factor: float = 3.0      # exponential 的陡峭程度，越大前期越稀疏
+
+    @classmethod
+    def from_config(cls, duration: Optional[float], shape: Optional[str] = None, factor: Optional[float] = None) -> "RampUp":
+        ramp = cls(
+            duration=float(duration or 0),
+            shape=(shape or "linear").lower(),
+            factor=float(factor) if factor is not None else 3.0,
+        )
+        if ramp.duration < 0:
+            raise ValueError("ramp_up_time must be >= 0")
+        if ramp.shape not in ("linear", "exponential"):
+            raise ValueError(f"Unknown ramp_up shape: {ramp.shape}")
+        if ramp.shape == "exponential" and ramp.factor <= 0:
+            raise ValueError("ramp_up factor must be > 0")
+        return ramp
+
+    def offset(self, user_index: int, total_users: int) -> float:
+        if self.duration <= 0 or total_users <= 1:
+            return 0.0
+        fraction = user_index / total_users
+        if self.shape == "linear":
+            return self.duration * fraction
+        # 已启动用户数随时间指数增长：N(t) = N * (e^(a*t/D) - 1) / (e^a - 1)
+        a = self.factor
+        return self.duration / a * math.log1p(fraction * math.expm1(a))
+
+
+class UserScheduler:
+    """所有虚拟用户共享的定时调度器
+
+    用户按绝对截止时间（事件循环时钟）挂起，调度器只维护一个最小堆和
+    一个 loop.call_at 定时器：到期时批量唤醒所有已到期的用户。截止时间
+    由计划时间直接计算，不会因为多次相对 sleep 而累积漂移。
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.origin: Optional[float] = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop
+
+    def start(self) -> float:
+        """记录运行起点（ramp-up 偏移以此为基准）"""
+        self.origin = self.now()
+        return self.origin
+
+    def now(self) -> float:
+        return self._get_loop().time()
+
+    async def sleep_until(self, deadline: float):
+        loop = self._get_loop()
+        if deadline <= loop.time():
+            return
+
+        future = loop.create_future()
+        heapq.heappush(self._heap, (deadline, next(self._seq), future))
+        if self._heap[0][2] is future:
+            self._arm()
+        await future
+
+    async def sleep_from(self, anchor: float, seconds: float):
+        """从 anchor 时刻起等待 seconds 秒"""
+        if seconds > 0:
+            await self.sleep_until(anchor + seconds)
+
+    async def wait_for_start(self, offset: float):
+        """等待到运行起点后的 offset 秒"""
+        if self.origin is None:
+            self.start()
+        await self.sleep_until(self.origin + offset)
+
+    def _arm(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._heap:
+            self._handle = self._get_loop().call_at(self._heap[0][0], self._fire)
+
+    def _fire(self):
+        self._handle = None
+        now = self._get_loop().time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                future.set_result(None)
+        self._arm()
+
+    def close(self):
+        """取消所有挂起的等待"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                future.cancel()
+
+
+def compile_think_times(nodes) -> Dict[str, ThinkTime]:
+    """按节点配置 config.think_time 预先解析各节点的思考时间"""
+    think_times: Dict[str, ThinkTime] = {}
+    for node in nodes:
+        config = node.config or {}
+        if (not config) and isinstance(getattr(node, "full_config", None), dict):
+            config = node.full_config.get("config", {}) or {}
+        think_time = ThinkTime.from_config(config.get("think_time"))
+        if think_time is not None:
+            think_times[node.node_id or node.id] = think_time
+    return think_times
@@ -1,5 +1,4 @@
 
-import asyncio
 import time
 from typing import Dict, Any, Optional, List
 from datetime import datetime
@@ -12,6 +11,10 @@ from agent_test_platform.storage.database import Database
 from agent_test_platform.integrations.openai_client import OpenAIClient
 from agent_test_platform.models.node_based import TestRun, RunStatus
 from agent_test_platform.models.conversation_model import VirtualUserProfile
+from agent_test_platform.core.spawner import UserSpawner
+from agent_test_platform.core.metrics import MetricsRegistry
+from agent_test_platform.core.run_registry import RunRegistry
+from agent_test_platform.core.quota import GlobalQuota, QuotaHTTPClient
 
 
 class SmartTestOrchestrator:
@@ -23,6 +26,9 @@ class SmartTestOrchestrator:
         http_client: AgentHTTPClient,
         openai_api_key: Optional[str] = None,
         on_event_callback=None,
+        metrics: Optional[MetricsRegistry] = None,
+        runs: Optional[RunRegistry] = None,
+        quota: Optional[GlobalQuota] = None,
     ):
         self.db = db
         self.http_client = http_client
@@ -31,6 +37,14 @@ class SmartTestOrchestrator:
         
         # 节点配置缓存
         self.node_strategies: Dict[str, NodeStrategy] = {}
+        
+        # 运行中的测试（与 TestOrchestrator 共享时，活跃运行列表与暂停 / 取消对多轮对话测试同样生效）
+        self.runs = runs or RunRegistry()
+        # 平台级在途请求预算（与 TestOrchestrator 共享）
+        self.quota = quota or GlobalQuota()
+        
+        # 在线延迟统计（与 TestOrchestrator 共享时，摘要接口可在运行中读取）
+        self.metrics = metrics or MetricsRegistry(db)
     
     async def run_multi_turn_test(
         self,
@@ -49,39 +63,42 @@ class SmartTestOrchestrator:
             num_users=num_users,
         )
         
+        try:
+            context = self.runs.create(test_run_id, kind="multi_turn")
+        except ValueError as e:
+            logger.error(f"Test failed: {e}")
+            return False
+        
         try:
             # 1. 加载节点策略
             for node_id, config in node_configs.items():
                 self.node_strategies[node_id] = NodeStrategy(node_id, config)
             
-            # 2. 创建虚拟用户配置
-            user_configs = [
-                UserConfigTemplate.get_user_config(i, scenario_name)
-                for i in range(num_users)
-            ]
-            
-            # 3. 并发执行用户
-            semaphore = asyncio.Semaphore(concurrency)
+            # 2. 并发执行用户（虚拟用户配置在用户启动时才生成）
+            run_metrics = context.metrics = self.metrics.start(test_run_id)
+            context.quota = self.quota.register(test_run_id)
+            http_client = QuotaHTTPClient(self.http_client, self.quota, context.quota)
             
             async def run_user_test(user_index: int):
-                async with semaphore:
-                    return await self._execute_single_user(
-                        test_run_id=test_run_id,
-                        user_index=user_index,
-                        user_config=user_configs[user_index],
-                        node_configs=node_configs,
-                    )
-            
-            tasks = [
-                asyncio.create_task(run_user_test(i))
-                for i in range(num_users)
-            ]
+                ok = await self._execute_single_user(
+                    test_run_id=test_run_id,
+                    user_index=user_index,
+                    user_config=UserConfigTemplate.get_user_config(user_index, scenario_name),
+                    node_configs=node_configs,
+                    http_client=http_client,
+                )
+                run_metrics.record_user(ok)
+                return ok
             
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            spawner = context.spawner = UserSpawner(run_user_test, num_users, concurrency, controller=context.controller)
+            try:
+                await spawner.run()
+            finally:
+                context.spawner = None
             
-            # 4. 汇总结果
-            successful = sum(1 for r in results if r is True)
-            failed = sum(1 for r in results if r is False)
+            # 3. 汇总结果
+            successful = spawner.successful
+            failed = spawner.failed
             
             logger.info(
                 f"Test completed",
@@ -90,14 +107,18 @@ class SmartTestOrchestrator:
                 failed=failed,
             )
             
-            # 5. 更新测试状态
+            # 4. 更新测试状态（先等待执行记录落库）
+            await self.db.flush()
+            failed_rows = self.db.take_failed_rows(test_run_id)
             test_run = await self.db.get(TestRun, test_run_id)
             if test_run:
-                test_run.status = RunStatus.DONE
+                test_run.status = RunStatus.CANCELLED if context.controller.cancelled else RunStatus.DONE
                 test_run.completed_users = successful
                 test_run.failed_users = failed
+                test_run.config = {**(test_run.config or {}), "failed_rows": failed_rows}
                 test_run.progress = 100
                 await self.db.update(test_run)
+            await self.metrics.finish(test_run_id)
             
             return True
         
@@ -109,8 +130,13 @@ class SmartTestOrchestrator:
             if test_run:
                 test_run.status = RunStatus.FAILED
                 await self.db.update(test_run)
+            await self.metrics.finish(test_run_id)
             
             return False
+        
+        finally:
+            self.runs.remove(test_run_id)
+            self.quota.unregister(test_run_id)
     
     async def _execute_single_user(
         self,
@@ -118,6 +144,7 @@ class SmartTestOrchestrator:
         user_index: int,
         user_config: Dict[str, Any],
         node_configs: Dict[str, Dict[str, Any]],
+        http_client=None,
     ) -> bool:
         """执行单个用户的测试"""
         
@@ -142,7 +169,7 @@ class SmartTestOrchestrator:
                 target_task_keywords=user_config.get("target_task_keywords", []),
             )
             
-            user_profile = await self.db.create(user_profile)
+            user_profile = await self.db.create_deferred(user_profile, test_run_id)
             
             # 2. 执行每个节点
             for node_id, node_config in node_configs.items():
@@ -160,9 +187,10 @@ class SmartTestOrchestrator:
                     node_name=node_config.get("name"),
                     test_run_id=test_run_id,
                     db=self.db,
-                    http_client=self.http_client,
+                    http_client=http_client or self.http_client,
                     ai_client=self.ai_client,
                     on_event_callback=self.on_event_callback,
+                    metrics=self.metrics.get(test_run_id),
                 )
                 
                 # 执行对话
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from typing import Dict, Any, Optional, Iterable, Iterator, Callable, Awaitable, List
+from agent_test_platform.config.logger import logger
+from agent_test_platform.core.run_control import RunController, RunCancelled
+
+
+class UserSpawner:
+    """固定大小的 worker 池，从用户序号生成器中惰性取出并执行虚拟用户
+
+    只创建 concurrency 个 worker 任务，每个 worker 依次执行多个用户，
+    内存占用与并发数成正比，而不是与用户总数成正比。
+    传入 controller 时，暂停期间不再启动新用户，取消后 worker 直接退出。
+    """
+
+    # 计算瞬时启动速率的滑动窗口（秒）
+    RATE_WINDOW_SECONDS = 10
+
+    def __init__(
+        self,
+        run_user: Callable[[int], Awaitable[bool]],
+        total_users: int,
+        concurrency: int,
+        user_indices: Optional[Iterable[int]] = None,
+        controller: Optional[RunController] = None,
+    ):
+        self.run_user = run_user
+        self.total_users = total_users
+        self.concurrency = max(1, min(concurrency, total_users)) if total_users > 0 else 0
+        self._indices: Iterator[int] = iter(user_indices if user_indices is not None else range(total_users))
+        self.controller = controller
+
+        # 实时指标
+        self.spawned = 0
+        self.active = 0
+        self.successful = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        # 每秒启动数的环形计数器：second -> count
+        self._rate_buckets: List[int] = [0] * self.RATE_WINDOW_SECONDS
+        self._rate_seconds: List[int] = [-1] * self.RATE_WINDOW_SECONDS
+
+    async def run(self) -> "UserSpawner":
+        """运行直到所有用户执行完成"""
+        self.started_at = time.monotonic()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                if not worker.done():
+                    worker.cancel()
+            self.finished_at = time.monotonic()
+
+        logger.info("User spawner finished", **self.metrics())
+        return self
+
+    async def _worker(self):
+        # 所有 worker 共享同一个迭代器；next() 之间没有 await，单事件循环下无需加锁
+        controller = self.controller
+        while True:
+            if controller is not None and not await controller.admit():
+                return
+            user_index = next(self._indices, None)
+            if user_index is None:
+                return
+            self._record_spawn()
+            self.active += 1
+            try:
+                if controller is not None:
+                    ok = await controller.run(self.run_user(user_index))
+                else:
+                    ok = await self.run_user(user_index)
+            except asyncio.CancelledError:
+                raise
+            except RunCancelled:
+                ok = False
+            except Exception as e:
+                logger.error(f"User {user_index} raised: {e}")
+                ok = False
+            finally:
+                self.active -= 1
+
+            if ok is True:
+                self.successful += 1
+            else:
+                self.failed += 1
+
+    def _record_spawn(self):
+        self.spawned += 1
+        second = int(time.monotonic())
+        slot = second % self.RATE_WINDOW_SECONDS
+        if self._rate_seconds[slot] != second:
+            self._rate_seconds[slot] = second
+            self._rate_buckets[slot] = 0
+        self._rate_buckets[slot] += 1
+
+    @property
+    def backlog(self) -> int:
+        """尚未启动的用户数"""
+        return max(0, self.total_users - self.spawned)
+
+    def spawn_rate(self) -> float:
+        """最近窗口内的用户启动速率（用户/秒）"""
+        if self.started_at is None:
+            return 0.0
+        now = int(time.monotonic())
+        recent = sum(
+            count
+            for second, count in zip(self._rate_seconds, self._rate_buckets)
+            if now - self.RATE_WINDOW_SECONDS < second <= now
+        )
+        window = min(self.RATE_WINDOW_SECONDS, max(1.0, time.monotonic() - self.started_at))
+        return recent / window
+
+    def metrics(self) -> Dict[str, Any]:
+        end = self.finished_at or time.monotonic()
+        elapsed = (end - self.started_at) if self.started_at is not None else 0.0
+        return {
+            "total_users": self.total_users,
+            "concurrency": self.concurrency,
+            "spawned": self.spawned,
+            "active": self.active,
+            "backlog": self.backlog,
+            "successful": self.successful,
+            "failed": self.failed,
+            "spawn_rate": round(self.spawn_rate(), 3),
+            "elapsed_s": round(elapsed, 3),
+        }
@@ -0,0 +1,97 @@
+import re
+from typing import Dict, Any, List, Tuple, Union
+
+# {context.xxx} 或 {xxx}
+PLACEHOLDER_PATTERN = re.compile(r'\{(?:context\.)?(\w+)\}')
+
+
+class PayloadTemplate:
+    """预编译的请求体模板
+
+    编译时遍历一次模板，生成渲染计划：
+    - 不含占位符的子树原样保留，渲染结果直接引用（不拷贝）
+    - 整个字符串就是一个占位符时（如 "{task_id}"）按原类型替换，数字 / 列表等不会被转成字符串
+    - 其余字符串预先拆成「字面量 / 变量名」片段，渲染时只做拼接
+    渲染结果与模板共享静态子树，调用方不应原地修改返回的请求体。
+    """
+
+    __slots__ = ("template", "is_static", "_render")
+
+    def __init__(self, template: Any):
+        self.template = template
+        self.is_static, self._render = _compile(template)
+
+    @classmethod
+    def compile(cls, template: Union["PayloadTemplate", Any]) -> "PayloadTemplate":
+        if isinstance(template, cls):
+            return template
+        return cls(template if template is not None else {})
+
+    def render(self, context: Dict[str, Any]) -> Any:
+        if self.is_static:
+            return self.template
+        return self._render(context)
+
+
+def _compile(obj: Any) -> Tuple[bool, Any]:
+    """返回 (是否静态, 静态值或渲染函数)"""
+    if isinstance(obj, str):
+        return _compile_string(obj)
+
+    if isinstance(obj, dict):
+        items = [(key,) + _compile(value) for key, value in obj.items()]
+        if all(is_static for _, is_static, _ in items):
+            return True, obj
+
+        def render_dict(context, items=items):
+            return {
+                key: value if is_static else value(context)
+                for key, is_static, value in items
+            }
+        return False, render_dict
+
+    if isinstance(obj, list):
+        items = [_compile(item) for item in obj]
+        if all(is_static for is_static, _ in items):
+            return True, obj
+
+        def render_list(context, items=items):
+            return [value if is_static else value(context) for is_static, value in items]
+        return False, render_list
+
+    return True, obj
+
+
+def _compile_string(text: str) -> Tuple[bool, Any]:
+    match = PLACEHOLDER_PATTERN.fullmatch(text)
+    if match:
+        key = match.group(1)
+        return False, lambda context: context.get(key, '')
+
+    # split 带捕获组：[字面量, 变量名, 字面量, 变量名, ..., 字面量]
+    parts = PLACEHOLDER_PATTERN.split(text)
+    if len(parts) == 1:
+        return True, text
+
+    head = parts[0]
+    slots: List[Tuple[str, str]] = list(zip(parts[1::2], parts[2::2]))
+
+    def render_string(context):
+        pieces = [head]
+        for key, literal in slots:
+            pieces.append(str(context.get(key, '')))
+            pieces.append(literal)
+        return ''.join(pieces)
+    return False, render_string
+
+
+def compile_payload_templates(nodes) -> Dict[str, PayloadTemplate]:
+    """按节点配置 config.payload 预先编译各动作节点的请求体模板"""
+    templates: Dict[str, PayloadTemplate] = {}
+    for node in nodes:
+        config = node.config or {}
+        if (not config) and isinstance(getattr(node, "full_config", None), dict):
+            config = node.full_config.get("config", {}) or {}
+        if "payload" in config:
+            templates[node.node_id or node.id] = PayloadTemplate.compile(config.get("payload"))
+    return templates
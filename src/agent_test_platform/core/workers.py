@@ -0,0 +1,470 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+from agent_test_platform.config.logger import logger, setup_logging
+from agent_test_platform.config.settings import settings
+from agent_test_platform.core.metrics import RunMetrics
+from agent_test_platform.core.events import EventAggregator
+from agent_test_platform.core.execution_plan import ExecutionPlan
+from agent_test_platform.core.node_runner import NodeUserRunner, scenario_from_spec
+from agent_test_platform.core.run_control import RunController
+from agent_test_platform.core.spawner import UserSpawner
+
+
+# 取消后 worker 排空在途请求之外，额外等待其落库 / 退出的时间（秒）
+WORKER_EXIT_GRACE_SECONDS = 10.0
+
+
+def shard_users(total_users: int, concurrency: int, workers: int) -> List[Tuple[range, int]]:
+    """把用户序号交错分成 workers 个分片（第 k 片为 range(k, total, workers)），并发数按分片大小分配
+
+    分片数不超过用户数与并发数，保证每个分片至少有 1 个用户、1 个并发。
+    """
+    workers = max(1, min(workers, total_users, concurrency))
+    return [
+        (range(k, total_users, workers), concurrency // workers + (1 if k < concurrency % workers else 0))
+        for k in range(workers)
+    ]
+
+
+def worker_count(requested: Optional[int] = None) -> int:
+    """生效的 worker 进程数：run_config.workers 优先，缺省 LOAD_WORKERS（通常设为负载机的 CPU 核数）"""
+    return max(0, int(requested if requested is not None else settings.LOAD_WORKERS))
+
+
+# ============================================================
+# worker 进程
+# ============================================================
+
+class PipeChannel:
+    """本地 worker 进程侧的管道：命令由读线程转入 commands 队列，管道断开视为协调方退出"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands: asyncio.Queue = asyncio.Queue()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        threading.Thread(target=self._read, args=(loop,), daemon=True).start()
+
+    def _read(self, loop: asyncio.AbstractEventLoop):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                message = ("cancel", "Coordinator disconnected")
+            try:
+                loop.call_soon_threadsafe(self.commands.put_nowait, message)
+            except RuntimeError:
+                # 事件循环已结束
+                return
+            if message[0] == "cancel":
+                return
+
+    async def send(self, kind: str, payload: Dict[str, Any]):
+        self.conn.send((kind, payload))
+
+
+async def run_shard(channel, spec: Dict[str, Any]):
+    """在当前进程中执行一个用户分片，通过 channel 回传（本地 worker 进程与远程 worker 共用）
+
+    channel 需提供 send(kind, payload) 协程与 commands 队列（元素为 (action, reason)）。
+    回传消息：ready / delta / done，初始化失败时为 error。
+    """
+    # 延迟导入：只在 worker 中创建数据库 / HTTP 客户端
+    from agent_test_platform.storage.database import Database
+    from agent_test_platform.http_client.client import AgentHTTPClient
+
+    run_id = spec["run_id"]
+    db = Database()
+    http_client = AgentHTTPClient()
+    try:
+        # 先初始化数据库（加载全部模型），再还原场景节点
+        await db.initialize(create_schema=False)
+        await http_client.start()
+        scenario, nodes = scenario_from_spec(spec["scenario"])
+        plan = ExecutionPlan.compile(nodes)
+    except Exception as e:
+        logger.error(f"Load worker failed to start: {e}", run_id=run_id, worker=spec.get("worker"))
+        await channel.send("error", {"error": str(e)})
+        await http_client.close()
+        await db.close()
+        return
+
+    controller = RunController(run_id, drain_timeout=spec.get("drain_timeout"))
+    metrics = RunMetrics(run_id)
+    # 事件在 worker 内先合并（计数 + 样本），随指标增量回传
+    events = EventAggregator() if spec.get("events") else None
+    indices = range(*spec["users"])
+    runner = NodeUserRunner(
+        run_id, scenario, plan, spec.get("run_config") or {}, spec["total_users"],
+        db, http_client, metrics, controller, on_event_callback=events,
+    )
+    spawner = UserSpawner(
+        runner.run_user_after_ramp_up, len(indices), spec["concurrency"],
+        user_indices=indices, controller=controller,
+    )
+
+    def report() -> Dict[str, Any]:
+        return {
+            "metrics": metrics.take_delta(),
+            "spawner": spawner.metrics(),
+            "events": events.take() if events is not None else None,
+        }
+
+    async def handle_commands():
+        while True:
+            action, reason = await channel.commands.get()
+            if action == "pause":
+                controller.pause()
+            elif action == "resume":
+                controller.resume()
+            elif action == "cancel":
+                await controller.cancel(reason)
+                return
+
+    async def report_loop():
+        interval = spec.get("report_interval") or settings.WORKER_REPORT_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            await channel.send("delta", report())
+
+    await channel.send("ready", {"pid": os.getpid()})
+    runner.start()
+    background = [asyncio.create_task(handle_commands()), asyncio.create_task(report_loop())]
+    try:
+        await spawner.run()
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await runner.close()
+        try:
+            # 执行记录全部落库后再报告完成
+            await db.flush()
+            await channel.send("done", {
+                **report(),
+                "successful": spawner.successful,
+                "failed": spawner.failed,
+                "failed_rows": db.take_failed_rows(run_id),
+            })
+        finally:
+            await http_client.close()
+            await db.close()
+
+
+async def _run_local_shard(conn, spec: Dict[str, Any]):
+    channel = PipeChannel(conn)
+    channel.start(asyncio.get_running_loop())
+    await run_shard(channel, spec)
+
+
+def worker_entry(conn, spec: Dict[str, Any]):
+    """本地 worker 进程入口（multiprocessing spawn）：独立事件循环、HTTP 连接池与 write-behind 缓冲"""
+    setup_logging()
+    try:
+        asyncio.run(_run_local_shard(conn, spec))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Load worker failed: {e}", run_id=spec.get("run_id"), worker=spec.get("worker"))
+        try:
+            conn.send(("error", {"error": str(e)}))
+        except (OSError, EOFError):
+            pass
+    finally:
+        conn.close()
+
+
+# ============================================================
+# 协调方
+# ============================================================
+
+class LocalWorkerProcess:
+    """协调方持有的本地 worker 进程及其管道"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def describe(self) -> Dict[str, Any]:
+        return {"kind": "process", "exitcode": self.process.exitcode}
+
+    def post(self, kind: str, payload: Any = None):
+        try:
+            self.conn.send((kind, payload))
+        except (OSError, EOFError, ValueError):
+            pass
+
+    def read(self, handle: "WorkerHandle", loop: asyncio.AbstractEventLoop, inbox: asyncio.Queue):
+        """阻塞读取 worker 回传，转入协调方的 inbox；管道断开时投递 exit"""
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                message = ("exit", None)
+            try:
+                loop.call_soon_threadsafe(inbox.put_nowait, (handle, message))
+            except RuntimeError:
+                return
+            if message[0] == "exit":
+                return
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.process.join, 5.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            await loop.run_in_executor(None, self.process.join, 5.0)
+        self.conn.close()
+
+
+class WorkerHandle:
+    """协调方视角的一个用户分片及其执行方（本地进程或远程 worker）"""
+
+    __slots__ = (
+        "index", "users", "concurrency", "channel", "pid", "spawner", "successful", "failed", "failed_rows", "done",
+    )
+
+    def __init__(self, index: int, users: range, concurrency: int):
+        self.index = index
+        self.users = users
+        self.concurrency = concurrency
+        self.channel = None
+        self.pid: Optional[int] = None
+        self.spawner: Optional[Dict[str, Any]] = None
+        self.successful = 0
+        self.failed = 0
+        self.failed_rows = 0
+        self.done = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "worker": self.index,
+            "pid": self.pid,
+            "users": len(self.users),
+            "concurrency": self.concurrency,
+            "alive": bool(self.channel is not None and self.channel.alive),
+            "done": self.done,
+            "channel": self.channel.describe() if self.channel is not None else None,
+            "spawner": self.spawner,
+        }
+
+
+class WorkerGroup:
+    """把一次 closed 模型运行的虚拟用户分片到多个 worker 执行（协调方）
+
+    - 每个 worker 拿到可序列化的场景（scenario_to_spec）与一段交错的用户序号，自行编译执行计划，
+      用独立的事件循环 / HTTP 连接池 / write-behind 缓冲执行用户
+    - 默认在本机启动 worker 进程（管道通信）；传入 pool 时改为分配给已注册的远程 worker（WebSocket）
+    - worker 每 WORKER_REPORT_INTERVAL 秒回传指标增量（RunMetrics.take_delta）、用户启动指标与事件，
+      协调方合并进本运行的 RunMetrics 与事件总线（EventBus）
+    - 协调方 controller 的暂停 / 恢复 / 取消转发给所有 worker；取消后超过
+      drain_timeout + WORKER_EXIT_GRACE_SECONDS 仍未结束的 worker 被强制终止（远程 worker 被释放）
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        scenario_spec: Dict[str, Any],
+        run_config: Dict[str, Any],
+        total_users: int,
+        concurrency: int,
+        workers: int,
+        controller: RunController,
+        metrics: RunMetrics,
+        events=None,
+        pool=None,
+    ):
+        self.run_id = run_id
+        self.scenario_spec = scenario_spec
+        self.run_config = run_config
+        self.total_users = total_users
+        self.controller = controller
+        self.run_metrics = metrics
+        self.events = events
+        self.pool = pool
+        self.handles = [
+            WorkerHandle(k, users, shard_concurrency)
+            for k, (users, shard_concurrency) in enumerate(shard_users(total_users, concurrency, workers))
+        ]
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def successful(self) -> int:
+        return sum(handle.successful for handle in self.handles)
+
+    @property
+    def failed(self) -> int:
+        return sum(handle.failed for handle in self.handles)
+
+    @property
+    def failed_rows(self) -> int:
+        """各 worker write-behind 写入失败被丢弃的执行记录行数"""
+        return sum(handle.failed_rows for handle in self.handles)
+
+    def _spec(self, handle: WorkerHandle) -> Dict[str, Any]:
+        users = handle.users
+        return {
+            "run_id": self.run_id,
+            "worker": handle.index,
+            "scenario": self.scenario_spec,
+            "run_config": self.run_config,
+            "total_users": self.total_users,
+            "users": [users.start, users.stop, users.step],
+            "concurrency": handle.concurrency,
+            "drain_timeout": self.controller.drain_timeout,
+            "report_interval": settings.WORKER_REPORT_INTERVAL,
+            "events": self.events is not None,
+        }
+
+    def _forward_control(self, action: str, reason: Optional[str] = None):
+        for handle in self.handles:
+            if not handle.done and handle.channel is not None:
+                handle.channel.post(action, reason)
+
+    def _apply(self, handle: WorkerHandle, payload: Dict[str, Any]):
+        self.run_metrics.merge_delta(payload["metrics"])
+        handle.spawner = payload.get("spawner")
+        events = payload.get("events")
+        if events and self.events is not None:
+            self.events.merge(self.run_id, events)
+
+    def _launch(self, handle: WorkerHandle, loop: asyncio.AbstractEventLoop, inbox: asyncio.Queue):
+        spec = self._spec(handle)
+        if self.pool is not None:
+            # 远程 worker：回传由 pool 的连接转入 inbox
+            handle.channel = self.pool.assign(self.run_id, handle, inbox)
+            handle.channel.post("run", spec)
+            return
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=worker_entry,
+            args=(child_conn, spec),
+            name=f"load-worker-{handle.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        handle.channel = LocalWorkerProcess(process, parent_conn)
+        threading.Thread(target=handle.channel.read, args=(handle, loop, inbox), daemon=True).start()
+
+    async def run(self) -> "WorkerGroup":
+        """启动所有 worker 并等待结束"""
+        loop = asyncio.get_running_loop()
+        inbox: asyncio.Queue = asyncio.Queue()
+        self.started_at = time.monotonic()
+
+        unsubscribe = self.controller.subscribe(self._forward_control)
+        try:
+            for handle in self.handles:
+                self._launch(handle, loop, inbox)
+            logger.info(
+                "Load workers started",
+                run_id=self.run_id,
+                workers=len(self.handles),
+                remote=self.pool is not None,
+                total_users=self.total_users,
+            )
+            # 启动期间收到的暂停 / 取消
+            if self.controller.paused:
+                self._forward_control("pause")
+            elif self.controller.cancelled:
+                self._forward_control("cancel", self.controller.cancel_reason)
+
+            deadline: Optional[float] = None
+            while not all(handle.done for handle in self.handles):
+                if deadline is None and self.controller.cancelled:
+                    deadline = time.monotonic() + self.controller.drain_timeout + WORKER_EXIT_GRACE_SECONDS
+                try:
+                    # 每秒醒来一次检查取消期限
+                    handle, (kind, payload) = await asyncio.wait_for(inbox.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        logger.warning("Load workers did not exit in time", run_id=self.run_id)
+                        break
+                    continue
+
+                if handle.done:
+                    continue
+                if kind == "ready":
+                    handle.pid = payload.get("pid")
+                elif kind == "delta":
+                    self._apply(handle, payload)
+                elif kind == "done":
+                    self._apply(handle, payload)
+                    handle.successful = payload["successful"]
+                    handle.failed = payload["failed"]
+                    handle.failed_rows = payload.get("failed_rows", 0)
+                    handle.done = True
+                elif kind in ("error", "exit"):
+                    # 未正常报告完成（启动失败 / 崩溃 / 断开）
+                    logger.error(
+                        "Load worker stopped before finishing",
+                        run_id=self.run_id,
+                        worker=handle.index,
+                        error=(payload or {}).get("error"),
+                        channel=handle.channel.describe(),
+                    )
+                    self._settle(handle)
+        finally:
+            unsubscribe()
+            await self._shutdown()
+            self.finished_at = time.monotonic()
+
+        logger.info("Load workers finished", run_id=self.run_id, **self.metrics())
+        return self
+
+    @staticmethod
+    def _settle(handle: WorkerHandle):
+        """按最后一次回传统计结算分片，未完成的用户记为失败"""
+        reported = handle.spawner or {}
+        handle.successful = reported.get("successful", 0)
+        handle.failed = len(handle.users) - handle.successful
+        handle.done = True
+
+    async def _shutdown(self):
+        for handle in self.handles:
+            if handle.channel is None:
+                continue
+            if not handle.done:
+                handle.channel.post("cancel", "Coordinator stopped waiting")
+                self._settle(handle)
+            await handle.channel.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        """汇总各 worker 的用户启动指标（字段与 UserSpawner.metrics 一致），并附带每个 worker 的状态"""
+        totals = {
+            "total_users": self.total_users,
+            "concurrency": 0,
+            "spawned": 0,
+            "active": 0,
+            "backlog": 0,
+            "successful": 0,
+            "failed": 0,
+        }
+        spawn_rate = 0.0
+        for handle in self.handles:
+            reported = handle.spawner or {}
+            totals["concurrency"] += handle.concurrency
+            totals["spawned"] += reported.get("spawned", 0)
+            totals["active"] += reported.get("active", 0)
+            totals["backlog"] += reported.get("backlog", len(handle.users))
+            totals["successful"] += handle.successful if handle.done else reported.get("successful", 0)
+            totals["failed"] += handle.failed if handle.done else reported.get("failed", 0)
+            spawn_rate += reported.get("spawn_rate", 0.0)
+        end = self.finished_at or time.monotonic()
+        return {
+            **totals,
+            "spawn_rate": round(spawn_rate, 3),
+            "elapsed_s": round(end - self.started_at, 3) if self.started_at is not None else 0.0,
+            "workers": [handle.to_dict() for handle in self.handles],
+        }
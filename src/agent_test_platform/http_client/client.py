@@ -1,72 +1,247 @@
-
+import asyncio
+import json
 import httpx
 import time
+from contextlib import asynccontextmanager
 from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
 from agent_test_platform.config.logger import logger
 from agent_test_platform.config.settings import settings
+from agent_test_platform.http_client.timing import RequestTiming, RequestTracer
+from agent_test_platform.http_client.streaming import StreamAssembler
 
 
 class AgentHTTPClient:
-    """异步 HTTP 客户端，用于调用 Agent API"""
-    
+    """异步 HTTP 客户端，用于调用 Agent API
+
+    持有一个在应用生命周期内共享的 httpx.AsyncClient 连接池，
+    由 main.lifespan 调用 start()/close() 管理。
+    """
+
     def __init__(self):
         self.base_url = settings.AGENT_API_BASE_URL
         self.timeout = settings.AGENT_API_TIMEOUT
-    
+
+        # 连接池配置
+        self.max_connections = settings.AGENT_HTTP_MAX_CONNECTIONS
+        self.max_keepalive = settings.AGENT_HTTP_MAX_KEEPALIVE
+        self.keepalive_expiry = settings.AGENT_HTTP_KEEPALIVE_EXPIRY
+        self.max_per_host = settings.AGENT_HTTP_MAX_PER_HOST
+        self.http2 = settings.AGENT_HTTP2
+
+        self._client: Optional[httpx.AsyncClient] = None
+        # host -> 单主机并发上限
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def start(self):
+        """创建共享连接池（幂等）"""
+        if self._client is not None and not self._client.is_closed:
+            return
+
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+                http2 = False
+
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            http2=http2,
+        )
+
+        logger.info(
+            "Agent HTTP pool started",
+            max_connections=self.max_connections,
+            max_keepalive=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+            max_per_host=self.max_per_host,
+            http2=http2,
+        )
+
+    async def close(self):
+        """关闭共享连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("Agent HTTP pool closed")
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        # 未经 lifespan 启动时（如脚本直接使用）按需创建
+        if self._client is None or self._client.is_closed:
+            await self.start()
+        return self._client
+
+    def _host_semaphore(self, url: str) -> Optional[asyncio.Semaphore]:
+        if self.max_per_host <= 0:
+            return None
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        semaphore = self._host_semaphore(url)
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        payload: Optional[Dict[str, Any]],
+        headers: Dict[str, str],
+        tracer: RequestTracer,
+    ) -> httpx.Response:
+        client = await self._get_client()
+        # GET / DELETE 不带请求体
+        body = payload if method not in ("GET", "DELETE") else None
+        async with self._host_slot(url):
+            return await client.request(method, url, json=body, headers=headers, extensions={"trace": tracer})
+
     async def call_agent(
         self,
         endpoint: str,
-        payload: Dict[str, Any],
+        payload: Optional[Dict[str, Any]],
         headers: Optional[Dict[str, str]] = None,
-    ) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str], float]:
+        method: str = "POST",
+    ) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str], float, RequestTiming]:
         """
-        调用 Agent API
-        
+        调用 Agent API（method 为 GET 时不发送请求体，用于查询任务状态等）
+
         Returns:
-            (成功标志, 响应体, 错误信息, 耗时ms)
+            (成功标志, 响应体, 错误信息, 耗时ms, 耗时拆分)
         """
-        start_time = time.time()
         url = f"{self.base_url}{endpoint}"
-        
+        tracer = RequestTracer()
+
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=headers or {},
-                )
-            
-            duration_ms = (time.time() - start_time) * 1000
-            
+            response = await self._request(method.upper(), url, payload, headers or {}, tracer)
+
             if response.status_code == 200:
                 try:
+                    decode_start = time.perf_counter()
                     response_json = response.json()
+                    timing = tracer.finish(decode_ms=(time.perf_counter() - decode_start) * 1000)
                     logger.info(
                         f"Agent API call success",
                         endpoint=endpoint,
                         status_code=response.status_code,
-                        duration_ms=duration_ms,
+                        duration_ms=timing.total_ms,
+                        ttfb_ms=timing.ttfb_ms,
+                        queue_ms=timing.queue_ms,
                     )
-                    return True, response_json, None, duration_ms
+                    return True, response_json, None, timing.total_ms, timing
                 except Exception as e:
+                    timing = tracer.finish()
                     logger.error(f"Failed to parse JSON: {e}")
-                    return False, None, f"JSON parse error: {e}", duration_ms
+                    return False, None, f"JSON parse error: {e}", timing.total_ms, timing
             else:
+                timing = tracer.finish()
                 error_msg = f"HTTP {response.status_code}: {response.text[:200]}"
                 logger.warning(
                     f"Agent API call failed",
                     endpoint=endpoint,
                     status_code=response.status_code,
-                    duration_ms=duration_ms,
+                    duration_ms=timing.total_ms,
                 )
-                return False, None, error_msg, duration_ms
-        
+                return False, None, error_msg, timing.total_ms, timing
+
         except httpx.TimeoutException as e:
-            duration_ms = (time.time() - start_time) * 1000
+            timing = tracer.finish()
             logger.error(f"Request timeout: {e}")
-            return False, None, f"Timeout after {self.timeout}s", duration_ms
-        
+            return False, None, f"Timeout after {self.timeout}s", timing.total_ms, timing
+
         except Exception as e:
-            duration_ms = (time.time() - start_time) * 1000
+            timing = tracer.finish()
             logger.error(f"Request error: {e}")
-            return False, None, str(e), duration_ms
+            return False, None, str(e), timing.total_ms, timing
+
+    async def stream_agent(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str], float, RequestTiming]:
+        """
+        以流式方式调用 Agent API（SSE / chunked），边接收边解析
+
+        Returns:
+            (成功标志, 拼装后的响应体, 错误信息, 耗时ms, 耗时拆分（含 TTFT / token 速率）)
+        """
+        url = f"{self.base_url}{endpoint}"
+        tracer = RequestTracer()
+        assembler = StreamAssembler(tracer.start)
+
+        try:
+            client = await self._get_client()
+            async with self._host_slot(url):
+                async with client.stream(
+                    "POST",
+                    url,
+                    json=payload,
+                    headers=headers or {},
+                    extensions={"trace": tracer},
+                ) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        timing = tracer.finish()
+                        error_msg = f"HTTP {response.status_code}: {body[:200].decode('utf-8', errors='replace')}"
+                        logger.warning(
+                            "Agent API stream failed",
+                            endpoint=endpoint,
+                            status_code=response.status_code,
+                            duration_ms=timing.total_ms,
+                        )
+                        return False, None, error_msg, timing.total_ms, timing
+
+                    content_type = response.headers.get("content-type", "")
+                    if "text/event-stream" in content_type:
+                        async for line in response.aiter_lines():
+                            assembler.feed_sse_line(line)
+                            if assembler.done:
+                                break
+                    elif "ndjson" in content_type or "jsonl" in content_type:
+                        async for line in response.aiter_lines():
+                            assembler.feed_line(line)
+                            if assembler.done:
+                                break
+                    elif "json" in content_type:
+                        assembler.feed_payload(json.loads(await response.aread()))
+                    else:
+                        async for chunk in response.aiter_text():
+                            assembler.feed_chunk(chunk)
+
+            assembler.close()
+            timing = assembler.fill_timing(tracer.finish())
+            logger.info(
+                "Agent API stream success",
+                endpoint=endpoint,
+                duration_ms=timing.total_ms,
+                ttft_ms=timing.ttft_ms,
+                tokens=timing.tokens,
+                tokens_per_sec=timing.tokens_per_sec,
+            )
+            return True, assembler.result(), None, timing.total_ms, timing
+
+        except httpx.TimeoutException as e:
+            timing = assembler.fill_timing(tracer.finish())
+            logger.error(f"Stream timeout: {e}")
+            return False, None, f"Timeout after {self.timeout}s", timing.total_ms, timing
+
+        except Exception as e:
+            timing = assembler.fill_timing(tracer.finish())
+            logger.error(f"Stream error: {e}")
+            return False, None, str(e), timing.total_ms, timing
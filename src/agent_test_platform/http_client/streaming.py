@@ -0,0 +1,160 @@
+import json
+import time
+from typing import Dict, Any, List, Optional
+from agent_test_platform.http_client.timing import RequestTiming
+
+
+# 事件中承载增量文本的常见字段
+_TOKEN_KEYS = ("token", "delta", "content", "text")
+
+
+class StreamAssembler:
+    """增量消费 SSE / chunked 响应，记录 token 时间并拼装最终响应体
+
+    - SSE（text/event-stream）：按 `data:` 行解析，空行结束一个事件，`[DONE]` 结束流
+    - NDJSON / 其它分块：每一行（或每个文本分块）视为一个事件
+
+    每个事件只解析一次：文本增量追加到片段列表，其余字段合并到结果 dict，
+    不保留原始字节流。
+    """
+
+    def __init__(self, start: float):
+        self.start = start
+        self.done = False
+
+        self._parts: List[str] = []
+        self._fields: Dict[str, Any] = {}
+        self._payload: Optional[Dict[str, Any]] = None
+        self._data_lines: List[str] = []
+
+        self.tokens = 0
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self._gap_total = 0.0
+        self._gap_max = 0.0
+
+    # ------------------------------------------------------------
+    # 输入
+    # ------------------------------------------------------------
+
+    def feed_sse_line(self, line: str):
+        """喂入一行 SSE 文本"""
+        if not line:
+            self._flush_sse_event()
+            return
+        if line.startswith(":"):
+            return  # 注释 / 心跳
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data_lines.append(value[1:] if value.startswith(" ") else value)
+
+    def feed_line(self, line: str):
+        """喂入一行 NDJSON / 纯文本"""
+        if line.strip():
+            self._on_event(line)
+
+    def feed_chunk(self, chunk: str):
+        """喂入一个无结构的文本分块"""
+        if chunk:
+            self._mark_token()
+            self._parts.append(chunk)
+
+    def feed_payload(self, payload: Dict[str, Any]):
+        """服务端未流式返回（普通 JSON）时，整个响应体即为一个事件"""
+        self._mark_token()
+        self._payload = payload
+
+    def close(self):
+        self._flush_sse_event()
+
+    # ------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------
+
+    def result(self) -> Dict[str, Any]:
+        """拼装最终响应体：非文本字段 + 完整文本"""
+        if self._payload is not None:
+            return self._payload
+        payload = dict(self._fields)
+        payload["content"] = "".join(self._parts)
+        return payload
+
+    def fill_timing(self, timing: RequestTiming) -> RequestTiming:
+        timing.tokens = self.tokens
+        if self.first_token_at is None:
+            return timing
+
+        timing.ttft_ms = (self.first_token_at - self.start) * 1000
+        if self.tokens > 1:
+            timing.inter_token_avg_ms = self._gap_total / (self.tokens - 1) * 1000
+            timing.inter_token_max_ms = self._gap_max * 1000
+            generation = self.last_token_at - self.first_token_at
+            if generation > 0:
+                timing.tokens_per_sec = (self.tokens - 1) / generation
+        return timing
+
+    # ------------------------------------------------------------
+    # 内部
+    # ------------------------------------------------------------
+
+    def _flush_sse_event(self):
+        if not self._data_lines:
+            return
+        data = "\n".join(self._data_lines)
+        self._data_lines = []
+        self._on_event(data)
+
+    def _on_event(self, data: str):
+        if self.done:
+            return
+        if data.strip() == "[DONE]":
+            self.done = True
+            return
+
+        try:
+            event = json.loads(data)
+        except ValueError:
+            self._mark_token()
+            self._parts.append(data)
+            return
+
+        if not isinstance(event, dict):
+            self._mark_token()
+            self._parts.append(data if not isinstance(event, str) else event)
+            return
+
+        token = self._extract_token(event)
+        if token is not None:
+            self._mark_token()
+            self._parts.append(token)
+
+        for key, value in event.items():
+            if key not in _TOKEN_KEYS and key != "choices":
+                self._fields[key] = value
+
+    @staticmethod
+    def _extract_token(event: Dict[str, Any]) -> Optional[str]:
+        # OpenAI 风格：choices[0].delta.content
+        choices = event.get("choices")
+        if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+            delta = choices[0].get("delta") or {}
+            if isinstance(delta, dict) and isinstance(delta.get("content"), str):
+                return delta["content"]
+
+        for key in _TOKEN_KEYS:
+            value = event.get(key)
+            if isinstance(value, str):
+                return value
+        return None
+
+    def _mark_token(self):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            gap = now - self.last_token_at
+            self._gap_total += gap
+            if gap > self._gap_max:
+                self._gap_max = gap
+        self.last_token_at = now
+        self.tokens += 1
@@ -0,0 +1,69 @@
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional
+
+
+@dataclass
+class RequestTiming:
+    """单次请求的耗时拆分（毫秒，基于 perf_counter）"""
+
+    queue_ms: float = 0.0        # 等待连接池/单主机并发槽位
+    connect_ms: float = 0.0      # TCP 建连（含 DNS 解析）
+    tls_ms: float = 0.0          # TLS 握手
+    ttfb_ms: float = 0.0         # 发出请求头 -> 收到响应头
+    body_ms: float = 0.0         # 响应体下载
+    decode_ms: float = 0.0       # JSON 解析
+    total_ms: float = 0.0        # 端到端
+    connection_reused: bool = True
+
+    # 流式响应（SSE / chunked）指标，非流式调用时保持为 None
+    ttft_ms: Optional[float] = None              # 请求开始 -> 首个 token
+    inter_token_avg_ms: Optional[float] = None   # 平均 token 间隔
+    inter_token_max_ms: Optional[float] = None   # 最大 token 间隔
+    tokens: Optional[int] = None                 # token（事件/分块）数
+    tokens_per_sec: Optional[float] = None       # 首 token 之后的生成速率
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class RequestTracer:
+    """httpx `trace` 扩展回调，按阶段记录 perf_counter 时间点
+
+    httpcore 事件名形如 "connection.connect_tcp.started"、
+    "http11.receive_response_body.complete"（HTTP/2 为 "http2." 前缀），
+    这里去掉前缀后按阶段名记录，HTTP/1.1 与 HTTP/2 共用同一套计算。
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]):
+        _, _, stage = event_name.partition(".")
+        self.marks.setdefault(stage, time.perf_counter())
+
+    def _span(self, start_key: str, end_key: str) -> float:
+        start = self.marks.get(start_key)
+        end = self.marks.get(end_key)
+        if start is None or end is None:
+            return 0.0
+        return (end - start) * 1000
+
+    def finish(self, decode_ms: float = 0.0, end: Optional[float] = None) -> RequestTiming:
+        """根据已记录的时间点生成 RequestTiming"""
+        end = end if end is not None else time.perf_counter()
+
+        first_io = self.marks.get("connect_tcp.started", self.marks.get("send_request_headers.started"))
+        queue_ms = (first_io - self.start) * 1000 if first_io is not None else 0.0
+
+        return RequestTiming(
+            queue_ms=queue_ms,
+            connect_ms=self._span("connect_tcp.started", "connect_tcp.complete"),
+            tls_ms=self._span("start_tls.started", "start_tls.complete"),
+            ttfb_ms=self._span("send_request_headers.started", "receive_response_headers.complete"),
+            body_ms=self._span("receive_response_body.started", "receive_response_body.complete"),
+            decode_ms=decode_ms,
+            total_ms=(end - self.start) * 1000,
+            connection_reused="connect_tcp.started" not in self.marks,
+        )
@@ -15,6 +15,7 @@ from agent_test_platform.storage.database import Database
 from agent_test_platform.storage.query import ResultQuery
 from agent_test_platform.ws.manager import WSConnectionManager
 from agent_test_platform.core.orchestrator import TestOrchestrator
+from agent_test_platform.core.events import EventBus
 from agent_test_platform.core.smart_orchestrator import SmartTestOrchestrator
 from agent_test_platform.services.node_config_service import NodeConfigService
 from agent_test_platform.services.scenario_service import ScenarioService
@@ -50,8 +51,9 @@ async def lifespan(app: FastAPI):
         db_instance = Database()
         await db_instance.initialize()
 
-        # 2) 初始化编排器
+        # 2) 初始化编排器（并打开共享 HTTP 连接池）
         orchestrator_instance = TestOrchestrator(db_instance)
+        await orchestrator_instance.http_client.start()
 
         # 3) 初始化 WebSocket 管理器
         ws_manager_instance = WSConnectionManager()
@@ -79,12 +81,18 @@ async def lifespan(app: FastAPI):
 
         orchestrator_instance.register_progress_callback(progress_callback)
 
+        # 节点执行事件：按运行合并后每 WS_EVENT_FLUSH_MS 推送一帧 run_events
+        orchestrator_instance.event_bus = EventBus(ws_manager_instance.broadcast)
+
         # 5) 初始化智能编排器
         smart_orchestrator_instance = SmartTestOrchestrator(
             db=db_instance,
             http_client=orchestrator_instance.http_client,
             openai_api_key=settings.OPENAI_API_KEY,
             on_event_callback=progress_callback,
+            metrics=orchestrator_instance.metrics,
+            runs=orchestrator_instance.runs,
+            quota=orchestrator_instance.quota,
         )
 
         # 6) 初始化结果查询
@@ -119,7 +127,9 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 60)
 
     try:
-        # AgentHTTPClient 当前是按请求创建 httpx.AsyncClient，无需显式 close
+        if orchestrator_instance:
+            await orchestrator_instance.http_client.close()
+
         if db_instance:
             await db_instance.close()
 
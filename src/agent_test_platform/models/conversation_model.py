@@ -68,6 +68,7 @@ class DialogTurn(Base):
 
     # 执行信息
     duration_ms = Column(Float)
+    timing = Column(JSON)  # 请求耗时拆分（流式调用时包含 ttft_ms / tokens_per_sec 等）
     error_message = Column(Text)
 
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -24,8 +24,10 @@ class NodeType(str, Enum):
 class RunStatus(str, Enum):
     PENDING = "pending"
     RUNNING = "running"
+    PAUSED = "paused"
     DONE = "done"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class ScenarioStatus(str, Enum):
@@ -77,6 +79,9 @@ class TestRun(Base):
     start_time = Column(DateTime)
     end_time = Column(DateTime)
 
+    # 运行配置（负载模型、到达率等）及运行时统计
+    config = Column(JSON, default=dict)
+
     # 统计信息
     success_users = Column(Integer, default=0)
     failed_users = Column(Integer, default=0)
@@ -121,6 +126,7 @@ class NodeExecution(Base):
     start_time = Column(DateTime)
     end_time = Column(DateTime)
     duration = Column(Float)  # 毫秒
+    timing = Column(JSON)  # 请求耗时拆分 {queue_ms, connect_ms, tls_ms, ttfb_ms, body_ms, decode_ms, total_ms}
 
     # 请求/响应详情
     request_body = Column(JSON)
@@ -159,4 +165,22 @@ class TestSummary(Base):
 
     # 节点统计
     failed_nodes = Column(JSON)  # List[FailedNodeStat]
-    node_stats = Column(JSON)    # List[NodeStat]
\ No newline at end of file
+    node_stats = Column(JSON)    # List[NodeStat]
+    endpoint_stats = Column(JSON)  # List[EndpointStat]
+
+# ============================================================
+# RunMetricPoint 按秒时间序列指标
+# ============================================================
+
+class RunMetricPoint(Base):
+    """单个运行 / 节点 / 秒的请求统计"""
+    __tablename__ = "run_metric_points"
+
+    # 多轮对话测试没有 TestRun 记录，因此不加外键
+    test_run_id = Column(String(36), nullable=False, index=True)
+    node_id = Column(String(255), nullable=False)
+    ts = Column(Integer, nullable=False)  # Unix 时间戳（秒）
+
+    count = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    histogram = Column(JSON)  # LatencyHistogram.to_dict()，仅含 HTTP 请求耗时
@@ -35,6 +35,7 @@ class TestStep(Base):
     
     # 耗时
     duration_ms = Column(Float, default=0)
+    timing = Column(JSON)  # 请求耗时拆分 {queue_ms, connect_ms, tls_ms, ttfb_ms, body_ms, decode_ms, total_ms}
     
     # 评估结果
     evaluation_result = Column(JSON)  # 步骤评估的结果，如 {'should_continue': True, 'reason': '...'}
@@ -3,6 +3,11 @@ import yaml
 from pathlib import Path
 from typing import Optional
 from agent_test_platform.scenarios.model import ScenarioConfig, StepConfig
+from agent_test_platform.core.scheduling import ThinkTime, RampUp
+from agent_test_platform.core.load_model import LoadModel, ArrivalConfig
+from agent_test_platform.core.templates import PayloadTemplate
+from agent_test_platform.core.extraction import Extractor
+from agent_test_platform.core.expressions import Expression
 from agent_test_platform.config.logger import logger
 
 
@@ -47,18 +52,43 @@ class ScenarioLoader:
                 should_continue=step.get('should_continue'),
                 max_retries=step.get('max_retries', 0),
                 timeout=step.get('timeout', 30.0),
+                think_time=ThinkTime.from_config(step.get('think_time')),
+                payload_template=PayloadTemplate.compile(step.get('payload', {})),
+                extractor=Extractor.compile(step.get('extraction')),
+                continue_expression=self._compile_expression(step.get('should_continue')),
             )
             for i, step in enumerate(data.get('steps', []))
         ]
         
+        # condition / success_condition 目前不参与执行，但同样在加载阶段校验语法
+        for step in data.get('steps', []):
+            self._compile_expression(step.get('condition'))
+        self._compile_expression(data.get('success_condition'))
+        
+        # 提前校验爬坡配置，非法配置在加载阶段报错
+        RampUp.from_config(data.get('ramp_up_time', 0), data.get('ramp_up_shape'))
+        if data.get('load_model') == LoadModel.OPEN:
+            ArrivalConfig.from_dict(data.get('arrival'))
+        
         return ScenarioConfig(
             name=data.get('name'),
             description=data.get('description', ''),
             num_users=data.get('num_users', 1),
             concurrency=data.get('concurrency', 1),
             ramp_up_time=data.get('ramp_up_time', 0),
+            ramp_up_shape=data.get('ramp_up_shape', 'linear'),
+            think_time=ThinkTime.from_config(data.get('think_time')),
+            load_model=data.get('load_model', 'closed'),
+            arrival=data.get('arrival'),
             agent_endpoint=data.get('agent_endpoint', '/chat'),
             steps=steps,
             success_condition=data.get('success_condition'),
             max_wait_time=data.get('max_wait_time', 300),
-        )
\ No newline at end of file
+        )
+    
+    @staticmethod
+    def _compile_expression(source: Optional[str]) -> Optional[Expression]:
+        """编译步骤条件（变量 response），语法错误时抛 ExpressionError"""
+        if not source:
+            return None
+        return Expression.compile(source, ("response",))
@@ -1,6 +1,10 @@
 
 from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
+from agent_test_platform.core.scheduling import ThinkTime
+from agent_test_platform.core.templates import PayloadTemplate
+from agent_test_platform.core.extraction import Extractor
+from agent_test_platform.core.expressions import Expression
 
 
 @dataclass
@@ -19,6 +23,14 @@ class StepConfig:
     
     max_retries: int = 0
     timeout: float = 30.0
+    
+    # 本步骤完成后的思考时间（覆盖场景级 think_time）
+    think_time: Optional[ThinkTime] = None
+    
+    # 加载时预编译的 payload 模板 / 提取器 / 继续条件
+    payload_template: Optional[PayloadTemplate] = None
+    extractor: Optional[Extractor] = None
+    continue_expression: Optional[Expression] = None
 
 
 @dataclass
@@ -31,7 +43,15 @@ class ScenarioConfig:
     # 用户配置
     num_users: int = 1
     concurrency: int = 1
-    ramp_up_time: int = 0  # 秒，用户启动间隔
+    ramp_up_time: int = 0  # 秒，所有用户在该时长内逐步启动
+    ramp_up_shape: str = "linear"  # linear, exponential
+    
+    # 步骤之间的默认思考时间
+    think_time: Optional[ThinkTime] = None
+    
+    # 负载模型：closed（固定并发）或 open（按到达率启动用户）
+    load_model: str = "closed"
+    arrival: Optional[Dict[str, Any]] = None  # open 模型的到达率配置，见 core.load_model.ArrivalConfig
     
     # Agent API 配置
     agent_endpoint: str = "/chat"
@@ -5,6 +5,10 @@ from sqlalchemy.future import select
 from agent_test_platform.models.node_config_model import NodeConfig, NodeConfigHistory, NodeExecutionMode
 from agent_test_platform.storage.database import Database
 from agent_test_platform.config.logger import logger
+from agent_test_platform.core.scheduling import ThinkTime
+from agent_test_platform.core.extraction import Extractor
+from agent_test_platform.core.polling import PollingConfig
+from agent_test_platform.core.expressions import Expression, ExpressionError
 
 
 class NodeConfigService:
@@ -245,6 +249,41 @@ class NodeConfigService:
             logger.warning(f"Invalid execution mode: {config.get('execution_mode')}")
             return False
         
+        try:
+            ThinkTime.from_config((config.get("config") or {}).get("think_time"))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid think_time: {e}")
+            return False
+        
+        try:
+            node_config = config.get("config") or {}
+            polling_mode = config.get("execution_mode") == "polling" and "polling" in node_config
+            if polling_mode or (config.get("type") or config.get("node_type")) == "polling":
+                PollingConfig.from_config(node_config.get("polling"))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid polling config: {e}")
+            return False
+        
+        try:
+            Extractor.compile((config.get("config") or {}).get("extraction"))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid extraction: {e}")
+            return False
+        
+        try:
+            checks = [
+                ((config.get("config") or {}).get("condition"), ("context",)),
+                # 多轮对话的自定义检查（见 NodeStrategy）
+                ((config.get("exit_condition") or {}).get("custom_check_func"), ("response", "turns", "elapsed_time")),
+                ((config.get("task_detection") or {}).get("custom_check_code"), ("response",)),
+            ]
+            for source, names in checks:
+                if source:
+                    Expression.compile(source, names)
+        except ExpressionError as e:
+            logger.warning(f"Invalid condition: {e}")
+            return False
+        
         return True
     
     
@@ -0,0 +1,97 @@
+from typing import Dict, Any, List, Tuple, Callable, Optional
+from sqlalchemy import Table, insert
+from agent_test_platform.config.logger import logger
+
+
+# 走 COPY 通道的表：数量随「用户数 x 节点数 / 轮次」增长的执行明细
+COPY_TABLES = ("node_executions", "test_step", "dialog_turns")
+
+
+def fill_defaults(table: Table, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """为缺省列补上 Python 端默认值，使每行都包含全部列
+
+    COPY 不经过 ORM，不会应用 Column(default=...)；列齐全的行在 executemany 时
+    也只会生成一条语句（键集合不同的行会被拆成多条）。
+    """
+    defaults = []
+    for column in table.columns:
+        default = column.default
+        if default is not None and (default.is_scalar or default.is_callable):
+            defaults.append((column.key, default))
+        else:
+            defaults.append((column.key, None))
+
+    filled = []
+    for row in rows:
+        full = {}
+        for key, default in defaults:
+            value = row.get(key)
+            if value is None and default is not None:
+                # 可调用默认值已被 SQLAlchemy 包装为接收 context 参数的函数
+                value = default.arg(None) if default.is_callable else default.arg
+            full[key] = value
+        filled.append(full)
+    return filled
+
+
+class BulkInserter:
+    """执行明细的批量写入
+
+    PostgreSQL (asyncpg) 下对 COPY_TABLES 使用 ``COPY ... FROM STDIN``（二进制格式）
+    直接流式写入；其他方言 / 其他表使用 executemany。
+    """
+
+    def __init__(self, use_copy: bool = False):
+        self.use_copy = use_copy
+        # 表名 -> [(列名, 行字典中的键, 绑定值转换函数)]
+        self._processors: Dict[str, List[Tuple[str, str, Optional[Callable]]]] = {}
+
+    def uses_copy(self, table: Table) -> bool:
+        return self.use_copy and table.name in COPY_TABLES
+
+    async def insert(self, session, model_class, rows: List[Dict[str, Any]]) -> int:
+        table = model_class.__table__
+        if not rows:
+            return 0
+
+        if self.uses_copy(table):
+            return await self._copy(session, table, rows)
+
+        if table.name in COPY_TABLES:
+            rows = fill_defaults(table, rows)
+        await session.execute(insert(model_class), rows)
+        return len(rows)
+
+    async def _copy(self, session, table: Table, rows: List[Dict[str, Any]]) -> int:
+        connection = await session.connection()
+        processors = self._get_processors(table, connection.dialect)
+
+        records = []
+        for row in fill_defaults(table, rows):
+            record = []
+            for _, key, process in processors:
+                value = row[key]
+                if process is not None and value is not None:
+                    value = process(value)
+                record.append(value)
+            records.append(tuple(record))
+
+        # 与同批次其他语句共用同一个连接 / 事务
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            table.name,
+            records=records,
+            columns=[name for name, _, _ in processors],
+        )
+        logger.debug(f"COPY {len(records)} rows into {table.name}")
+        return len(records)
+
+    def _get_processors(self, table: Table, dialect):
+        """按方言生成各列的绑定值转换（Enum -> 名称、JSON -> 文本 等），按表缓存"""
+        processors = self._processors.get(table.name)
+        if processors is None:
+            processors = self._processors[table.name] = [
+                (column.name, column.key, column.type.dialect_impl(dialect).bind_processor(dialect))
+                for column in table.columns
+            ]
+        return processors
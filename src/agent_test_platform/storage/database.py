@@ -1,11 +1,17 @@
 
+import asyncio
+import uuid
+from datetime import datetime
 from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import inspect, text
+from sqlalchemy import inspect, text, update
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError
 from agent_test_platform.config.settings import settings
 from agent_test_platform.config.logger import logger
 from agent_test_platform.models.base import Base
+from agent_test_platform.storage.bulk_insert import BulkInserter
 
 
 def _load_all_models() -> None:
@@ -25,6 +31,255 @@ def _load_all_models() -> None:
         importlib.import_module(module_name)
 
 
+# 旧库中可能缺失、需要在启动时补齐的列：(表名, 列名, 列类型)
+_ADDED_COLUMNS = [
+    ("scenarios", "status", "VARCHAR(20)"),
+    ("node_executions", "timing", "JSON"),
+    ("test_step", "timing", "JSON"),
+    ("dialog_turns", "timing", "JSON"),
+    ("test_runs", "config", "JSON"),
+    ("test_summaries", "endpoint_stats", "JSON"),
+]
+
+# PostgreSQL 原生枚举类型中后续版本新增的取值：(类型名, 取值)；SQLEnum 按成员名存储
+_ADDED_ENUM_VALUES = [
+    ("runstatus", "PAUSED"),
+    ("runstatus", "CANCELLED"),
+    ("testrunstatus", "PAUSED"),
+]
+
+
+class WriteBehindBuffer:
+    """执行记录的 write-behind 缓冲
+
+    各虚拟用户把 insert / update 放入缓冲后立即返回，后台任务按数量或时间阈值
+    把缓冲整批写入：同一批次在一个事务内，按表分组用 executemany 写入
+    （PostgreSQL 下执行明细表走 COPY，见 BulkInserter）。缓冲持有 ORM 对象引用，落库时才序列化：
+    - 尚未落库的对象再次 update 不产生额外语句（insert 时带上最新状态）
+    - 已落库对象的多次 update 合并为一次
+    待写入数量超过 max_pending 时写入方等待（背压）；close() 保证最终刷盘。
+    整批因数据错误写入失败时对半拆分重试，直到定位出写不进去的单行，只丢弃这些行；
+    数据库不可用时不拆分，整批丢弃。丢弃的行按所属运行计数（take_failed），供运行结果上报。
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_pending: int = 20000,
+        inserter: Optional[BulkInserter] = None,
+    ):
+        self.session_factory = session_factory
+        self.inserter = inserter or BulkInserter()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        # (模型类, 主键) -> 对象；dict 保留写入顺序
+        self._inserts: Dict[Tuple[type, str], Any] = {}
+        self._updates: Dict[Tuple[type, str], Any] = {}
+        # (模型类, 主键) -> 所属运行 ID，用于按运行统计丢弃的行
+        self._owners: Dict[Tuple[type, str], str] = {}
+
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+        # 统计
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.batches = 0
+        self._failed_by_run: Dict[str, int] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self._inserts) + len(self._updates)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def add_insert(self, model, run_id: Optional[str] = None):
+        """登记待插入对象（主键在此处预先生成，便于子记录立即引用）"""
+        if getattr(model, "id", None) is None:
+            model.id = str(uuid.uuid4())
+        key = (type(model), model.id)
+        self._inserts[key] = model
+        self._set_owner(key, model, run_id)
+        await self._after_add()
+        return model
+
+    async def add_update(self, model, run_id: Optional[str] = None):
+        """登记待更新对象"""
+        key = (type(model), model.id)
+        if key not in self._inserts:
+            self._updates[key] = model
+        self._set_owner(key, model, run_id)
+        await self._after_add()
+        return model
+
+    def _set_owner(self, key: Tuple[type, str], model, run_id: Optional[str]):
+        run_id = run_id or getattr(model, "test_run_id", None)
+        if run_id:
+            self._owners[key] = run_id
+
+    def take_failed(self, run_id: str) -> int:
+        """取出并清零某次运行被丢弃的行数"""
+        return self._failed_by_run.pop(run_id, 0)
+
+    async def _after_add(self):
+        if self._closed:
+            await self.flush()
+            return
+        if self.pending >= self.batch_size:
+            self._wakeup.set()
+        while self.pending >= self.max_pending:
+            self._drained.clear()
+            self._wakeup.set()
+            await self._drained.wait()
+
+    async def _flush_loop(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush loop error: {e}")
+
+    async def flush(self):
+        """把当前缓冲全部写入数据库"""
+        async with self._flush_lock:
+            try:
+                while self._inserts or self._updates:
+                    inserts, self._inserts = self._inserts, {}
+                    updates, self._updates = self._updates, {}
+                    await self._write_batch(list(inserts.values()), list(updates.values()))
+            finally:
+                # 即使写入出错也要唤醒因背压等待的写入方
+                self._drained.set()
+
+    async def _write_batch(self, inserts: List[Any], updates: List[Any]):
+        count = len(inserts) + len(updates)
+        try:
+            # 按外键依赖顺序（父表在前）写入；对象在此时才序列化，拿到最新状态
+            table_order = {table: i for i, table in enumerate(Base.metadata.sorted_tables)}
+            insert_rows = self._group_rows(inserts, table_order, for_update=False)
+            update_rows = self._group_rows(updates, table_order, for_update=True)
+
+            # COPY 放在最后：此时事务已由前面的语句开启，COPY 与其同属一个事务；
+            # COPY 表都是叶子表，父记录已在前面写入
+            copy_rows = [item for item in insert_rows if self.inserter.uses_copy(item[0].__table__)]
+            insert_rows = [item for item in insert_rows if not self.inserter.uses_copy(item[0].__table__)]
+
+            async with self.session_factory() as session:
+                async with session.begin():
+                    for model_class, rows in insert_rows:
+                        await self.inserter.insert(session, model_class, rows)
+                    for model_class, rows in update_rows:
+                        await session.execute(update(model_class), rows)
+                    for model_class, rows in copy_rows:
+                        await self.inserter.insert(session, model_class, rows)
+        except Exception as e:
+            if _is_connection_error(e):
+                # 数据库不可用：拆分重试只会成倍放大失败的事务，整批丢弃
+                self._drop([*inserts, *updates])
+                logger.error(f"Write-behind batch failed, database unavailable, {count} rows dropped: {e}")
+                return
+            if count > 1:
+                # 数据错误：对半拆分重试（保持原有顺序，父记录仍先于子记录写入），只丢弃真正写不进去的行
+                logger.warning(f"Write-behind batch of {count} rows failed, retrying in halves: {e}")
+                items = [(model, False) for model in inserts] + [(model, True) for model in updates]
+                mid = count // 2
+                for part in (items[:mid], items[mid:]):
+                    await self._write_batch(
+                        [model for model, is_update in part if not is_update],
+                        [model for model, is_update in part if is_update],
+                    )
+                return
+            model = (inserts or updates)[0]
+            run_id = self._owners.get((type(model), model.id))
+            self._drop([model])
+            logger.error(
+                f"Write-behind row dropped: {e}",
+                table=model.__table__.name,
+                row_id=model.id,
+                run_id=run_id,
+            )
+            return
+        for model in (*inserts, *updates):
+            self._owners.pop((type(model), model.id), None)
+        self.flushed_rows += count
+        self.batches += 1
+
+    def _drop(self, models: List[Any]):
+        """记录被丢弃的行（按所属运行计数）"""
+        self.failed_rows += len(models)
+        for model in models:
+            run_id = self._owners.pop((type(model), model.id), None)
+            if run_id:
+                self._failed_by_run[run_id] = self._failed_by_run.get(run_id, 0) + 1
+
+    @staticmethod
+    def _group_rows(models: List[Any], table_order: Dict[Any, int], for_update: bool):
+        grouped: Dict[type, List[Dict[str, Any]]] = {}
+        now = datetime.utcnow()
+        for model in models:
+            grouped.setdefault(type(model), []).append(_row_of(model, for_update, now))
+        return sorted(grouped.items(), key=lambda item: table_order.get(item[0].__table__, 0))
+
+    async def close(self):
+        """停止后台任务并完成最终刷盘"""
+        self._closed = True
+        if self._task is not None:
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(
+            "Write-behind buffer closed",
+            flushed_rows=self.flushed_rows,
+            failed_rows=self.failed_rows,
+            batches=self.batches,
+        )
+
+
+def _is_connection_error(error: Exception) -> bool:
+    """连接 / 数据库可用性问题（与具体行无关），区别于约束冲突等数据错误"""
+    if isinstance(error, (OperationalError, InterfaceError, DisconnectionError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+def _row_of(model, for_update: bool, now: datetime) -> Dict[str, Any]:
+    """把 ORM 对象转换为批量语句使用的列字典"""
+    mapper = model.__mapper__
+    row = {}
+    for attr in mapper.column_attrs:
+        value = getattr(model, attr.key)
+        if for_update:
+            if attr.key == "created_at":
+                continue
+            if attr.key == "updated_at":
+                value = now
+            row[attr.key] = value
+        elif value is not None:
+            # insert 时省略 None，让列默认值（created_at / status 等）生效
+            row[attr.key] = value
+    return row
+
+
 class Database:
     """数据库操作接口"""
     
@@ -32,8 +287,9 @@ class Database:
         self.engine = None
         self.async_session = None
         self.db_path = Path(settings.DATABASE_PATH)
+        self.write_behind: Optional[WriteBehindBuffer] = None
     
-    async def initialize(self):
+    async def initialize(self, create_schema: bool = True):
         """初始化数据库"""
         
         try:
@@ -59,32 +315,42 @@ class Database:
             # 确保所有模型已被加载到 Base.metadata（否则 create_all 不会创建新表）
             _load_all_models()
 
-            # 创建表
-            async with self.engine.begin() as conn:
-                await conn.run_sync(Base.metadata.create_all)
+            # 创建表（worker 进程连接已初始化的库，跳过建表 / 补列）
+            if create_schema:
+                async with self.engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+
+                    # 兼容旧 schema：补齐后续版本新增的列
+                    def _ensure_schema(sync_conn):
+                        inspector = inspect(sync_conn)
+                        table_names = set(inspector.get_table_names())
+                        dialect = sync_conn.dialect.name
+
+                        for table, column, column_type in _ADDED_COLUMNS:
+                            if table not in table_names:
+                                continue
 
-                # 兼容旧 schema：确保 scenarios.status 存在
-                def _ensure_schema(sync_conn):
-                    inspector = inspect(sync_conn)
-                    if "scenarios" not in inspector.get_table_names():
-                        return
+                            cols = {c["name"] for c in inspector.get_columns(table)}
+                            if column in cols:
+                                continue
 
-                    cols = {c["name"] for c in inspector.get_columns("scenarios")}
-                    if "status" in cols:
-                        return
+                            if dialect == "postgresql":
+                                sync_conn.execute(
+                                    text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}")
+                                )
+                            else:
+                                # SQLite/MySQL 等不一定支持 IF NOT EXISTS（SQLite 不支持），先检查再加
+                                sync_conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
 
-                    dialect = sync_conn.dialect.name
-                    if dialect == "postgresql":
-                        sync_conn.execute(
-                            text("ALTER TABLE scenarios ADD COLUMN IF NOT EXISTS status VARCHAR(20)")
-                        )
-                    else:
-                        # SQLite/MySQL 等不一定支持 IF NOT EXISTS（SQLite 不支持），先检查再加
-                        sync_conn.execute(text("ALTER TABLE scenarios ADD COLUMN status VARCHAR(20)"))
+                            logger.info(f"Added missing column: {table}.{column}")
 
-                    logger.info("Added missing column: scenarios.status")
+                        if dialect == "postgresql":
+                            enum_types = {e["name"] for e in inspector.get_enums()}
+                            for enum_type, value in _ADDED_ENUM_VALUES:
+                                if enum_type in enum_types:
+                                    sync_conn.execute(text(f"ALTER TYPE {enum_type} ADD VALUE IF NOT EXISTS '{value}'"))
 
-                await conn.run_sync(_ensure_schema)
+                    await conn.run_sync(_ensure_schema)
             
             # 会话工厂
             self.async_session = sessionmaker(
@@ -93,6 +359,19 @@ class Database:
                 expire_on_commit=False,
             )
 
+            if settings.WRITE_BEHIND_ENABLED:
+                use_copy = settings.BULK_COPY_ENABLED and self.engine.dialect.driver == "asyncpg"
+                if use_copy:
+                    logger.info("Bulk ingest via PostgreSQL COPY enabled")
+                self.write_behind = WriteBehindBuffer(
+                    self.async_session,
+                    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+                    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+                    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+                    inserter=BulkInserter(use_copy=use_copy),
+                )
+                self.write_behind.start()
+
             logger.info("Database initialized")
         
         except Exception as e:
@@ -107,6 +386,39 @@ class Database:
             await session.refresh(model)
             return model
     
+    async def create_deferred(self, model, run_id: Optional[str] = None):
+        """创建记录（write-behind：批量延迟写入，主键立即可用）
+
+        run_id 为记录所属运行（默认取 model.test_run_id），用于统计写入失败被丢弃的行。
+        """
+        if self.write_behind is None:
+            return await self.create(model)
+        return await self.write_behind.add_insert(model, run_id)
+
+    async def update_deferred(self, model, run_id: Optional[str] = None):
+        """更新记录（write-behind：批量延迟写入，多次更新会合并）"""
+        if self.write_behind is None:
+            return await self.update(model)
+        return await self.write_behind.add_update(model, run_id)
+
+    async def flush(self):
+        """等待 write-behind 缓冲全部落库（在读取执行记录前调用）"""
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+    def take_failed_rows(self, run_id: str) -> int:
+        """取出某次运行在 write-behind 中写入失败、被丢弃的行数（不会刷盘，调用前应先 flush）"""
+        if self.write_behind is None:
+            return 0
+        return self.write_behind.take_failed(run_id)
+
+    async def create_many(self, models: List[Any]):
+        """在一个事务内创建多条记录"""
+        async with self.async_session() as session:
+            session.add_all(models)
+            await session.commit()
+        return models
+
     async def update(self, model):
         """更新记录"""
         async with self.async_session() as session:
@@ -171,8 +483,33 @@ class Database:
             result = await session.execute(stmt)
             return result.scalars().all()
     
+    async def query_metric_points(
+        self,
+        run_id: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        node_id: Optional[str] = None,
+    ):
+        """查询运行的按秒指标（[start, end] 闭区间，按时间排序）"""
+        from sqlalchemy import select
+        from agent_test_platform.models.node_based import RunMetricPoint
+
+        async with self.async_session() as session:
+            stmt = select(RunMetricPoint).where(RunMetricPoint.test_run_id == run_id)
+            if start is not None:
+                stmt = stmt.where(RunMetricPoint.ts >= start)
+            if end is not None:
+                stmt = stmt.where(RunMetricPoint.ts <= end)
+            if node_id is not None:
+                stmt = stmt.where(RunMetricPoint.node_id == node_id)
+            result = await session.execute(stmt.order_by(RunMetricPoint.ts))
+            return result.scalars().all()
+    
     async def close(self):
         """关闭数据库连接"""
+        if self.write_behind is not None:
+            await self.write_behind.close()
+            self.write_behind = None
         if self.engine:
             await self.engine.dispose()
 
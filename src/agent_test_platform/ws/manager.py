@@ -1,53 +1,304 @@
-
+import asyncio
 import json
-import datetime
-from typing import Dict, Set
+from collections import deque, OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Deque, Union, List, Optional, Callable, Awaitable
 from fastapi import WebSocket
 from agent_test_platform.config.logger import logger
+from agent_test_platform.config.settings import settings
+
+
+# 只需最新值的事件：队列中已有同类型事件时直接替换（进度 / 状态快照）
+CONFLATED_EVENT_TYPES = frozenset({"progress", "run_progress"})
+# 中间过程事件：发送队列满时直接丢弃（节点 / 用户事件及其合并帧）
+DROPPABLE_EVENT_TYPES = frozenset({
+    "run_events",
+    "node_started", "node_completed", "node_failed",
+    "user_started", "user_completed",
+})
+# 关闭过慢连接时等待 close 握手的上限（秒）
+SLOW_CLOSE_TIMEOUT_SECONDS = 1.0
+
+
+class RunEventLog:
+    """一个运行推送过的事件序号与最近事件（环形缓冲），供中途连接 / 断线重连的客户端补齐
+
+    每个事件带上运行内递增的 seq；可合并事件（进度）只保留最新一条，不占缓冲。
+    """
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max(1, size))
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        # 已被挤出缓冲的最大序号：since 小于它时无法完整补发
+        self.evicted_seq = 0
+
+    def append(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.seq += 1
+        event = {**event, "seq": self.seq}
+        event_type = event.get("type")
+        if event_type in CONFLATED_EVENT_TYPES:
+            self.latest[event_type] = event
+        else:
+            if len(self.events) == self.events.maxlen:
+                self.evicted_seq = self.events[0]["seq"]
+            self.events.append(event)
+        return event
+
+    def covers(self, since: int) -> bool:
+        """since 之后的事件是否都还在缓冲中（可合并事件只补最新值）"""
+        return self.evicted_seq <= since <= self.seq
+
+    def since(self, since: int) -> List[Dict[str, Any]]:
+        events = [event for event in self.events if event["seq"] > since]
+        events.extend(event for event in self.latest.values() if event["seq"] > since)
+        events.sort(key=lambda event: event["seq"])
+        return events
+
+
+class WSSubscriber:
+    """一条 WebSocket 连接的发送端：有界发送队列 + 独立的写任务
+
+    broadcast 只入队、从不等待网络发送，慢连接只会积压 / 丢弃自己的事件。
+    队列满时：可合并事件替换队列中的旧值，可丢弃事件直接丢弃，
+    其余（运行状态变化等）事件挤掉最旧的可丢弃事件；仍无空间说明客户端过慢，由管理器断开。
+    """
+
+    def __init__(self, websocket: WebSocket, run_id: str, max_queue: int):
+        self.websocket = websocket
+        self.run_id = run_id
+        self.max_queue = max(1, max_queue)
+        # 元素为事件，或可合并事件的类型（其最新值在 _latest 中）
+        self.queue: Deque[Union[Dict[str, Any], str]] = deque()
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.closed = False
+        self.connected_at = datetime.now().isoformat()
+        self.task = asyncio.create_task(self._writer())
+
+    def prime(self, events: List[Dict[str, Any]]):
+        """连接建立时的快照 / 补发事件：排在实时事件之前，不受队列上限约束（数量受回放缓冲限制）"""
+        self.queue.extend(events)
+        self._ready.set()
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """事件入队；返回 False 表示客户端过慢、应断开"""
+        if self.closed:
+            return True
+        event_type = event.get("type")
+        if event_type in CONFLATED_EVENT_TYPES:
+            if event_type in self._latest:
+                self._latest[event_type] = event
+                self.conflated += 1
+                return True
+            if not self._make_room(event_type):
+                return False
+            self._latest[event_type] = event
+            self.queue.append(event_type)
+        else:
+            if not self._make_room(event_type):
+                return event_type in DROPPABLE_EVENT_TYPES
+            self.queue.append(event)
+        self._ready.set()
+        return True
+
+    def _make_room(self, event_type: str) -> bool:
+        if len(self.queue) < self.max_queue:
+            return True
+        if event_type in DROPPABLE_EVENT_TYPES:
+            self.dropped += 1
+            return False
+        for i, pending in enumerate(self.queue):
+            if not isinstance(pending, str) and pending.get("type") in DROPPABLE_EVENT_TYPES:
+                del self.queue[i]
+                self.dropped += 1
+                return True
+        return False
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self.queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                item = self.queue.popleft()
+                event = self._latest.pop(item) if isinstance(item, str) else item
+                await self.websocket.send_json(event)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to send WebSocket message: {e}", run_id=self.run_id)
+        finally:
+            self.closed = True
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed = True
+        self.task.cancel()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=SLOW_CLOSE_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runId": self.run_id,
+            "connectedAt": self.connected_at,
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+        }
 
 
 class WSConnectionManager:
-    """WebSocket 连接管理器（前端适配版）"""
+    """WebSocket 连接管理器（前端适配版）
+
+    每个连接一个 WSSubscriber（有界发送队列 + 写任务），广播不会被慢连接阻塞，
+    也就不会通过事件回传链路拖慢执行器。
+    每个运行的事件带序号并保留最近 WS_REPLAY_BUFFER_SIZE 条：新连接先收到 run_snapshot
+    （当前状态 + 最近事件），带 since 重连且缓冲覆盖时只补发 since 之后的事件。
+    """
     
-    def __init__(self):
-        # runId -> set of websockets
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+    def __init__(self, max_queue: int = None, replay_size: int = None, replay_runs: int = None):
+        # runId -> {websocket: subscriber}
+        self.active_connections: Dict[str, Dict[WebSocket, WSSubscriber]] = {}
+        self.max_queue = max_queue or settings.WS_SEND_QUEUE_SIZE
+        # runId -> 事件缓冲，按最近推送排序，超出 replay_runs 时淘汰最久的
+        self.logs: "OrderedDict[str, RunEventLog]" = OrderedDict()
+        self.replay_size = replay_size or settings.WS_REPLAY_BUFFER_SIZE
+        self.replay_runs = replay_runs or settings.WS_REPLAY_MAX_RUNS
+        self.snapshots = 0
+        self.resumes = 0
+        # 已断开连接的累计计数
+        self.totals = {"sent": 0, "dropped": 0, "conflated": 0}
+        self.slow_disconnects = 0
     
-    async def connect(self, websocket: WebSocket, run_id: str):
-        """连接 WebSocket"""
+    def _log(self, run_id: str) -> RunEventLog:
+        log = self.logs.get(run_id)
+        if log is None:
+            log = self.logs[run_id] = RunEventLog(self.replay_size)
+            while len(self.logs) > self.replay_runs:
+                self.logs.popitem(last=False)
+        else:
+            self.logs.move_to_end(run_id)
+        return log
+    
+    async def connect(
+        self,
+        websocket: WebSocket,
+        run_id: str,
+        since: Optional[int] = None,
+        snapshot: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None,
+    ):
+        """
+        连接 WebSocket
+        
+        Args:
+            since: 重连客户端最后收到的 seq；缓冲仍覆盖时只补发之后的事件，否则退回快照
+            snapshot: 生成运行当前状态的协程函数，放入 run_snapshot 帧
+        """
         await websocket.accept()
         
+        log = self._log(run_id)
+        resume = since is not None and log.covers(since)
+        state = None
+        if snapshot is not None and not resume:
+            try:
+                state = await snapshot()
+            except Exception as e:
+                logger.warning(f"Failed to build run snapshot: {e}", run_id=run_id)
+        
+        # 以下不再 await：补发内容与之后广播的实时事件按 seq 衔接，不丢不重
+        subscriber = WSSubscriber(websocket, run_id, self.max_queue)
+        if resume:
+            subscriber.prime(log.since(since))
+            self.resumes += 1
+        else:
+            subscriber.prime([{
+                "type": "run_snapshot",
+                "runId": run_id,
+                "timestamp": datetime.now().isoformat(),
+                "seq": log.seq,
+                "data": {
+                    **(state or {}),
+                    # 请求了 since 但缓冲已不覆盖（或服务已重启）
+                    "gap": since is not None,
+                    "recentEvents": log.since(0),
+                },
+            }])
+            self.snapshots += 1
+        
         if run_id not in self.active_connections:
-            self.active_connections[run_id] = set()
+            self.active_connections[run_id] = {}
         
-        self.active_connections[run_id].add(websocket)
+        self.active_connections[run_id][websocket] = subscriber
         
-        logger.info("WebSocket connected", run_id=run_id)
+        logger.info("WebSocket connected", run_id=run_id, since=since, resumed=resume)
     
-    def disconnect(self, run_id: str):
-        """断开连接"""
-        if run_id in self.active_connections:
-            self.active_connections[run_id].clear()
+    def disconnect(self, run_id: str, websocket: WebSocket):
+        """断开一条连接（同一运行的其他连接不受影响）"""
+        connections = self.active_connections.get(run_id)
+        subscriber = connections.pop(websocket, None) if connections is not None else None
+        if subscriber is None:
+            return
+        if not connections:
             del self.active_connections[run_id]
+        subscriber.closed = True
+        subscriber.task.cancel()
+        self._account(subscriber)
         
         logger.info("WebSocket disconnected", run_id=run_id)
     
+    def _account(self, subscriber: WSSubscriber):
+        self.totals["sent"] += subscriber.sent
+        self.totals["dropped"] += subscriber.dropped
+        self.totals["conflated"] += subscriber.conflated
+    
     async def broadcast(self, run_id: str, event: dict):
-        """广播事件"""
-        if run_id not in self.active_connections:
+        """广播事件：编号并记入回放缓冲，再放入各连接的发送队列，不等待发送"""
+        event = self._log(run_id).append(event)
+        connections = self.active_connections.get(run_id)
+        if not connections:
             return
         
-        dead_connections = set()
-        
-        for websocket in self.active_connections[run_id]:
-            try:
-                await websocket.send_json(event)
-            except Exception as e:
-                logger.warning(f"Failed to send WebSocket message: {e}")
-                dead_connections.add(websocket)
-        
-        for conn in dead_connections:
-            self.active_connections[run_id].discard(conn)
+        for websocket, subscriber in list(connections.items()):
+            if subscriber.closed:
+                # 写任务已因发送失败退出
+                self.disconnect(run_id, websocket)
+            elif not subscriber.offer(event):
+                logger.warning("Closing slow WebSocket consumer", run_id=run_id, queued=len(subscriber.queue))
+                self.slow_disconnects += 1
+                self.disconnect(run_id, websocket)
+                asyncio.create_task(subscriber.close(code=1008, reason="Client too slow"))
+    
+    def stats(self) -> Dict[str, Any]:
+        """发送队列与丢弃统计（含已断开连接的累计值）"""
+        subscribers = [
+            subscriber.stats()
+            for connections in self.active_connections.values()
+            for subscriber in connections.values()
+        ]
+        return {
+            "runs": len(self.active_connections),
+            "connections": len(subscribers),
+            "queueSize": self.max_queue,
+            "queued": sum(item["queued"] for item in subscribers),
+            "sent": self.totals["sent"] + sum(item["sent"] for item in subscribers),
+            "dropped": self.totals["dropped"] + sum(item["dropped"] for item in subscribers),
+            "conflated": self.totals["conflated"] + sum(item["conflated"] for item in subscribers),
+            "slowDisconnects": self.slow_disconnects,
+            "replay": {
+                "runs": len(self.logs),
+                "bufferSize": self.replay_size,
+                "snapshots": self.snapshots,
+                "resumes": self.resumes,
+            },
+            "subscribers": subscribers,
+        }
     
     # ============================================================
     # 前端事件推送方法（与 WSEvent 对应）
@@ -80,6 +331,19 @@ class WSConnectionManager:
         }
         await self.broadcast(run_id, event)
     
+    async def send_run_status(self, run_id: str, status: str, data: Dict = None):
+        """推送运行状态变化（paused / running / cancelled）"""
+        event = {
+            "type": f"run_{status}",
+            "runId": run_id,
+            "timestamp": datetime.now().isoformat(),
+            "data": {
+                "status": status,
+                **(data or {}),
+            },
+        }
+        await self.broadcast(run_id, event)
+    
     async def send_user_started(self, run_id: str, user_id: str, user_name: str):
         """推送用户启动事件"""
         event = {
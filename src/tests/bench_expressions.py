@@ -0,0 +1,51 @@
+"""条件表达式求值微基准：旧实现（每次 eval 源码字符串）对比预编译 Expression
+
+用法（在 src 目录下）：
+    python -m tests.bench_expressions [--iterations 50000]
+"""
+import argparse
+import timeit
+
+from agent_test_platform.core.expressions import Expression
+
+
+CONDITIONS = {
+    "simple": "context['task_id'] == 't-1'",
+    "compound": "context.get('task_id') is not None and context.get('status') in ('created', 'done') and len(context['items']) > 2",
+}
+
+
+def legacy_evaluate(condition, user_context):
+    """改造前 node_executor._evaluate_condition 的实现，作为对照"""
+    context = {
+        'context': user_context,
+        'True': True,
+        'False': False,
+        'None': None,
+    }
+    return bool(eval(condition, {"__builtins__": {"len": len}}, context))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50000)
+    args = parser.parse_args()
+
+    user_context = {"task_id": "t-1", "status": "created", "items": [1, 2, 3], "session_id": "user-001"}
+    variables = {"context": user_context}
+
+    for name, condition in CONDITIONS.items():
+        compiled = Expression.compile(condition, ("context",))
+        assert compiled.test(variables) == legacy_evaluate(condition, user_context)
+
+        legacy = timeit.timeit(lambda: legacy_evaluate(condition, user_context), number=args.iterations)
+        fast = timeit.timeit(lambda: compiled.test(variables), number=args.iterations)
+        print(
+            f"{name:>8}: legacy {legacy / args.iterations * 1e6:8.2f} us/op"
+            f" | compiled {fast / args.iterations * 1e6:6.2f} us/op"
+            f" | speedup x{legacy / fast:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""请求体模板渲染微基准：旧实现（deepcopy + 每次 re.sub）对比预编译 PayloadTemplate
+
+用法（在 src 目录下）：
+    python -m tests.bench_payload_templates [--iterations 20000]
+"""
+import argparse
+import copy
+import re
+import timeit
+
+from agent_test_platform.core.templates import PayloadTemplate
+
+
+def legacy_build_payload(template, user_context):
+    """改造前 executor._build_payload 的实现，作为对照"""
+    payload = copy.deepcopy(template)
+
+    def replace_context(obj):
+        if isinstance(obj, str):
+            pattern = r'\{(?:context\.)?(\w+)\}'
+
+            def replacer(match):
+                key = match.group(1)
+                return str(user_context.get(key, ''))
+            return re.sub(pattern, replacer, obj)
+        elif isinstance(obj, dict):
+            return {k: replace_context(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [replace_context(item) for item in obj]
+        return obj
+
+    return replace_context(payload)
+
+
+def make_templates():
+    small = {
+        "message": "hi {session_id}",
+        "task_id": "{task_id}",
+        "options": {"stream": False, "lang": "zh"},
+    }
+    large = {
+        "session_id": "{context.session_id}",
+        "task_id": "{task_id}",
+        "messages": [
+            {"role": "system", "content": "你是一个测试助手。" * 200},
+            *[
+                {"role": "user" if i % 2 else "assistant", "content": f"第 {i} 轮上下文：" + "示例文本 " * 50}
+                for i in range(20)
+            ],
+            {"role": "user", "content": "用户 {session_id} 的问题：请继续处理任务 {task_id}"},
+        ],
+        "tools": [{"name": f"tool_{i}", "parameters": {"type": "object", "properties": {}}} for i in range(10)],
+        "metadata": {"client": "agent-test-platform", "trace": "{session_id}-{task_id}"},
+    }
+    return {"small": small, "large": large}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    context = {"session_id": "user-001", "task_id": 12345, "token": None}
+
+    for name, template in make_templates().items():
+        compiled = PayloadTemplate.compile(template)
+
+        # 渲染结果一致（整串占位符按原类型替换，旧实现会转成字符串）
+        expected = legacy_build_payload(template, context)
+        expected["task_id"] = context["task_id"]
+        assert compiled.render(context) == expected
+
+        legacy = timeit.timeit(lambda: legacy_build_payload(template, context), number=args.iterations)
+        fast = timeit.timeit(lambda: compiled.render(context), number=args.iterations)
+        print(
+            f"{name:>5}: legacy {legacy / args.iterations * 1e6:9.2f} us/op"
+            f" | compiled {fast / args.iterations * 1e6:8.2f} us/op"
+            f" | speedup x{legacy / fast:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
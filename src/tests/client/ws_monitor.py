@@ -1,8 +1,15 @@
 # tests/client/ws_monitor.py
 import asyncio
 import json
+import threading
 import time
+from collections import OrderedDict
 import websockets
+from websockets.sync.client import connect as ws_connect
+
+# 任务终态（小写比较）
+SUCCESS_STATUSES = {"done", "completed", "complete", "success", "succeeded", "finished"}
+TERMINAL_STATUSES = SUCCESS_STATUSES | {"failed", "error", "cancelled", "canceled", "terminated"}
 
 
 class WebSocketTaskMonitor:
@@ -71,17 +78,7 @@ class WebSocketTaskMonitor:
     def _is_terminal_status(status: str | None) -> bool:
         if not status:
             return False
-        return str(status).lower() in {
-            "done",
-            "completed",
-            "complete",
-            "success",
-            "succeeded",
-            "failed",
-            "error",
-            "cancelled",
-            "canceled",
-        }
+        return str(status).lower() in TERMINAL_STATUSES
 
     @staticmethod
     def _looks_like_log_message(msg: dict) -> bool:
@@ -206,3 +203,137 @@ class WebSocketTaskMonitor:
     async def run(self):
         await self.listen_user_status()
 
+
+class TaskCompletionHub:
+    """
+    共享的任务完成通知订阅（同步实现，供 locust 虚拟用户使用）
+
+    一个进程只保持一条用户状态 WebSocket 连接，后台线程（locust 下为 greenlet）收到
+    终态消息后唤醒等待该任务的虚拟用户；断线期间 connected 为 False，调用方应回退为轮询，
+    重连后 generation 递增，调用方可据此补查一次断线期间可能错过的终态。
+    """
+
+    def __init__(self, user_ws_url: str, token: str | None = None, *, reconnect_delay: float = 1.0, max_results: int = 10000):
+        self.user_ws_url = user_ws_url
+        self.token = token
+        self.reconnect_delay = reconnect_delay
+        self.max_results = max_results
+
+        self.connected = threading.Event()
+        self.generation = 0
+        self.running = False
+
+        self._lock = threading.Lock()
+        self._events: dict[str, threading.Event] = {}
+        # task_id -> (status, ts, msg)；未被等待的任务也保留最近的终态，避免通知先于 watch 到达
+        self._results: "OrderedDict[str, tuple]" = OrderedDict()
+        self._running_ts: "OrderedDict[str, float]" = OrderedDict()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.running = True
+            self._thread = threading.Thread(target=self._run, name="task-completion-ws", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self.connected.clear()
+
+    @staticmethod
+    def is_success(status) -> bool:
+        return str(status or "").lower() in SUCCESS_STATUSES
+
+    def watch(self, task_id: str):
+        """登记需要等待的任务（提交成功后立即调用）"""
+        with self._lock:
+            self._events.setdefault(task_id, threading.Event())
+            if task_id in self._results:
+                self._events[task_id].set()
+
+    def running_ts(self, task_id: str) -> float | None:
+        with self._lock:
+            return self._running_ts.get(task_id)
+
+    def wait(self, task_id: str, timeout: float):
+        """等待任务终态；返回 (status, ts, msg, running_ts)，超时返回 None
+
+        running_ts 为收到 RUNNING 推送的时间（未收到时为 None），需在 pop 之前读出，
+        pop 会一并清理该任务的记录。
+        """
+        self.watch(task_id)
+        event = self._events[task_id]
+        if not event.wait(timeout):
+            return None
+        with self._lock:
+            running_ts = self._running_ts.get(task_id)
+        result = self.pop(task_id)
+        if result is None:
+            return None
+        status, ts, msg = result
+        return status, ts, msg, running_ts
+
+    def pop(self, task_id: str):
+        with self._lock:
+            self._events.pop(task_id, None)
+            self._running_ts.pop(task_id, None)
+            return self._results.pop(task_id, None)
+
+    def _ws_headers(self):
+        if not self.token:
+            return None
+        return [("Authorization", f"Bearer {self.token}")]
+
+    def _run(self):
+        while self.running:
+            try:
+                with ws_connect(self.user_ws_url, additional_headers=self._ws_headers()) as ws:
+                    self.generation += 1
+                    self.connected.set()
+                    for raw in ws:
+                        if not self.running:
+                            break
+                        try:
+                            msg = json.loads(raw)
+                        except (TypeError, ValueError):
+                            continue
+                        if isinstance(msg, dict):
+                            self._handle(msg)
+            except Exception:
+                pass
+            finally:
+                self.connected.clear()
+            if self.running:
+                time.sleep(self.reconnect_delay)
+
+    def _handle(self, msg: dict):
+        if not (msg.get("event") == "task_status" or msg.get("type") == "task_status"
+                or WebSocketTaskMonitor._looks_like_status_message(msg)):
+            return
+        task_id = msg.get("task_id")
+        if task_id is None:
+            return
+        task_id = str(task_id)
+        status = msg.get("status")
+        now = time.time()
+
+        if not WebSocketTaskMonitor._is_terminal_status(status):
+            if str(status or "").lower() == "running":
+                with self._lock:
+                    if task_id not in self._running_ts:
+                        self._running_ts[task_id] = now
+                        self._trim(self._running_ts)
+            return
+
+        with self._lock:
+            self._results[task_id] = (status, now, msg)
+            self._trim(self._results)
+            event = self._events.get(task_id)
+        if event is not None:
+            event.set()
+
+    def _trim(self, entries: OrderedDict):
+        while len(entries) > self.max_results:
+            entries.popitem(last=False)
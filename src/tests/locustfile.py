@@ -11,9 +11,27 @@ import threading
 import time
 import uuid
 
+from config import AUTH_TOKEN, TASK_STATUS_WS_URL
+from client.ws_monitor import TaskCompletionHub
+
 POLL_INTERVAL = 5
 TASK_TIMEOUT = 3600
 
+_completion_hub: TaskCompletionHub | None = None
+_completion_hub_lock = threading.Lock()
+
+
+def _get_completion_hub() -> TaskCompletionHub | None:
+    """进程内共享一条状态推送连接（未配置 TASK_STATUS_WS_URL 时返回 None，走轮询）"""
+    global _completion_hub
+    if not TASK_STATUS_WS_URL:
+        return None
+    with _completion_hub_lock:
+        if _completion_hub is None:
+            _completion_hub = TaskCompletionHub(TASK_STATUS_WS_URL, AUTH_TOKEN)
+            _completion_hub.start()
+    return _completion_hub
+
 TASK_PIPELINE = [
     {
         "submit_path": "/v2/rd/run-sop-driven-design",
@@ -241,40 +259,65 @@ class BaseAsyncTaskUser(HttpUser):
 
             print(f"[{submit_tag}_SUBMITTED] {task_id} {submit_ts}", flush=True)
 
-            # ---------- 轮询状态 ----------
+            # ---------- 等待完成 ----------
+            # 优先等待共享 WebSocket 推送的终态；连接断开时回退为轮询，
+            # 重连后补查一次状态，避免断线期间错过的终态要等到超时
+            hub = _get_completion_hub()
+            if hub is not None:
+                hub.watch(task_id)
+            seen_generation = hub.generation if hub is not None else 0
             start_ts = None
 
             last_data = None
 
             while time.time() - submit_ts < TASK_TIMEOUT:
-                time.sleep(POLL_INTERVAL)
-
-                with self.client.get(
-                    status_path_template.format(task_id=task_id),
-                    name=poll_name,
-                    catch_response=True,
-                ) as r:
-                    if r.status_code != 200:
-                        continue
-
-                    data = r.json().get("data", {})
-                    status = data.get("status")
-                    last_data = data
-
-                    if status == "RUNNING" and not start_ts:
-                        start_ts = time.time()
-                        print(f"[{submit_tag}_RUNNING] {task_id} {start_ts}", flush=True)
-
-                    if status in ("FINISHED", "FAILED"):
-                        end_ts = time.time()
-                        success = status == "FINISHED"
-                        self._active_task_done = True
-                        self._emit_json("TASK_FINAL", task_id, data)
-                        print(f"[{submit_tag}_DONE] {task_id} {end_ts} {success}", flush=True)
-
-                        return task_id
+                if hub is not None and hub.connected.is_set():
+                    if hub.generation == seen_generation:
+                        remaining = TASK_TIMEOUT - (time.time() - submit_ts)
+                        pushed = hub.wait(task_id, min(remaining, POLL_INTERVAL * 12))
+                        if pushed is not None:
+                            status, end_ts, msg, running_ts = pushed
+                            if running_ts and not start_ts:
+                                start_ts = running_ts
+                                print(f"[{submit_tag}_RUNNING] {task_id} {start_ts}", flush=True)
+                            success = hub.is_success(status)
+                            self._active_task_done = True
+                            # 推送消息与状态接口的 data 结构不同，补查一次状态，
+                            # 保证 TASK_FINAL 与轮询路径一致（报告依赖其中的 result）
+                            final = self._poll_status(status_path_template, task_id, poll_name)
+                            self._emit_json("TASK_FINAL", task_id, final if final is not None else msg)
+                            print(f"[{submit_tag}_DONE] {task_id} {end_ts} {success}", flush=True)
+                            return task_id
+                        if hub.connected.is_set() and hub.generation == seen_generation:
+                            continue
+                    seen_generation = hub.generation
+                else:
+                    time.sleep(POLL_INTERVAL)
+
+                data = self._poll_status(status_path_template, task_id, poll_name)
+                if data is None:
+                    continue
+                status = data.get("status")
+                last_data = data
+
+                if status == "RUNNING" and not start_ts:
+                    start_ts = time.time()
+                    print(f"[{submit_tag}_RUNNING] {task_id} {start_ts}", flush=True)
+
+                if status in ("FINISHED", "FAILED"):
+                    end_ts = time.time()
+                    success = status == "FINISHED"
+                    self._active_task_done = True
+                    if hub is not None:
+                        hub.pop(task_id)
+                    self._emit_json("TASK_FINAL", task_id, data)
+                    print(f"[{submit_tag}_DONE] {task_id} {end_ts} {success}", flush=True)
+
+                    return task_id
 
             # ---------- 超时 ----------
+            if hub is not None:
+                hub.pop(task_id)
             if task_id:
                 self._terminate_task(task_id)
             print(f"[{submit_tag}_TIMEOUT] {task_id}", flush=True)
@@ -295,6 +338,16 @@ class BaseAsyncTaskUser(HttpUser):
 
         return None
 
+    def _poll_status(self, status_path_template: str, task_id: str, poll_name: str) -> dict | None:
+        with self.client.get(
+            status_path_template.format(task_id=task_id),
+            name=poll_name,
+            catch_response=True,
+        ) as r:
+            if r.status_code != 200:
+                return None
+            return r.json().get("data", {})
+
     def _emit_json(self, tag: str, task_id: str, obj):
         try:
             raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")